@@ -2,6 +2,9 @@
 Example testbench for use with pytest
 """
 
+import concurrent.futures
+import io
+import os
 import random
 import shutil
 import tempfile
@@ -12,6 +15,8 @@ import vpw
 import vpw.axim
 import vpw.axim2ram
 import vpw.axis
+import vpw.bench
+import vpw.regress
 
 
 @pytest.fixture(scope="module")
@@ -21,7 +26,8 @@ def design():
     dut = vpw.create(package='example_pytest',
                      module='example',
                      clock='clk',
-                     workspace=workspace)
+                     workspace=workspace,
+                     savable=True)
     yield dut
 
     shutil.rmtree(workspace)
@@ -48,6 +54,141 @@ def context(design):
     vpw.finish()
 
 
+def test_port_table(design):
+    """Test the port table and the port handles of the DUT."""
+    table = design.ports()
+
+    assert ("up_axis_tdata", 64, "input") in table, "port table missing input"
+    assert ("axim_rdata", 128, "output") in table, "port table missing output"
+    assert "clk" not in [name for name, _, _ in table], "clock in port table"
+
+    for handle, (name, _, _) in enumerate(table):
+        assert design.port_id(name) == handle, "port handle not table index"
+
+    assert design.port_id("not_a_port") == -1, "unknown port has a handle"
+
+
+def test_build_cache(tmp_path, monkeypatch):
+    """Test that creating an unchanged design loads the cached build."""
+    monkeypatch.setattr(vpw.cache, "directory", str(tmp_path / "cache"))
+
+    def create():
+        workspace = tempfile.mkdtemp()
+        dut = vpw.create(package='example_cached',
+                         module='example',
+                         clock='clk',
+                         workspace=workspace)
+        shutil.rmtree(workspace)
+        return dut
+
+    built = create()
+    assert built.__file__.startswith(vpw.cache.directory), "build not cached"
+    assert create().__file__ == built.__file__, "unchanged design was rebuilt"
+
+
+def test_build_runtime(tmp_path, monkeypatch):
+    """Test that designs built with the same flags link one cached Verilator runtime."""
+    monkeypatch.setattr(vpw.cache, "directory", str(tmp_path / "cache"))
+    options = dict(module='example', clock='clk', jobs=2, ccache=True, opt_fast='-O1', opt_global='-O2')
+
+    with pytest.raises(AssertionError):
+        vpw.create(package='example_hier', workspace=str(tmp_path), build=True, hierarchical=True, **options)
+
+    # verilator builds the first design and its runtime, which is cached
+    built = vpw.create(package='example_built', workspace=str(tmp_path), build=True, **options)
+    runtimes = [root for root, _, files in os.walk(vpw.cache.directory) if "libverilated.a" in files]
+    assert len(runtimes) == 1, "runtime not cached"
+
+    # a variant of the design links the cached runtime rather than compiling its own
+    variant = vpw.create(package='example_variant', workspace=str(tmp_path),
+                         define={'VARIANT': None}, **options)
+    assert not os.path.exists(tmp_path / "example_variant" / "libverilated.a"), "runtime compiled again"
+    assert [root for root, _, files in os.walk(vpw.cache.directory) if "libverilated.a" in files] == runtimes, \
+        "runtime cached again"
+
+    for dut in (built, variant):
+        sim = vpw.Simulator(dut, trace=False)
+        sim.prep("rst", [1])
+        sim.tick()
+        assert sim.cycles == 1, "package built against the cached runtime does not run"
+        sim.finish()
+
+
+def test_cache_key(tmp_path):
+    """Test that the build cache key covers the sources given to verilator."""
+    for name in ("a", "b"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "example.sv").write_text("module example; endmodule\n")
+
+    digest = vpw.cache.key([], "parts", sources=[str(tmp_path / "a" / "example.sv")])
+    assert vpw.cache.key([], "parts", sources=[str(tmp_path / "b" / "example.sv")]) != digest, \
+        "sources of the same name in different directories share a key"
+
+    (tmp_path / "a" / "example.sv").write_text("module example(input clk); endmodule\n")
+    assert vpw.cache.key([], "parts", sources=[str(tmp_path / "a" / "example.sv")]) != digest, \
+        "edited source has the same key"
+
+
+def test_snapshot(context):
+    """Test the port list state returned with each tick."""
+    up_stream, _, _ = context
+
+    io = vpw.tick()
+    assert io is vpw.tick(), "port list state not updated in place"
+    assert "dn_axis_tdata" in io, "port missing from port list state"
+    assert isinstance(io["axim_rdata"], list), "wide port not a list of words"
+
+    state = io.copy()
+    assert sorted(state.keys()) == sorted(io.keys()), "copy missing ports"
+
+    up_stream.send([0x12345678], position=1)
+    while vpw.tick()["up_axis_tvalid"] == 0:
+        pass
+
+    assert io["up_axis_tdata"] == 0x12345678 << 32, "state not updated"
+    assert state["up_axis_tdata"] == 0, "copy of state was updated"
+
+    numpy = pytest.importorskip("numpy")
+    assert numpy.frombuffer(io, dtype=numpy.uint32).size > len(io), "no buffer"
+    assert vpw.view(io)["up_axis_tdata"] == 0x12345678 << 32, "view incorrect"
+
+
+def test_prep(context):
+    """Test that prepared values are applied together with the next tick."""
+    vpw.prep("rst", [1])
+    vpw.prep_many({"rst": [0], vpw.port("dn_axis_tready"): [2]})
+
+    io = vpw.tick()
+    assert io["rst"] == 0, "last value prepared not applied"
+    assert io["dn_axis_tready"] == 2, "value prepared by handle not applied"
+
+
+def test_prep_slices(design):
+    """Test that slices are prepared once per tick among other prepared values."""
+    sim = vpw.Simulator(design, trace=False)
+    ready = vpw.Slice("dn_axis_tready", 1, 2)
+    sim.register(ready)
+
+    preps = []
+    flush = ready._flush
+    ready._flush = lambda: preps.append(sim.cycles) or flush()
+
+    for n in range(10):
+        ready[0] = 1
+        sim.prep("up_axis_tvalid", [0])
+        ready[1] = n % 2
+        sim.prep("rst", [0])
+        io = sim.tick()
+        assert io["dn_axis_tready"] == 1 | (n % 2) << 1, "slices not applied"
+
+    assert preps == list(range(10)), "bus not prepared once per tick among other preps"
+
+    ready[0] = 0
+    sim.prep("dn_axis_tready", [2])
+    assert sim.tick()["dn_axis_tready"] == 2, "last value prepared not applied"
+    sim.finish()
+
+
 def test_stream_one(context):
     """Test AXI-Streaming interface with one stream."""
     up_stream, dn_stream, _ = context
@@ -83,6 +224,196 @@ def test_stream_two(context):
     assert stream2 == data2, "received stream 2 not the as sent"
 
 
+def test_simulators(design):
+    """Test that simulations of the same design run independently."""
+    sims = [vpw.Simulator(design, trace=False) for _ in range(2)]
+
+    streams = []
+    for sim in sims:
+        up_stream = vpw.axis.Master("up_axis", 32, concat=2)
+        sim.register(up_stream)
+
+        dn_stream = vpw.axis.Slave("dn_axis", 32, concat=2)
+        sim.register(dn_stream)
+
+        streams.append((up_stream, dn_stream))
+
+    data = [n+1 for n in range(16)]
+    streams[0][0].send(data, position=0)
+    streams[1][0].send(list(reversed(data)), position=0)
+    streams[0][1].ready(True, position=0)
+
+    # interleave the simulations, only the first is ready to receive
+    for _ in range(100):
+        for sim in sims:
+            sim.tick()
+
+    assert streams[0][1].recv(position=0) == data, "first simulation stream"
+    assert streams[1][1].recv(position=0) == [], "second simulation not stalled"
+
+    streams[1][1].ready(True, position=0)
+    sims[1].idle(100)
+    assert streams[1][1].recv(position=0) == list(reversed(data)), \
+        "second simulation stream"
+
+    for sim in sims:
+        sim.finish()
+
+
+def test_module_functions(design):
+    """Test the package's module level functions act on the simulation of init."""
+    vpw.init(design, trace=False)
+    design.prep("rst", [1])
+    assert design.tick()["rst"] == 1, "value prepared through the package not applied"
+    assert vpw.simulator.cycles == 1, "package ticked a different simulation"
+
+    vpw.finish()
+    with pytest.raises(RuntimeError):
+        design.tick()
+
+
+def test_ready_before_register(design):
+    """Test that slices and ready can be written before registering."""
+    sim = vpw.Simulator(design, trace=False)
+    dn_stream = vpw.axis.Slave("dn_axis", 32, concat=2)
+    dn_stream.ready(True, position=0)
+
+    up_stream = vpw.axis.Master("up_axis", 32, concat=2)
+    sim.register(up_stream)
+    sim.register(dn_stream)
+
+    data = [n+1 for n in range(16)]
+    up_stream.send(data, position=0)
+    sim.idle(100)
+    assert dn_stream.recv(position=0) == data, "ready written before registering not applied"
+    sim.finish()
+
+
+class Waiter:
+    """Background task recording the cycles on which its wait is over."""
+
+    def __init__(self, wait):
+        self.wait = wait
+        self.resumed = []
+
+    def init(self, sim):
+        while True:
+            yield self.wait
+            self.resumed.append(sim.cycles)
+
+
+class Once:
+    """Background task that finishes after being resumed once."""
+
+    def __init__(self):
+        self.resumed = 0
+
+    def init(self, sim):
+        yield
+        self.resumed += 1
+
+
+class Idler:
+    """Quiescent background task counting the ticks it is resumed on."""
+
+    def __init__(self):
+        self.resumed = 0
+
+    def quiescent(self):
+        return True
+
+    def init(self, sim):
+        while True:
+            yield
+            self.resumed += 1
+
+
+def test_scheduler(design):
+    """Test that background tasks are only resumed once their wait is over."""
+    sim = vpw.Simulator(design, trace=False)
+
+    queue = []
+    sleeper = Waiter(vpw.Sleep(40))
+    ready = Waiter(vpw.WaitFor("dn_axis_tready", 1, mask=1))
+    queued = Waiter(vpw.WaitQueue(queue))
+    either = Waiter(vpw.WaitAny(vpw.WaitFor("rst", 1), vpw.WaitFor("dn_axis_tready", 1, mask=1)))
+    for task in (sleeper, ready, queued, either):
+        sim.register(task)
+
+    sim.idle(100)
+    assert sleeper.resumed == [40, 80], "sleeping task not resumed when due"
+    assert ready.resumed == [] and queued.resumed == [] and either.resumed == [], "waiting task resumed"
+
+    sim.prep("dn_axis_tready", [1])
+    sim.idle(10)
+    assert ready.resumed == list(range(101, 111)), "port condition not met"
+    assert either.resumed == list(range(101, 111)), "any port condition not met"
+
+    queue.append(1)
+    sim.tick()
+    queue.clear()
+    sim.tick()
+    assert queued.resumed == [111], "queue wait not over when filled"
+
+    tasks = [Once(), Once()]
+    for task in tasks:
+        sim.register(task)
+    sim.tick()
+    assert [task.resumed for task in tasks] == [1, 1], "finished task skipped"
+    assert len(sim.background) == 4, "finished tasks not removed"
+
+    sim.finish()
+
+
+def test_quiescent(design):
+    """Test idle runs within the DUT with the memory and slices registered, the memory woken by the DUT."""
+    sim = vpw.Simulator(design, trace=False)
+    memory = vpw.axim2ram.Memory("axim2ram", 128, 16)
+    ready = vpw.Slice("dn_axis_tready")
+    idler = Idler()
+    for task in (memory, ready, idler):
+        sim.register(task)
+
+    sim.idle(1000)
+    assert memory.quiescent() and ready.quiescent() and sim.quiescent(), "idle tasks not quiescent"
+    assert idler.resumed < 10, "idle not run within the DUT"
+
+    # write bursts requested by the DUT rather than a task, while idling within it
+    start = sim.cycles
+    sim.prep_many({"axim_awaddr": [0x100], "axim_awlen": [0], "axim_awvalid": [1],
+                   "axim_wdata": vpw.pack(128, 1 << 100), "axim_wlast": [1], "axim_wvalid": [1]})
+    written = Waiter(vpw.WaitFor("axim_wready"))
+    sim.register(written)
+    sim.idle(100)
+    assert written.resumed and written.resumed[0] < start + 5, "write burst requested by the DUT missed"
+
+    sim.prep("axim_awvalid", [0])
+    sim.tick()
+    sim.prep("axim_wvalid", [0])
+    sim.idle(10)
+    assert memory.ram[0x10] == 1 << 100 and memory.quiescent(), "write bursts not completed"
+
+    # and read bursts
+    start = sim.cycles
+    sim.prep_many({"axim_araddr": [0x100], "axim_arlen": [0], "axim_arvalid": [1], "axim_rready": [1]})
+    read = Waiter(vpw.WaitFor("axim_rvalid"))
+    sim.register(read)
+    sim.idle(100)
+    assert read.resumed and read.resumed[0] < start + 5, "read burst requested by the DUT missed"
+
+    sim.prep("axim_arvalid", [0])
+    sim.idle(10)
+    assert memory.quiescent(), "read bursts not completed"
+
+    resumed = idler.resumed
+    sim.idle(1000)
+    assert idler.resumed - resumed < 10, "idle not run within the DUT after the bursts"
+
+    ready[0] = 1
+    assert not ready.quiescent(), "written slice quiescent"
+    sim.finish()
+
+
 def test_stream_intermittent_ready(context):
     """Test AXI-Streaming interface.
 
@@ -124,6 +455,550 @@ def test_stream_intermittent_valid(context):
     assert stream == data, "received stream not the as sent"
 
 
+def test_run(context):
+    """Test advancing the clock natively between AXI-Streaming transfers."""
+    up_stream, dn_stream, _ = context
+
+    io = vpw.run(50)
+    assert io["dn_axis_tvalid"] == 0, "data sent while idle"
+
+    data = [n+1 for n in range(16)]
+    up_stream.send(data, position=0)
+    dn_stream.ready(True, position=0)
+
+    vpw.idle(100)
+
+    stream = dn_stream.recv(position=0)
+    assert stream == data, "received stream not the as sent"
+
+
+def test_run_until(design):
+    """Test advancing the clock until a condition on the ports is met."""
+    sim = vpw.Simulator(design, trace=False)
+
+    up_stream = vpw.axis.Master("up_axis", 32, concat=2)
+    sim.register(up_stream)
+    sim.prep("dn_axis_tready", [1])
+    sim.idle(10)
+
+    up_stream.send([1, 2, 3], position=0)
+    cycles, io = sim.run_until(vpw.Condition("dn_axis_tvalid", "==", 1) &
+                               vpw.Condition("dn_axis_tlast", "==", 1), timeout=100)
+    assert io["dn_axis_tdata"] & 0xffffffff == 3, "stopped before the last beat"
+    assert sim.cycles == 10 + cycles, "cycles run not returned"
+
+    start = sim.cycles
+    with pytest.raises(TimeoutError):
+        sim.run_until("dn_axis_tvalid", "==", 1, timeout=50)
+    assert sim.cycles == start + 50, "timeout not in cycles"
+
+    cycles, io = sim.run_until(vpw.Condition("dn_axis_tvalid", "==", 1) |
+                               vpw.Condition("rst", "==", 0), timeout=50)
+    assert cycles == 1 and io["dn_axis_tvalid"] == 0, "either condition not met"
+
+    sim.finish()
+
+
+def dump_times(path):
+    """Times of the dumps within a VCD trace file."""
+    with open(path) as trace:
+        return [int(line[1:]) for line in trace if line.startswith("#")]
+
+
+def test_trace_window(design, tmp_path):
+    """Test tracing a window of cycles, paused and resumed at runtime."""
+    sim = vpw.Simulator(design, trace=(10, 20), name=str(tmp_path / "window"))
+    sim.idle(40)
+    sim.finish()
+
+    times = dump_times(tmp_path / "window.vcd")
+    assert times and min(times) >= 10 * 10 - 2 and max(times) < 20 * 10, "trace not limited to the window"
+
+    sim = vpw.Simulator(design, trace=True, name=str(tmp_path / "paused"))
+    sim.idle(10)
+    sim.trace_off()
+    sim.idle(10)
+    sim.trace_on()
+    sim.idle(10)
+    sim.finish()
+
+    times = dump_times(tmp_path / "paused.vcd")
+    assert max(times) > 20 * 10, "trace not resumed"
+    assert not [time for time in times if 10 * 10 + 5 < time < 21 * 10 - 2], "trace not paused"
+
+
+def test_trace_rotate(design, tmp_path):
+    """Test starting a new trace file every number of cycles."""
+    sim = vpw.Simulator(design, trace=True, rotate=10, name=str(tmp_path / "rotated"))
+    sim.idle(35)
+    sim.finish()
+
+    assert sorted(os.listdir(tmp_path)) == [f"rotated_{n:04}.vcd" for n in range(4)], "trace files not rotated"
+    for n in range(4):
+        times = dump_times(tmp_path / f"rotated_{n:04}.vcd")
+        assert times and min(times) > n * 10 * 10 - 10, "rotated trace not started afresh"
+
+
+def test_trace_scope(design, tmp_path):
+    """Test tracing only a scope of the design."""
+    workspace = tempfile.mkdtemp()
+    scoped = vpw.create(package='example_scope', module='example', clock='clk',
+                        workspace=workspace, trace_scope='TOP.example.skid_buffer_axis_0_')
+    shutil.rmtree(workspace)
+
+    for dut, name in ((design, "full"), (scoped, "scoped")):
+        sim = vpw.Simulator(dut, trace=True, name=str(tmp_path / name))
+        sim.idle(5)
+        sim.finish()
+
+    def variables(path):
+        with open(path) as trace:
+            return sum(line.lstrip().startswith("$var") for line in trace)
+
+    assert 0 < variables(tmp_path / "scoped.vcd") < variables(tmp_path / "full.vcd"), "trace not limited to the scope"
+
+
+def test_trace_flush(design, tmp_path):
+    """Test flushing the trace to file every number of cycles."""
+    sim = vpw.Simulator(design, trace=True, flush=5, name=str(tmp_path / "flushed"))
+    sim.idle(12)
+    assert max(dump_times(tmp_path / "flushed.vcd")) >= 10 * 10, "trace not flushed while running"
+    sim.finish()
+
+
+def test_trace_fst(tmp_path):
+    """Test tracing to an FST file."""
+    workspace = tempfile.mkdtemp()
+    dut = vpw.create(package='example_fst', module='example', clock='clk', workspace=workspace, trace='fst')
+    shutil.rmtree(workspace)
+
+    sim = vpw.Simulator(dut, trace=True, name=str(tmp_path / "fst"))
+    sim.idle(5)
+    sim.finish()
+
+    with open(tmp_path / "fst.fst", "rb") as trace:
+        assert trace.read(1) == b"\x00", "trace not in the FST format"  # header block
+
+
+def test_run_vectors(context):
+    """Test AXI-Streaming interface driven by input vectors."""
+    _, dn_stream, _ = context
+    numpy = pytest.importorskip("numpy")
+
+    dn_stream.ready(True, position=0)
+    vpw.idle(10)
+    data = numpy.arange(1, 17, dtype=numpy.uint64)
+    valid = numpy.ones(16, dtype=numpy.uint64)
+    inputs = {"up_axis_tdata": numpy.append(data, [0] * 4),
+              "up_axis_tlast": numpy.append(valid * 0, [0] * 4),
+              "up_axis_tvalid": numpy.append(valid, [0] * 4),
+              "dn_axis_tready": numpy.ones(20, dtype=numpy.uint64)}
+
+    result = vpw.run_vectors(inputs, outputs=["dn_axis_tdata", "dn_axis_tvalid"])
+    assert result.shape == (20, 2), "output vectors not (cycles x ports)"
+
+    received = result[(result[:, 1] & 1) == 1, 0] & 0xffffffff
+    assert list(received) == list(data), "received vectors not as sent"
+
+
+def test_threads(design):
+    """Test driving several simulations with input vectors from threads."""
+    numpy = pytest.importorskip("numpy")
+
+    def drive(offset):
+        sim = vpw.Simulator(design, trace=False)
+        sim.prep("dn_axis_tready", [1])
+        sim.run(1000)
+
+        data = numpy.arange(1, 1001, dtype=numpy.uint64) + offset
+        valid = numpy.ones(1000, dtype=numpy.uint64)
+        result = sim.run_vectors({"up_axis_tdata": numpy.append(data, [0] * 4),
+                                  "up_axis_tvalid": numpy.append(valid, [0] * 4),
+                                  "dn_axis_tready": numpy.ones(1004, dtype=numpy.uint64)},
+                                 outputs=["dn_axis_tdata", "dn_axis_tvalid"])
+        sim.finish()
+
+        return list(result[(result[:, 1] & 1) == 1, 0] & 0xffffffff)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(drive, [0, 1000, 2000, 3000]))
+
+    for offset, received in zip([0, 1000, 2000, 3000], results):
+        assert received == list(range(offset + 1, offset + 1001)), \
+            "received vectors not as sent"
+
+
+def test_model_threads():
+    """Test a model built with several threads runs as a single threaded one does."""
+    workspace = tempfile.mkdtemp()
+    options = dict(package='example_threads', module='example', clock='clk', workspace=workspace)
+
+    best, timings = vpw.bench.threads(counts=(1, 2), cycles=1000, **options)
+    assert sorted(timings) == [1, 2] and best in timings, "thread counts not timed"
+
+    def run(count):
+        # the builds of the benchmark are loaded from the build cache
+        dut = vpw.create(**{**options, 'package': f"example_threads_threads{count}"}, threads=count)
+        sim = vpw.Simulator(dut, trace=False)
+        up_stream = vpw.axis.Master("up_axis", 32, concat=2)
+        dn_stream = vpw.axis.Slave("dn_axis", 32, concat=2)
+        sim.register(up_stream)
+        sim.register(dn_stream)
+
+        up_stream.send([n+1 for n in range(64)], position=0)
+        up_stream.send([n+100 for n in range(32)], position=1)
+        dn_stream.ready(True, position=0)
+        sim.idle(50)
+        dn_stream.ready(True, position=1)
+        sim.idle(200)
+
+        received = dn_stream.recv(position=0), dn_stream.recv(position=1)
+        sim.finish()
+        return received
+
+    shutil.rmtree(workspace)
+
+    single = run(1)
+    assert single == ([n+1 for n in range(64)], [n+100 for n in range(32)]), "received stream not as sent"
+    assert run(2) == single, "multithreaded model differs from the single threaded one"
+
+
+def test_bench_drivers():
+    """Test timing the interface drivers against a loopback."""
+    timings = vpw.bench.drivers(cycles=1000)
+
+    assert sorted(timings) == ["axi4lite.Master", "axim.Master", "axim2ram.Memory"], "driver not timed"
+    assert all(timing > 0 for timing in timings.values()), "driver not run"
+
+
+def stream_job(sim, seed, beats):
+    """Regression job sending a random stream through the design."""
+    up_stream = vpw.axis.Master("up_axis", 32, concat=2)
+    sim.register(up_stream)
+
+    dn_stream = vpw.axis.Slave("dn_axis", 32, concat=2)
+    sim.register(dn_stream)
+
+    data = [random.getrandbits(32) for _ in range(beats)]
+    up_stream.send(data, position=0)
+    dn_stream.ready(True, position=0)
+
+    sim.idle(100)
+
+    assert dn_stream.recv(position=0) == data, "received stream not as sent"
+
+
+def test_regress(design):
+    """Test the parallel regression runner, the longer stream fails."""
+    workspace = tempfile.mkdtemp()
+
+    results = vpw.regress.run([stream_job], seeds=range(3),
+                              params=[{"beats": 16}, {"beats": 200}],
+                              workers=2,
+                              package='example_pytest',
+                              module='example',
+                              clock='clk',
+                              workspace=workspace,
+                              savable=True)
+
+    shutil.rmtree(workspace)
+
+    assert len(results) == 6, "regression job missing"
+    for result in results:
+        assert result.passed == (result.params["beats"] == 16), "wrong outcome"
+        assert result.cycles == 100, "cycle count not reported"
+
+        if not result.passed:
+            assert "AssertionError" in result.error, "failure not reported"
+            assert os.path.isfile(f"{result.trace}.vcd"), "failure not traced"
+            os.remove(f"{result.trace}.vcd")
+
+    assert "3 passed, 3 failed" in vpw.regress.report(results), "bad report"
+
+
+def test_fork_tests(context):
+    """Test running tests in forked children from a warmed up simulation."""
+    up_stream, dn_stream, _ = context
+
+    dn_stream.ready(True, position=0)
+    vpw.idle(10)
+    cycles = vpw.simulator.cycles
+
+    def stream(sim, seed, beats):
+        data = [random.getrandbits(32) for _ in range(beats)]
+        up_stream.send(data, position=0)
+        sim.idle(100)
+        assert dn_stream.recv(position=0) == data, "received stream not as sent"
+
+    results = vpw.fork_tests([stream], seeds=range(3),
+                             params=[{"beats": 16}, {"beats": 200}], workers=2)
+
+    assert len(results) == 6, "forked job missing"
+    for result in results:
+        assert result.passed == (result.params["beats"] == 16), "wrong outcome"
+        assert result.cycles == 100, "cycles not counted from the warm state"
+
+    assert vpw.simulator.cycles == cycles, "parent simulation advanced"
+    assert not up_stream.queue[0], "parent interface changed"
+
+
+def test_fork_trace(design, tmp_path):
+    """Test that forked children leave the trace files of the parent alone."""
+    sim = vpw.Simulator(design, trace=True, rotate=10, name=str(tmp_path / "parent"))
+    sim.idle(5)
+
+    results = vpw.regress.fork([lambda sim, seed: sim.idle(30)], sim=sim)
+    assert results[0].passed, results[0].error
+    assert os.listdir(tmp_path) == ["parent_0000.vcd"], "forked child rotated the trace"
+
+    sim.idle(10)
+    sim.finish()
+    assert max(dump_times(tmp_path / "parent_0000.vcd")) == 10 * 10 + 5, "parent trace written by a child"
+
+
+def test_checkpoint(design, context):
+    """Test running tests from a checkpoint taken after reset."""
+    up_stream, dn_stream, axim = context
+
+    vpw.prep("rst", [1])
+    vpw.idle(10)
+    vpw.prep("rst", [0])
+    dn_stream.ready(True, position=0)
+
+    data = [n+1 for n in range(64)]
+    axim.write(vpw.tick, 256, data, 1)
+    vpw.idle(10)
+
+    checkpoint = vpw.checkpoint()
+    cycles = vpw.simulator.cycles
+
+    for offset in (0, 100):
+        vpw.restore(checkpoint)
+        assert vpw.simulator.cycles == cycles, "clock counter not restored"
+
+        up_stream.send([n + offset for n in range(16)], position=0)
+        vpw.idle(100)
+        assert dn_stream.recv(position=0) == [n + offset for n in range(16)], \
+            "received stream not the as sent"
+
+        axim.write(vpw.tick, 256, [offset] * 64, 1)
+
+    # a new simulation of the design starts from the checkpoint
+    sim = vpw.Simulator(design, trace=False)
+    dn_stream = vpw.axis.Slave("dn_axis", 32, concat=2)
+    axim = vpw.axim.Master("axim", 128, 16)
+    for interface in (vpw.axis.Master("up_axis", 32, concat=2), dn_stream, axim,
+                      vpw.axim2ram.Memory("axim2ram", 128, 16)):
+        sim.register(interface)
+    sim.restore(io.BytesIO(checkpoint))
+
+    assert dn_stream.quiescent() is False, "ready state not restored"
+    assert axim.read(sim.tick, 256, len(data) * 16, 1) == data, "memory not restored"
+    sim.finish()
+
+
+def test_async(context):
+    """Test overlapping AXIS and AXI-MM transactions run as coroutine tasks."""
+    up_stream, dn_stream, axim = context
+
+    data = [n+1 for n in range(512)]
+
+    async def memory():
+        await axim.write_async(256, data, 1)
+        return await axim.read_async(256, len(data) * 16, 1)
+
+    async def stream():
+        dn_stream.ready(True, position=0)
+        up_stream.send(list(range(64)), position=0)
+
+        await vpw.edge("dn_axis_tlast", 1)
+        await vpw.clock(10)
+        return dn_stream.recv(position=0)
+
+    async def test():
+        memory_task = vpw.start(memory())
+        streamed = await vpw.start(stream())
+        assert not memory_task.done, "transactions did not overlap"
+
+        return await memory_task, streamed
+
+    received, streamed = vpw.complete(test(), timeout=10000)
+    assert received == data, "data value sent is not what was received"
+    assert streamed == list(range(64)), "received stream not the as sent"
+
+
+def test_native(design):
+    """Test the native AXIS and memory models run as the Python ones do."""
+
+    def run(native):
+        sim = vpw.Simulator(design, trace=False)
+        up_stream = vpw.axis.Master("up_axis", 32, concat=2, native=native)
+        dn_stream = vpw.axis.Slave("dn_axis", 32, concat=2, native=native)
+        axim = vpw.axim.Master("axim", 128, 16)
+        memory = vpw.axim2ram.Memory("axim2ram", 128, 16, native=native)
+        for interface in (up_stream, dn_stream, axim, memory):
+            sim.register(interface)
+
+        dn_stream.ready(True, position=0)
+        dn_stream.ready(True, position=1)
+        up_stream.send([n+1 for n in range(16)], position=0)
+        up_stream.send([17, 18, 19], position=1)
+        up_stream.send([20, 21], position=0)
+
+        pending = []
+        while len(dn_stream.queue[0]) < 2:
+            sim.tick()
+            pending.append((list(up_stream.pending), list(dn_stream.pending)))
+
+        data = [n * 0x1_0000_0001_0000_0001 for n in range(64)]
+        axim.write(sim.tick, 256, data, 1)
+        memory.ram[1000] = 1 << 100
+        sim.idle(10)
+
+        checkpoint = sim.checkpoint()
+        sim.restore(checkpoint)
+        received = axim.read(sim.tick, 256, len(data) * 16, 1) == data and \
+            axim.read(sim.tick, 1000 * 16, 16, 2) == [1 << 100]
+
+        streams = [dn_stream.recv(position=0), dn_stream.recv(position=0), dn_stream.recv(position=1)]
+        cycles = sim.cycles
+        sim.finish()
+        return streams, pending, received, cycles
+
+    assert run(True) == run(False), "native models differ from the Python ones"
+
+
+def test_back_to_back(design):
+    """Test the memory transfers the beats of queued bursts without a break."""
+    for native in (False, True):
+        sim = vpw.Simulator(design, trace=False)
+        axim = vpw.axim.Master("axim", 128, 16)
+        sim.register(axim)
+        sim.register(vpw.axim2ram.Memory("axim2ram", 128, 16, native=native, depth=8))
+
+        for n in range(8):
+            axim.send_write(n * 128, [n * 4 + beat for beat in range(4)], 1)
+        writes = [cycle for cycle in range(50)
+                  if (lambda io: io["axim2ram_wvalid"] and io["axim2ram_wready"])(sim.tick())]
+
+        for n in range(8):
+            axim.send_read(n * 128, 4, 1)
+        reads = [cycle for cycle in range(50)
+                 if (lambda io: io["axim2ram_rvalid"] and io["axim2ram_rready"])(sim.tick())]
+
+        assert [axim.recv_read(1) for _ in range(8)] == [[n * 4 + beat for beat in range(4)] for n in range(8)], \
+            "data value sent is not what was received"
+        assert writes == list(range(writes[0], writes[0] + 32)), "write bursts not back to back"
+        assert reads == list(range(reads[0], reads[0] + 32)), "read bursts not back to back"
+        sim.finish()
+
+
+def test_timing(design):
+    """Test the latency, bandwidth, stall and refresh timing of the memory."""
+    data = [n+1 for n in range(512)]
+
+    def run(timing):
+        sim = vpw.Simulator(design, trace=False)
+        axim = vpw.axim.Master("axim", 128, 16)
+        sim.register(axim)
+        sim.register(vpw.axim2ram.Memory("axim2ram", 128, 16, timing=timing))
+
+        axim.write(sim.tick, 256, data, 1)
+        cycles = sim.cycles
+        received = axim.read(sim.tick, 256, len(data) * 16, 1)
+        sim.finish()
+
+        assert received == data, "data value sent is not what was received"
+        return cycles, sim.cycles - cycles
+
+    write, read = run(None)
+    assert run(vpw.axim2ram.Timing(latency=20)) == (write, read + 20), "read latency not added"
+    assert run(vpw.axim2ram.Timing(write_rate=0.5, read_rate=0.25))[1] >= 4 * len(data), "read rate not limited"
+
+    timing = dict(latency=(5, 50), write_rate=0.5, stall=0.2, refresh=(64, 8))
+    assert run(vpw.axim2ram.Timing(seed=1, **timing)) == run(vpw.axim2ram.Timing(seed=1, **timing)), \
+        "seeded timing not repeated"
+
+    # the rows left open are restored with the checkpoint
+    timing = vpw.axim2ram.Timing(latency=vpw.axim2ram.RowHit(hit=2, miss=20))
+    memory = vpw.axim2ram.Memory("axim2ram", 128, 16, timing=timing)
+    assert timing.delay(0) == 20
+    checkpoint = memory.checkpoint()
+    assert timing.delay(2048 * 8) == 20
+    memory.restore(checkpoint)
+    assert timing.delay(0) == 2, "open rows not restored"
+
+    with pytest.raises(ValueError):
+        vpw.axim2ram.Memory("axim2ram", 128, 16, native=True, timing=vpw.axim2ram.Timing())
+
+
+def test_refresh(design):
+    """Test the memory presents no new beat while it refreshes and holds a presented read beat."""
+    period, refresh = 16, 4
+    sim = vpw.Simulator(design, trace=False)
+    axim = vpw.axim.Master("axim", 128, 16)
+    sim.register(axim)
+    sim.register(vpw.axim2ram.Memory("axim2ram", 128, 16, timing=vpw.axim2ram.Timing(refresh=(period, refresh))))
+    names = ("wvalid", "wready", "rvalid", "rready", "rdata", "rlast", "rid")
+
+    cycles = []
+
+    def tick():
+        # read beats are held across the start of refreshes by dropping rready
+        sim.prep("axim_rready", [int(sim.cycles % 7 < 4)])
+        io = sim.tick()
+        cycles.append((sim.cycles, {name: io[f"axim2ram_{name}"] for name in names}))
+        return io
+
+    data = [n+1 for n in range(256)]
+    axim.write(tick, 256, data, 1)
+    assert axim.read(tick, 256, len(data) * 16, 1) == data, "data value sent is not what was received"
+    sim.finish()
+
+    writes = {cycle % period for cycle, after in cycles if after["wvalid"] and after["wready"]}
+    assert writes == set(range(refresh, period)), "write beats accepted while refreshing"
+
+    held = presented = 0
+    for (_, before), (cycle, after) in zip(cycles, cycles[1:]):
+        if before["rvalid"] and not before["rready"]:
+            held += cycle % period < refresh
+            assert after["rvalid"] and all(after[name] == before[name] for name in ("rdata", "rlast", "rid")), \
+                "read beat not held until it is transferred"
+        elif after["rvalid"]:
+            presented += 1
+            assert cycle % period >= refresh, "read beat presented while refreshing"
+    assert held and presented, "read beats not held through refreshes"
+
+
+def test_pages(design, tmp_path):
+    """Test loading and dumping memory images in the paged memory."""
+    image = bytes(range(256)) * 4
+    beats = [int.from_bytes(image[n:n+16], "little") for n in range(0, len(image), 16)]
+
+    for options in ({}, {"path": str(tmp_path / "ram")}, {"native": True}):
+        sim = vpw.Simulator(design, trace=False)
+        axim = vpw.axim.Master("axim", 128, 16)
+        memory = vpw.axim2ram.Memory("axim2ram", 128, 16, page_size=4096, **options)
+        memory.load(0x1800, io.BytesIO(image))
+        sim.register(axim)
+        sim.register(memory)
+
+        assert axim.read(sim.tick, 0x1800, len(image), 1) == beats, "loaded image not read"
+
+        axim.write(sim.tick, 0x2000, beats[::-1], 1)
+        sim.idle(10)
+        assert memory.dump(0x1fe0, 48) == bytes(32) + image[-16:], "written beats not dumped"
+        assert memory.ram[0x200] == beats[-1] and len(memory.ram) == 2 * 256, "pages not allocated"
+
+        del memory.ram[0x200]
+        assert memory.ram[0x200] == 0 and 0x300 not in memory.ram, "beats not held in pages"
+
+        with pytest.raises(AssertionError):
+            memory.load(0xfff0, image)
+        assert memory.dump(0xf000, 0x1000) == bytes(0x1000), "image loaded beyond the address range"
+        sim.finish()
+
+
 def test_memory_mapped(context):
     """Test AXI-MM interface with large write/read pair."""
     _, _, axim = context
@@ -5,7 +5,6 @@ Tutorial 2 testbench
 
 import random
 from collections import deque
-from types import ModuleType
 from typing import Deque, Generator, List
 
 import vpw
@@ -17,7 +16,7 @@ class Checker:
         self.data_width = data_width
         self.reset = reset
 
-    def init(self, dut: ModuleType) -> Generator:
+    def init(self, sim: vpw.Simulator) -> Generator:
 
         io = yield
         past_data: int = vpw.unpack(self.data_width, io[f"{self.interface}_tdata"])
@@ -81,22 +80,22 @@ class Master:
         self.queue.append(data)
         self.pending += len(data)
 
-    def init(self, dut: ModuleType) -> Generator:
+    def init(self, sim: vpw.Simulator) -> Generator:
 
         while True:
             if not self.queue:
-                dut.prep(f"{self.interface}_tdata", vpw.pack(self.data_width, 0))
-                dut.prep(f"{self.interface}_tlast", [0])
-                dut.prep(f"{self.interface}_tvalid", [0])
+                sim.prep(f"{self.interface}_tdata", vpw.pack(self.data_width, 0))
+                sim.prep(f"{self.interface}_tlast", [0])
+                sim.prep(f"{self.interface}_tvalid", [0])
 
                 io = yield
             else:
                 self.current = self.queue[0]
 
                 for i, val in enumerate(self.current):
-                    dut.prep(f"{self.interface}_tdata", vpw.pack(self.data_width, val))
-                    dut.prep(f"{self.interface}_tlast", [int((i+1) == len(self.current))])
-                    dut.prep(f"{self.interface}_tvalid", [1])
+                    sim.prep(f"{self.interface}_tdata", vpw.pack(self.data_width, val))
+                    sim.prep(f"{self.interface}_tlast", [int((i+1) == len(self.current))])
+                    sim.prep(f"{self.interface}_tvalid", [1])
 
                     io = yield
                     while io[f"{self.interface}_tready"] == 0:
@@ -118,7 +117,7 @@ class Slave:
 
     def ready(self, active: bool) -> None:
         """ Turn on/off AXIS ready signal. """
-        self.__dut.prep(f"{self.interface}_tready", [int(active)])
+        self.__sim.prep(f"{self.interface}_tready", [int(active)])
 
     def recv(self) -> List[int]:
         """ Returns a list of data received, one element per beat. """
@@ -129,11 +128,11 @@ class Slave:
             self.pending -= len(stream)
             return stream
 
-    def init(self, dut) -> Generator:
-        self.__dut = dut
+    def init(self, sim: vpw.Simulator) -> Generator:
+        self.__sim = sim
 
         # setup
-        dut.prep(f"{self.interface}_tready", [0])
+        sim.prep(f"{self.interface}_tready", [0])
 
         while True:
             io = yield
@@ -2,38 +2,773 @@
 Verilator Python Wrapper Package
 """
 
-import importlib
+import atexit
+import heapq
+import importlib.util
+import itertools
+import operator
 import os
+import pickle
 import re
+import shutil
 import subprocess
 import sys
+import weakref
 from math import ceil
 from subprocess import PIPE
 from types import ModuleType
-from typing import Any, Dict, Generator, List, Optional, TextIO, Tuple, Union
+from typing import Any, BinaryIO, Callable, Coroutine, Dict, Generator, List, NamedTuple, Optional, Sized, TextIO, Tuple, Union
 
 from parsy import ParseError  # type: ignore
 from parsy import regex  # type: ignore
 from parsy import seq  # type: ignore
 from parsy import string  # type: ignore
 
-# Maintains persistent background tasks in the form of a list of generators
-# that get incremented every clock cycle.
-background = []
+from vpw import cache as build_cache
 
-# Design Under Test
+class Sleep(NamedTuple):
+    """ Yielded by a background task to be resumed after a number of cycles,
+    rather than with every tick """
+    cycles: int
+
+    def __await__(self):
+        return (yield self)
+
+
+class WaitFor(NamedTuple):
+    """ Yielded by a background task to be resumed on the first tick on which a
+    port, of 64 bits or less, has the value under the mask. The condition is
+    checked within the DUT. """
+    port: Union[str, int]
+    value: int = 1
+    mask: int = (1 << 64) - 1
+
+    def __await__(self):
+        return (yield self)
+
+
+class WaitAny:
+    """ Yielded by a background task to be resumed on the first tick on which
+    any of the port conditions, each a WaitFor, is met """
+
+    def __init__(self, *conditions: WaitFor) -> None:
+        self.conditions = conditions
+
+    def __await__(self):
+        return (yield self)
+
+
+class WaitQueue:
+    """ Yielded by a background task to be resumed on the first tick on which
+    any of the queues (deques or lists) is not empty """
+
+    def __init__(self, *queues: Sized) -> None:
+        self.queues = queues
+
+    def __await__(self):
+        return (yield self)
+
+
+def clock(cycles: int = 1) -> Sleep:
+    """ Awaited by a coroutine task to be resumed after a number of cycles with
+    the port list state """
+
+    return Sleep(cycles)
+
+
+def edge(port: Union[str, int], value: int = 1) -> WaitFor:
+    """ Awaited by a coroutine task to be resumed on the first tick on which the
+    port has the value, with the port list state """
+
+    return WaitFor(port, value)
+
+
+class Task:
+    """ Coroutine started as a background task of a simulation, awaiting the
+    task returns the result of the coroutine once it has completed """
+
+    def __init__(self, coro: Coroutine) -> None:
+        self.coro = coro
+
+        # holds the result once completed, a list so it can be waited on
+        self._result: List[Any] = []
+
+    @property
+    def done(self) -> bool:
+        return bool(self._result)
+
+    def result(self) -> Any:
+        """ Returns the result of the completed coroutine """
+
+        assert self.done, "task has not completed"
+        return self._result[0]
+
+    def __await__(self):
+        if not self._result:
+            yield WaitQueue(self._result)
+
+        return self._result[0]
+
+
+class Condition:
+    """ Condition on the value of a port, of 64 bits or less, as sampled on a
+    posedge. Conditions combine with & and | and are evaluated within the DUT
+    by run_until. """
+
+    _ops = ("==", "!=", "<", "<=", ">", ">=", "&", "|")
+    _compare = (operator.eq, operator.ne, operator.lt, operator.le, operator.gt, operator.ge)
+
+    def __init__(self, port: Union[str, int], op: str = "==", value: int = 1) -> None:
+        assert op in self._ops[:6], f"condition op must be one of {', '.join(self._ops[:6])}"
+
+        # reverse polish program of (op, port, value) instructions
+        self.program: List[Tuple[int, Union[str, int], int]] = [(self._ops.index(op), port, value)]
+
+    def __and__(self, other: "Condition") -> "Condition":
+        return self._combine(other, "&")
+
+    def __or__(self, other: "Condition") -> "Condition":
+        return self._combine(other, "|")
+
+    def _combine(self, other: "Condition", op: str) -> "Condition":
+        condition = Condition.__new__(Condition)
+        condition.program = self.program + other.program + [(self._ops.index(op), -1, 0)]
+        return condition
+
+    def evaluate(self, io) -> bool:
+        """ Evaluate the condition against a port list state """
+
+        stack: List[bool] = []
+        for op, port, value in self.program:
+            if op >= len(self._compare):
+                rhs = stack.pop()
+                stack[-1] = (stack[-1] and rhs) if self._ops[op] == "&" else (stack[-1] or rhs)
+            else:
+                stack.append(self._compare[op](io[port], value))
+
+        return stack[-1]
+
+
+class Simulator:
+    """ Simulation of one instance of a DUT package, owning its model, trace
+    file, clock counter and background tasks. Any number can exist at once,
+    the module level functions act on the instance made by 'init'. """
+
+    def __init__(self, testbench: ModuleType, trace: Union[bool, Tuple[int, int]] = True, flush: int = 0,
+                 rotate: int = 0, name: str = "", instance: Any = None) -> None:
+        """ Create and initialize the simulation.
+
+        Args:
+            testbench: DUT package created by 'create'.
+            trace: Enable tracing, or a (start, stop) cycle window to trace.
+            flush: Flush the buffered trace to file every number of cycles, if 0
+                only when finished or when a background task raises an exception.
+            rotate: Start a new trace file every number of cycles, if 0 use one.
+            name: Name of the trace file, defaults to the package name.
+            instance: Native simulation of the package to use, defaults to a
+                new one.
+        """
+
+        self.testbench = testbench
+        self.dut = instance if instance is not None else testbench.Simulator()
+
+        # Maintains persistent background tasks in the form of a list of
+        # generators, in order of registration, that are resumed with the port
+        # list state every tick they are due. A task yielding nothing is due
+        # every tick, otherwise when the Sleep, WaitFor, WaitAny or WaitQueue it
+        # yields is over.
+        self.background: List[Generator] = []
+
+        # Scheduling of the background tasks, those due every tick, those
+        # sleeping as a heap of (wake cycle, order, task), those waiting on
+        # port conditions armed within the DUT by their id and those waiting on
+        # queues. Tasks due on the same tick are resumed in registration order.
+        self._order: Dict[Generator, int] = {}
+        self._registered = itertools.count()
+        self._active: List[Generator] = []
+        self._sleeping: List[Tuple[int, int, Generator]] = []
+        self._waiting: Dict[int, Tuple[Generator, Union[WaitFor, WaitAny]]] = {}
+        self._queued: Dict[Generator, WaitQueue] = {}
+
+        # Coroutines started as tasks, mapped to their Task
+        self._tasks: Dict[Coroutine, Task] = {}
+
+        # Background tasks that can declare themselves quiescent, mapped to the
+        # function used to ask them.
+        self._quiescent: Dict[Generator, Callable[[], bool]] = {}
+
+        # Registered interfaces mapped from their background task, in order of
+        # registration, so their state can be checkpointed and their tasks
+        # restarted on restore.
+        self._interfaces: Dict[Generator, Any] = {}
+
+        # Input values prepared since the last tick, by port handle, that are
+        # applied to the DUT together just before the next tick.
+        self._prepared: Dict[int, List[int]] = {}
+
+        # Slices written since the last tick, each bus is prepared once just
+        # before the next tick however many of its slices were written.
+        self._slices: List[Slice] = []
+
+        # Port handles resolved by name
+        self._handles: Dict[str, int] = {}
+
+        _simulators.add(self)
+        self.init(trace, flush, rotate, name)
+
+    def init(self, trace: Union[bool, Tuple[int, int]] = True, flush: int = 0, rotate: int = 0,
+             name: str = "") -> None:
+        """ (Re)initialize the DUT simulation, see the constructor for the
+        arguments """
+
+        now = self.dut.cycles
+        if isinstance(trace, tuple):
+            self.dut.init(True, flush, trace[0], trace[1], rotate, name)
+        else:
+            self.dut.init(trace, flush, rotate=rotate, name=name)
+        self._prepared.clear()
+        self._handles.clear()
+
+        # the clock counter starts again and the port conditions are disarmed
+        self._sleeping = [(wake - now, order, gen) for wake, order, gen in self._sleeping]
+        waiting = {gen: wait for gen, wait in self._waiting.values()}
+        self._waiting.clear()
+        for gen, wait in waiting.items():
+            self._schedule(gen, wait)
+
+    def port(self, name: str) -> int:
+        """ Resolve a port name into the integer handle used to address it """
+
+        handle: int = self.testbench.port_id(name)
+        if handle < 0:
+            print(f"WARNING: requested port '{name}' not found.", file=sys.stderr)
+
+        return handle
+
+    def prep(self, port: Union[str, int], value: List[int]) -> None:
+        """ Prepare an input value to be applied to the DUT with the next tick """
+
+        if isinstance(port, str):
+            if port not in self._handles:
+                self._handles[port] = self.testbench.port_id(port)
+
+            if self._handles[port] < 0:
+                self.dut.prep(port, value)  # warns of the unknown port
+                return
+
+            port = self._handles[port]
+
+        if self._slices:
+            # the last value prepared for a port is applied, so a slice of the
+            # port written before is prepared first
+            for bus in self._slices:
+                if bus._port == port:
+                    bus._flush()
+                    self._slices.remove(bus)
+                    break
+
+        self._prepared[port] = value
+
+    def prep_many(self, values: Dict[Union[str, int], List[int]]) -> None:
+        """ Prepare a number of input values, given as a dict of port to value """
+
+        for port, value in values.items():
+            self.prep(port, value)
+
+    def _apply(self) -> None:
+        """ Apply the prepared input values to the DUT in one call """
+
+        if self._slices:
+            self._flush()
+
+        if self._prepared:
+            self.dut.prep_many(list(self._prepared.items()))
+            self._prepared.clear()
+
+    def _flush(self) -> None:
+        """ Prepare the buses of the slices written since they were last
+        prepared """
+
+        for bus in self._slices:
+            bus._flush()
+        self._slices.clear()
+
+    def view(self, io):
+        """ Returns a NumPy structured array that views the port list state
+        returned by a tick in place, one field per port with ports wider than 64
+        bits as sub-arrays of 32 bit words """
+
+        import numpy  # only required when viewing the port list state
+
+        names: List[str] = []
+        formats: List[Any] = []
+        offsets: List[int] = []
+
+        offset = 0
+        for name, width, _ in self.testbench.ports():
+            words = ceil(width / 32)
+            names.append(name)
+            if words == 1:
+                formats.append('<u4')
+            elif words == 2:
+                formats.append('<u8')
+            else:
+                formats.append(('<u4', words))
+            offsets.append(4 * offset)
+            offset += words
+
+        dtype = numpy.dtype({"names": names, "formats": formats,
+                             "offsets": offsets, "itemsize": 4 * offset})
+
+        return numpy.frombuffer(io, dtype=dtype).reshape(())
+
+    def register(self, interface) -> None:
+        """ When an interface is registered with the simulation it's first
+        initiated and then its generator, or coroutine, is run in the
+        background """
+
+        gen = interface.init(self)
+        self._interfaces[gen] = interface
+
+        if hasattr(interface, "quiescent"):
+            self._quiescent[gen] = interface.quiescent
+
+        self._spawn(gen)
+
+    def attach(self, bfm: Any) -> Generator:
+        """ Run a native bus functional model, made from the classes of the DUT
+        package, within the DUT with every cycle. Returns the background task
+        of the interface it stands in for, which is never resumed. """
+
+        self.dut.attach(bfm)
+        return self._attached()
+
+    @staticmethod
+    def _attached() -> Generator:
+        while True:
+            yield WaitQueue()
+
+    def start(self, coro: Coroutine) -> Task:
+        """ Start a coroutine as a background task, which runs until its first
+        await and is then resumed whenever what it awaits is due, see clock
+        and edge """
+
+        task = Task(coro)
+        self._tasks[coro] = task
+        self._spawn(coro)
+
+        return task
+
+    def complete(self, coro: Coroutine, timeout: Optional[int] = None) -> Any:
+        """ Run a coroutine as a background task until it has completed,
+        returning its result, or raise a TimeoutError if it has not completed
+        within the timeout in cycles """
+
+        task = self.start(coro)
+        start = self.cycles
+        while not task.done:
+            if timeout is not None and self.cycles >= start + timeout:
+                raise TimeoutError(f"task not completed within {timeout} cycles")
+
+            # advance in bounded steps so a task that never completes can be interrupted
+            self._advance(start + timeout if timeout is not None else self.cycles + (1 << 16))
+
+        return task.result()
+
+    def _spawn(self, gen: Generator) -> None:
+        """ Add a background task, running it up to what it first yields """
+
+        self.background.append(gen)
+        self._order[gen] = next(self._registered)
+        self._send(gen, None)
+
+    def _send(self, gen: Generator, io) -> None:
+        """ Resume a background task and schedule it by what it yields """
+
+        try:
+            self._schedule(gen, gen.send(io))
+        except StopIteration as stop:
+            task = self._tasks.get(gen)
+            self._remove(gen)
+            if task:
+                task._result.append(stop.value)
+
+    def _schedule(self, gen: Generator, wait: Any) -> None:
+        """ Schedule when a background task is next resumed, given what it
+        yielded """
+
+        if wait is None:
+            self._active.append(gen)
+        elif isinstance(wait, Sleep):
+            heapq.heappush(self._sleeping, (self.dut.cycles + max(wait.cycles, 1), self._order[gen], gen))
+        elif isinstance(wait, WaitFor):
+            port = wait.port if isinstance(wait.port, int) else self.port(wait.port)
+            self._waiting[self.dut.arm(port, wait.value, wait.mask)] = (gen, wait)
+        elif isinstance(wait, WaitAny):
+            for condition in wait.conditions:
+                port = condition.port if isinstance(condition.port, int) else self.port(condition.port)
+                self._waiting[self.dut.arm(port, condition.value, condition.mask)] = (gen, wait)
+        elif isinstance(wait, WaitQueue):
+            self._queued[gen] = wait
+        else:
+            raise TypeError(f"background task yielded {wait!r}")
+
+    def _remove(self, gen: Generator) -> None:
+        """ Remove a finished background task """
+
+        self.background.remove(gen)
+        self._order.pop(gen, None)
+        self._quiescent.pop(gen, None)
+        self._interfaces.pop(gen, None)
+        self._tasks.pop(gen, None)
+
+    def _resume(self, io) -> None:
+        """ Resume the background tasks that are due with the port list state """
+
+        now = self.dut.cycles
+        due = self._active
+
+        woken: List[Generator] = []
+        while self._sleeping and self._sleeping[0][0] <= now:
+            woken.append(heapq.heappop(self._sleeping)[2])
+        if self._waiting:
+            for wait_id in self.dut.take_fired():
+                if wait_id not in self._waiting:
+                    continue  # another condition of the same WaitAny was met
+                gen, wait = self._waiting.pop(wait_id)
+                woken.append(gen)
+                if isinstance(wait, WaitAny):
+                    # the conditions of the wait not met are disarmed
+                    for other in [other for other, (waiter, _) in self._waiting.items() if waiter is gen]:
+                        del self._waiting[other]
+                        self.dut.disarm(other)
+        if self._queued:
+            for gen, wait in list(self._queued.items()):
+                if any(wait.queues):
+                    woken.append(gen)
+                    del self._queued[gen]
+        if woken:
+            due = sorted(due + woken, key=self._order.__getitem__)
+
+        self._active = []
+        for index, gen in enumerate(due):
+            try:
+                self._send(gen, io)
+            except BaseException:
+                # the task has finished, those not yet resumed are due next tick
+                self._remove(gen)
+                self._active.extend(due[index + 1:])
+                raise
+
+    def _dormant(self) -> bool:
+        """ Every task due each tick is quiescent and no queue being waited on
+        has been filled, so no task needs resuming until a sleeping or waiting
+        task is due """
+
+        return all(gen in self._quiescent and self._quiescent[gen]() for gen in self._active) and \
+            not any(any(wait.queues) for wait in self._queued.values())
+
+    def quiescent(self) -> bool:
+        """ Returns True when every background task has declared itself
+        quiescent, i.e. advancing the clock will not change its state """
+
+        for gen in self.background:
+            if gen not in self._quiescent or not self._quiescent[gen]():
+                return False
+
+        return True
+
+    def checkpoint(self, path_or_buffer: Union[None, str, BinaryIO] = None) -> bytes:
+        """ Capture the state of the DUT, its clock counter and the registered
+        interfaces, the design must be created as savable. Interface tasks are
+        restarted on restore so each interface must be between transfers, see
+        its checkpoint method.
+
+        Args:
+            path_or_buffer: File name or binary file object to also write the
+                checkpoint to.
+        Return:
+            The checkpoint as bytes.
+        """
+
+        for gen in self.background:
+            assert hasattr(self._interfaces.get(gen), "checkpoint"), \
+                "background task can not be checkpointed"
+
+        self._apply()
+        data = pickle.dumps({"package": self.testbench.__name__,
+                             "model": self.dut.checkpoint(),
+                             "interfaces": [interface.checkpoint() for interface in self._interfaces.values()]})
+
+        if isinstance(path_or_buffer, str):
+            with open(path_or_buffer, "wb") as checkpoint:
+                checkpoint.write(data)
+        elif path_or_buffer is not None:
+            path_or_buffer.write(data)
+
+        return data
+
+    def restore(self, path_or_buffer: Union[bytes, str, BinaryIO]) -> None:
+        """ Return the simulation to a checkpoint, given as bytes, a file name or
+        a binary file object. The same interfaces must be registered, in the
+        same order, as when the checkpoint was taken, their state is restored
+        and their tasks restarted. """
+
+        if isinstance(path_or_buffer, bytes):
+            data = path_or_buffer
+        elif isinstance(path_or_buffer, str):
+            with open(path_or_buffer, "rb") as checkpoint:
+                data = checkpoint.read()
+        else:
+            data = path_or_buffer.read()
+
+        state = pickle.loads(data)
+        assert state["package"] == self.testbench.__name__, "checkpoint of a different design"
+
+        interfaces = list(self._interfaces.values())
+        assert len(interfaces) == len(state["interfaces"]), \
+            "registered interfaces do not match the checkpoint"
+
+        self._prepared.clear()
+        self.dut.restore(state["model"])
+
+        self._clear()
+        for interface, saved in zip(interfaces, state["interfaces"]):
+            interface.restore(saved)
+            self.register(interface)
+
+    def tick(self):
+        """ Advance TB clock """
+
+        self._apply()
+        io = self.dut.tick()
+        try:
+            self._resume(io)
+        except BaseException:
+            self.dut.flush()
+            raise
+
+        return io
+
+    def run(self, cycles: int = 1):
+        """ Advance TB clock a number of cycles within the DUT, background tasks
+        are not progressed and only the port state of the last cycle is returned
+        """
+
+        self._apply()
+        return self.dut.run(cycles)
+
+    def run_vectors(self, inputs, ports: Optional[List[Union[str, int]]] = None,
+                    outputs: Optional[List[Union[str, int]]] = None):
+        """ Drive the DUT with input vectors within the DUT, returning the output
+        vectors, background tasks are not progressed.
+
+        Args:
+            inputs: NumPy (cycles x input ports) matrix or dict of port to array of
+                per cycle values, row i is applied before posedge i.
+            ports: Input ports of the matrix columns, defaults to all the input
+                ports of 64 bits or less in port table order.
+            outputs: Ports sampled on each posedge, defaults to all the output
+                ports of 64 bits or less in port table order.
+        Return:
+            NumPy (cycles x output ports) matrix of the sampled values.
+        """
+
+        import numpy  # only required when running vectors
+
+        table = self.testbench.ports()
+
+        if isinstance(inputs, dict):
+            ports = list(inputs.keys())
+            inputs = numpy.column_stack([numpy.asarray(v, dtype=numpy.uint64)
+                                         for v in inputs.values()])
+        elif ports is None:
+            ports = [name for name, width, direction in table
+                     if direction == "input" and width <= 64]
+
+        if outputs is None:
+            outputs = [name for name, width, direction in table
+                       if direction == "output" and width <= 64]
+
+        self._apply()
+        return self.dut.run_vectors(inputs,
+                                    [p if isinstance(p, int) else self.port(p) for p in ports],
+                                    [p if isinstance(p, int) else self.port(p) for p in outputs])
+
+    def idle(self, time: int = 1):
+        """ Idle for a number of clock cycles, the cycles in which no background
+        task is due are run within the DUT """
+
+        end = self.cycles + time
+        while self.cycles < end - 1:
+            self._advance(end)
+
+        return self.tick()
+
+    def _advance(self, end: int) -> None:
+        """ Advance the clock to the next cycle on which a background task is
+        due, running the cycles in between within the DUT, but no further than
+        the cycle before end """
+
+        due = min(self._sleeping[0][0], end) if self._sleeping else end
+
+        if due - 1 > self.cycles and self._dormant():
+            # nothing to do for the background tasks until one is due or a port
+            # condition is met
+            self._apply()
+            io = self.dut.idle(due - 1 - self.cycles)
+            try:
+                self._resume(io)
+            except BaseException:
+                self.dut.flush()
+                raise
+        else:
+            self.tick()
+
+    def run_until(self, condition: Union[Condition, str, int], op: str = "==", value: int = 1,
+                  timeout: Optional[int] = None):
+        """ Advance the clock until a condition is met on a posedge, progressing
+        the background tasks as idle does. The cycles in which no background
+        task is due are run within the DUT, which also evaluates the condition.
+
+        Args:
+            condition: Condition, or the port to compare with the value.
+            op: Comparison of the port with the value, one of ==, !=, <, <=, >
+                or >=.
+            value: Value the port is compared with.
+            timeout: Maximum number of cycles to run, if None no limit.
+        Return:
+            Number of cycles run and the port list state of the posedge on which
+            the condition was met.
+        Raise:
+            TimeoutError: The condition was not met within the timeout.
+        """
+
+        if not isinstance(condition, Condition):
+            condition = Condition(condition, op, value)
+
+        program = [(code, port if isinstance(port, int) else self.port(port), val)
+                   for code, port, val in condition.program]
+        assert all(port >= 0 for code, port, _ in program if code < len(Condition._compare)), \
+            "condition port not found"
+
+        start = self.cycles
+        while timeout is None or self.cycles < start + timeout:
+            limit = (1 << 62) if timeout is None else start + timeout - self.cycles
+            if self._sleeping:
+                limit = min(limit, self._sleeping[0][0] - 1 - self.cycles)
+
+            if limit > 0 and self._dormant():
+                # nothing to do for the background tasks until the condition
+                # or a port condition is met or a sleeping task is due
+                self._apply()
+                met, _ = self.dut.run_until(program, limit)
+                io = self.dut.snapshot
+                try:
+                    self._resume(io)
+                except BaseException:
+                    self.dut.flush()
+                    raise
+            else:
+                io = self.tick()
+                met = condition.evaluate(io)
+
+            if met:
+                return self.cycles - start, io
+
+        raise TimeoutError(f"condition not met within {timeout} cycles")
+
+    @property
+    def cycles(self) -> int:
+        """ Number of clock cycles simulated since init """
+
+        return self.dut.cycles
+
+    def trace_on(self) -> None:
+        """ Resume dumping the trace """
+
+        self.dut.trace_on()
+
+    def trace_off(self) -> None:
+        """ Pause dumping the trace """
+
+        self.dut.trace_off()
+
+    def flush(self) -> None:
+        """ Flush the buffered trace to file """
+
+        self.dut.flush()
+
+    def _clear(self) -> None:
+        """ Remove every background task, and bus functional model """
+
+        self.dut.detach()
+        self.background.clear()
+        self._order.clear()
+        self._quiescent.clear()
+        self._interfaces.clear()
+        self._active.clear()
+        self._sleeping.clear()
+        self._waiting.clear()
+        self._queued.clear()
+        self._tasks.clear()
+
+    def finish(self) -> None:
+        self.dut.finish()
+        self._clear()
+        self._prepared.clear()
+        for bus in self._slices:
+            bus._dirty = False
+        self._slices.clear()
+
+
+# Every simulation that still exists, flushed on exit
+_simulators: "weakref.WeakSet[Simulator]" = weakref.WeakSet()
+
+# Simulation used by the module level functions, made by 'init'
+simulator: Simulator
+
+# Design Under Test and background tasks of that simulation
 dut: ModuleType
+background: List[Generator] = []
+
+
+def init(testbench: ModuleType, trace: Union[bool, Tuple[int, int]] = True, flush: int = 0,
+         rotate: int = 0, name: str = ""):
+    """ Initialize the DUT simulation used by the module level functions.
 
+    Args:
+        testbench: DUT package created by 'create'.
+        trace: Enable tracing, or a (start, stop) cycle window to trace.
+        flush: Flush the buffered trace to file every number of cycles, if 0
+            only when finished or when a background task raises an exception.
+        rotate: Start a new trace file every number of cycles, if 0 use one.
+        name: Name of the trace file, defaults to the package name.
+    """
 
-def init(testbench: ModuleType, trace: bool = True):
-    global dut
+    global simulator, dut, background
+    # the package's module level functions act on the same simulation
+    simulator = Simulator(testbench, trace, flush, rotate, name, instance=testbench.instance())
     dut = testbench
-    dut.init(trace)
+    background = simulator.background
+
+
+def port(name: str) -> int:
+    """ Resolve a port name into the integer handle used to address it """
+
+    return simulator.port(name)
+
+
+def prep(port: Union[str, int], value: List[int]):
+    """ Prepare an input value to be applied to the DUT with the next tick """
+
+    simulator.prep(port, value)
 
 
-def prep(port: str, value: List[int]):
-    global dut
-    dut.prep(port, value)
+def prep_many(values: Dict[Union[str, int], List[int]]):
+    """ Prepare a number of input values, given as a dict of port to value """
+
+    simulator.prep_many(values)
 
 
 def pack(data_width: int, val: int) -> List[int]:
@@ -43,9 +778,7 @@ def pack(data_width: int, val: int) -> List[int]:
     if data_width <= 64:
         return [val]
     else:
-        start = ceil(data_width / 32)
-        shift = [32*s for s in range(start)]
-        return [((val >> s) & 0xffffffff) for s in shift]
+        return [((val >> s) & 0xffffffff) for s in range(0, data_width, 32)]
 
 
 def unpack(data_width: int, val: Union[int, List[int]]) -> int:
@@ -53,52 +786,135 @@ def unpack(data_width: int, val: Union[int, List[int]]) -> int:
         assert(data_width <= 64)
         return val
     else:
-        start = ceil(data_width / 32)
-        shift = [32*s for s in range(start)]
         number: int = 0
-        for v, s in zip(val, shift):
+        for v, s in zip(val, range(0, data_width, 32)):
             number = number | (v << s)
 
         return number
 
 
+def view(io):
+    """ Returns a NumPy structured array that views the port list state
+    returned by a tick in place, one field per port with ports wider than 64
+    bits as sub-arrays of 32 bit words """
+
+    return simulator.view(io)
+
+
 def register(interface):
     """ When an interface is registered with VPW it's first initiated and then
     its generator is run in the background """
 
-    global dut
-    gen = interface.init(dut)
-    next(gen)
-    background.append(gen)
+    simulator.register(interface)
+
+
+def start(coro: Coroutine) -> Task:
+    """ Start a coroutine as a background task, see Simulator.start """
+
+    return simulator.start(coro)
+
+
+def complete(coro: Coroutine, timeout: Optional[int] = None) -> Any:
+    """ Run a coroutine as a background task until it has completed, returning
+    its result """
+
+    return simulator.complete(coro, timeout)
+
+
+def quiescent() -> bool:
+    """ Returns True when every background task has declared itself
+    quiescent, i.e. advancing the clock will not change its state """
+
+    return simulator.quiescent()
+
+
+def checkpoint(path_or_buffer: Union[None, str, BinaryIO] = None) -> bytes:
+    """ Capture the state of the simulation, optionally also writing it to a
+    file name or binary file object """
+
+    return simulator.checkpoint(path_or_buffer)
+
+
+def restore(path_or_buffer: Union[bytes, str, BinaryIO]) -> None:
+    """ Return the simulation to a checkpoint given as bytes, a file name or a
+    binary file object """
+
+    simulator.restore(path_or_buffer)
 
 
 def tick():
     """ Advance TB clock """
 
-    global dut
-    io = dut.tick()
-    for gen in background:
-        try:
-            gen.send(io)
-        except StopIteration:
-            background.remove(gen)
+    return simulator.tick()
+
+
+def run(cycles: int = 1):
+    """ Advance TB clock a number of cycles within the DUT, background tasks
+    are not progressed and only the port state of the last cycle is returned
+    """
+
+    return simulator.run(cycles)
+
 
-    return io
+def run_vectors(inputs, ports: Optional[List[Union[str, int]]] = None,
+                outputs: Optional[List[Union[str, int]]] = None):
+    """ Drive the DUT with input vectors within the DUT, returning the output
+    vectors, see Simulator.run_vectors """
+
+    return simulator.run_vectors(inputs, ports, outputs)
 
 
 def idle(time: int = 1):
     """ Idle for a number of clock cycles """
 
-    for _ in range(time - 1):
-        tick()
+    return simulator.idle(time)
+
+
+def run_until(condition: Union[Condition, str, int], op: str = "==", value: int = 1,
+              timeout: Optional[int] = None):
+    """ Advance the clock until a condition is met on a posedge, returning the
+    number of cycles run and the port list state, see Simulator.run_until """
+
+    return simulator.run_until(condition, op, value, timeout)
+
+
+def fork_tests(tests: List[Callable], seeds: Any = (0,), params: Any = ({},), workers: Optional[int] = None):
+    """ Run each test from the current state of the simulation within its own
+    forked child process, see vpw.regress.fork """
+
+    from vpw import regress  # imports this package
+
+    return regress.fork(tests, seeds, params, simulator, workers)
+
+
+def trace_on():
+    """ Resume dumping the trace """
+
+    simulator.trace_on()
+
 
-    return tick()
+def trace_off():
+    """ Pause dumping the trace """
+
+    simulator.trace_off()
+
+
+def flush():
+    """ Flush the buffered trace to file """
+
+    simulator.flush()
+
+
+@atexit.register
+def _exit():
+    """ Flush the buffered traces of unfinished simulations on exit """
+
+    for sim in list(_simulators):
+        sim.flush()
 
 
 def finish():
-    global dut
-    dut.finish()
-    background.clear()
+    simulator.finish()
 
 
 def parse(module: str, clock: str, header: TextIO) -> str:
@@ -107,98 +923,112 @@ def parse(module: str, clock: str, header: TextIO) -> str:
     def generate_intro(module: str) -> str:
         return f'#include "V{module}.h"\n' \
                f'#include "verilated.h"\n' \
-               f'#include "verilated_vcd_c.h"\n' \
                f'\n' \
                f'typedef V{module} TB;\n' \
                f'#include "testbench.hh"\n' \
                f'\n' \
                f'\n' \
-               f'void prep(const std::string port,' \
-               f' const std::vector<uint64_t> &value) {"{"}\n' \
-               f'\n' \
-               f'  '
+               f'const std::vector<Port> ports = {"{"}\n'
 
-    def generate_prep_if(port: str, width: str) -> str:
-        if (width != 'IN8' and width != "IN16" and width != "IN32" and
-                width != "IN64" and width != "INW"):
-            return ''
-        else:
-            return f'if ("{port}" == port) {"{"}\n'
+    def generate_port_table(port: str, width: str, size: int, offset: int) -> str:
+        direction = 'true' if width.startswith('IN') else 'false'
+        return f'  {"{"}"{port}", {size}, {direction}, {offset}{"}"},\n'
+
+    def generate_prep() -> str:
+        return f'{"}"};\n' \
+               f'\n' \
+               f'void prep_id(TB *dut, const int port,' \
+               f' const std::vector<uint64_t> &value) {"{"}\n' \
+               f'  switch (port) {"{"}\n'
 
-    def generate_prep_body(port: str, width: str) -> str:
+    def generate_prep_case(handle: int, port: str, width: str) -> str:
         if width == 'IN8':
-            return f'    dut->{port} = static_cast<const uint8_t>(value[0]);\n  {"}"} else '
+            cast = 'uint8_t'
         elif width == "IN16":
-            return f'    dut->{port} = static_cast<const uint16_t>(value[0]);\n  {"}"} else '
+            cast = 'uint16_t'
         elif width == "IN32":
-            return f'    dut->{port} = static_cast<const uint32_t>(value[0]);\n  {"}"} else '
+            cast = 'uint32_t'
         elif width == "IN64":
-            return f'    dut->{port} = static_cast<const uint64_t>(value[0]);\n  {"}"} else '
+            cast = 'uint64_t'
         elif width == "INW":
-            return f'    for (std::size_t i = 0; i != value.size(); ++i) {"{"}\n' \
+            return f'  case {handle}:\n' \
+                   f'    for (std::size_t i = 0; i != value.size(); ++i) {"{"}\n' \
                    f'       dut->{port}[i] = static_cast<const uint32_t>(value[i]);\n' \
-                   f'    {"}"}\n  {"}"} else '
+                   f'    {"}"}\n' \
+                   f'    break;\n'
         else:
             return ''
 
+        return f'  case {handle}:\n' \
+               f'    dut->{port} = static_cast<const {cast}>(value[0]);\n' \
+               f'    break;\n'
+
     def generate_update() -> str:
-        return f'{"{"}\n' \
-               f'    printf("WARNING: requested port \\\'%s\\\' not found.\\n", ' \
-               f'port.c_str());\n' \
+        return f'  default:\n' \
+               f'    printf("WARNING: requested port handle \\\'%d\\\' is not an input.\\n", ' \
+               f'port);\n' \
                f'  {"}"}\n' \
                f'{"}"}\n' \
                f'\n' \
-               f'py::dict update() {"{"}\n\n'
-
-    def generate_update_list(port: str, width: str) -> str:
-        if width != "INW" and width != "OUTW":
-            return ''
+               f'void update(TB *dut, uint32_t *io) {"{"}\n'
+
+    def generate_update_store(port: str, width: str, offset: int, indent: str = '  ') -> str:
+        if width == "INW" or width == "OUTW":
+            return f'{indent}std::copy(std::begin(dut->{port}.m_storage), ' \
+                   f'std::end(dut->{port}.m_storage), io + {offset});\n'
+        elif width == "IN64" or width == "OUT64":
+            return f'{indent}io[{offset}] = static_cast<uint32_t>(dut->{port});\n' \
+                   f'{indent}io[{offset + 1}] = static_cast<uint32_t>(dut->{port} >> 32);\n'
         else:
-            return f'  py::list {port};\n' \
-                   f'  for (auto &item : dut->{port}.m_storage) {"{"}\n' \
-                   f'    {port}.append(item);\n' \
-                   f'  {"}"}\n\n'
+            return f'{indent}io[{offset}] = dut->{port};\n'
 
-    def generate_update_return() -> str:
-        return "  return py::dict ("
+    def generate_update_id() -> str:
+        return f'{"}"}\n' \
+               f'\n' \
+               f'void update_id(TB *dut, const int port, uint32_t *io) {"{"}\n' \
+               f'  switch (port) {"{"}\n'
 
-    def generate_update_dict(port: str, width: str) -> str:
-        if width != "INW" and width != "OUTW":
-            return f'    "{port}"_a = dut->{port}'
-        else:
-            return f'    "{port}"_a = {port}'
+    def generate_update_case(handle: int, port: str, width: str, offset: int) -> str:
+        return f'  case {handle}:\n' \
+               f'{generate_update_store(port, width, offset, "    ")}' \
+               f'    break;\n'
 
     def generate_update_end() -> str:
-        return "\n  );\n}\n"
+        return "  }\n}\n"
 
-    def create_cpp(module: str, ports: Dict[str, str]) -> str:
+    def create_cpp(module: str, portlist: Dict[str, Tuple[str, int]]) -> str:
         body = ''
 
+        # offset of each port within the snapshot buffer of 32 bit words
+        offsets: List[int] = [0]
+        for _, size in portlist.values():
+            offsets.append(offsets[-1] + ceil(size / 32))
+
         body += generate_intro(module)
 
-        for port, width in ports.items():
-            body += generate_prep_if(port, width)
-            body += generate_prep_body(port, width)
+        for offset, (port, (width, size)) in zip(offsets, portlist.items()):
+            body += generate_port_table(port, width, size, offset)
 
-        body += generate_update()
+        body += generate_prep()
 
-        for port, width in ports.items():
-            body += generate_update_list(port, width)
+        for handle, (port, (width, _)) in enumerate(portlist.items()):
+            body += generate_prep_case(handle, port, width)
 
-        body += generate_update_return()
+        body += generate_update()
+
+        for offset, (port, (width, _)) in zip(offsets, portlist.items()):
+            body += generate_update_store(port, width, offset)
 
-        port = list(ports.keys())[0]
-        body += '\n' + generate_update_dict(port, ports[port])
-        del ports[port]
+        body += generate_update_id()
 
-        for port, width in ports.items():
-            body += ',\n' + generate_update_dict(port, width)
+        for handle, (offset, (port, (width, _))) in enumerate(zip(offsets, portlist.items())):
+            body += generate_update_case(handle, port, width, offset)
 
         body += generate_update_end()
         return body
 
     def parse_header(module: str, clock: str, header: TextIO) \
-            -> Tuple[str, Dict[str, str]]:
+            -> Tuple[str, Dict[str, Tuple[str, int]]]:
 
         in8 = string('    VL_IN8(').map(lambda x: 'IN8')
         in16 = string('    VL_IN16(').map(lambda x: 'IN16')
@@ -217,6 +1047,8 @@ def parse(module: str, clock: str, header: TextIO) -> str:
 
         varname = regex(r'[a-zA-Z_0-9]+').desc('variable name')
 
+        bit = (string(',') >> regex(r'[0-9]+').map(int)).desc('bit index')
+
         lines = header.readlines()
 
         portlist = {}
@@ -224,8 +1056,8 @@ def parse(module: str, clock: str, header: TextIO) -> str:
             # Collapse differences between different verilator versions
             line = re.sub(r'(\sVL_[A-Z0-9]*)\([\(\&]*([a-zA-Z0-9_]+)\)?,', r'\1(\2,', line)
             try:
-                port_def, _ = seq(ports, varname).parse_partial(line)
-                portlist[port_def[1]] = port_def[0]
+                port_def, _ = seq(ports, varname, bit, bit).parse_partial(line)
+                portlist[port_def[1]] = (port_def[0], port_def[2] - port_def[3] + 1)
             except ParseError:
                 pass
 
@@ -244,10 +1076,58 @@ def parse(module: str, clock: str, header: TextIO) -> str:
 def create(package: Optional[str] = None, module: str = 'testbench', clock: str = 'clk', workspace: str = '.',
            include: List[str] = ['./hdl'],
            parameter: Optional[Dict[str, Any]] = None,
-           define: Optional[Dict[str, Any]] = None) -> ModuleType:
+           define: Optional[Dict[str, Any]] = None,
+           trace: str = 'vcd',
+           trace_threads: Optional[int] = None,
+           trace_depth: Optional[int] = None,
+           trace_scope: Optional[str] = None,
+           threads: Optional[int] = None,
+           threads_dpi: Optional[str] = None,
+           hierarchical: bool = False,
+           cache: bool = True,
+           jobs: Optional[int] = None,
+           ccache: bool = False,
+           build: bool = False,
+           opt_fast: Optional[str] = None,
+           opt_slow: Optional[str] = None,
+           opt_global: Optional[str] = None,
+           savable: bool = False) -> ModuleType:
 
     package = module if package is None else package
 
+    assert trace in ('vcd', 'fst'), "trace format must be either 'vcd' or 'fst'"
+
+    tracing: List = ['--trace-fst'] if trace == 'fst' else ['--trace']
+    if trace_threads:
+        tracing = tracing + ['--trace-threads', f'{trace_threads}']
+    if trace_depth:
+        tracing = tracing + ['--trace-depth', f'{trace_depth}']
+
+    assert threads_dpi in (None, 'all', 'none', 'pure'), "threads_dpi must be one of 'all', 'none' or 'pure'"
+    assert not (build and hierarchical), "hierarchical blocks are built by vpw, so can not be combined with build"
+
+    threading: List = []
+    if threads:
+        threading = threading + ['--threads', f'{threads}']
+    if threads_dpi:
+        threading = threading + ['--threads-dpi', threads_dpi]
+    if hierarchical:
+        threading = threading + ['--hierarchical']
+
+    # make variables, including the object cache and the optimization levels of the verilated code
+    makeflags: List = [f'-j{jobs or os.cpu_count() or 1}']
+    if ccache:
+        if shutil.which('ccache'):
+            makeflags = makeflags + ['OBJCACHE=ccache']
+        else:
+            print("ccache not found, compiling without an object cache", file=sys.stderr)
+    if opt_fast is not None:
+        makeflags = makeflags + [f'OPT_FAST={opt_fast}']
+    if opt_slow is not None:
+        makeflags = makeflags + [f'OPT_SLOW={opt_slow}']
+    if opt_global is not None:
+        makeflags = makeflags + [f'OPT_GLOBAL={opt_global}']
+
     includes: List = []
     for dirs in include:
         includes = includes + [f'-I{dirs}']
@@ -288,15 +1168,34 @@ def create(package: Optional[str] = None, module: str = 'testbench', clock: str
     output_rc = subprocess.run(['python3-config', '--extension-suffix'], stdout=PIPE, text=True)
     output = f"{package}{output_rc.stdout.strip()}"
 
+    # reuse a previous build of the same sources, tools and options
+    if cache:
+        with open(f'{os.path.dirname(__file__)}/testbench.hh') as testbench, open(__file__) as wrapper:
+            digest = build_cache.key(include, verilator_root_rc.stdout, ' '.join(pyinc), output,
+                                     repr((module, clock, tracing, threading, parameters, defines, trace_scope,
+                                           threads, opt_fast, opt_slow, opt_global, savable)),
+                                     testbench.read(), wrapper.read(), sources=topfile(include, module))
+        cached = build_cache.lookup(digest, output)
+        if cached:
+            subprocess.run(['rm', '-f', f"{package}.{trace}"])
+            return load(package, cached)
+
     # remove any old build files
-    subprocess.run(['rm', '-rf', f'{workspace}/{package}', f'{workspace}/{output}', f"{package}.vcd"])
+    subprocess.run(['rm', '-rf', f'{workspace}/{package}', f'{workspace}/{output}', f"{package}.{trace}"])
 
     # verilate the SV module into C++
     verilate_module = ['verilator', '-Mdir', f'{workspace}/{package}']
     verilate_module = verilate_module + ['-CFLAGS', '-fPIC -std=c++17']
     verilate_module = verilate_module + includes
-    verilate_module = verilate_module + ['--trace']
+    verilate_module = verilate_module + tracing
+    verilate_module = verilate_module + threading
+    if savable:
+        verilate_module = verilate_module + ['--savable']
     verilate_module = verilate_module + ['-cc']
+    if build:
+        verilate_module = verilate_module + ['--build', '-j', f'{jobs or os.cpu_count() or 1}']
+        if makeflags[1:]:
+            verilate_module = verilate_module + ['-MAKEFLAGS', ' '.join(makeflags[1:])]
     verilate_module = verilate_module + parameters
     verilate_module = verilate_module + defines
     verilate_module = verilate_module + topfile(include, module)
@@ -307,29 +1206,76 @@ def create(package: Optional[str] = None, module: str = 'testbench', clock: str
         with open(f'{workspace}/{package}/{module}.cc', 'w') as code:
             code.write(parse(module, clock, header))
 
-    # compile the verilated module into object files
-    subprocess.run(['make', '--no-print-directory', '-C', f'{workspace}/{package}', '-f', f'V{module}.mk'])
+    def makevar(variable: str, makefile: str = f'V{module}.mk') -> List[str]:
+        """ Query the value of a variable from the verilated module makefile """
+        query = ['make', '--no-print-directory', '-s', '-C', f'{workspace}/{package}', '-f', makefile] + makeflags
+        query = query + [f'--eval=vpw-{variable}: ; @echo $({variable})', f'vpw-{variable}']
+        return subprocess.run(query, stdout=PIPE, text=True).stdout.split()
+
+    # the verilator runtime only depends on its version and the flags it is compiled with, so it is built once
+    # into a library that is kept in the build cache and linked by every later design using the same flags
+    runtime = f'{workspace}/{package}/libverilated.a'
+    if cache:
+        runtime_digest = build_cache.key([], verilator_root_rc.stdout, *makevar('VK_GLOBAL_OBJS'),
+                                         *makevar('CPPFLAGS'), *makevar('CXXFLAGS'), *makevar('OPT_GLOBAL'))
+        runtime = build_cache.lookup(runtime_digest, 'libverilated.a') or runtime
+
+    # compile the verilated module into object files unless verilator has already done so, hierarchical blocks
+    # are built first by their own makefile
+    make_module = ['make', '--no-print-directory', '-C', f'{workspace}/{package}'] + makeflags
+    if not build:
+        if hierarchical:
+            subprocess.run(make_module + ['-f', f'V{module}_hier.mk', 'hier_build'])
+        else:
+            targets = [f'V{module}__ALL.a'] + ([] if os.path.isfile(runtime) else ['libverilated.a'])
+            subprocess.run(make_module + ['-f', f'V{module}.mk'] + targets)
+
+    if cache and not runtime.startswith(build_cache.directory) and os.path.isfile(runtime):
+        runtime = build_cache.store(runtime_digest, runtime)
+
+    # libraries needed by the verilated module (tracing format dependent)
+    ldlibs = makevar('LDLIBS')
+
+    # libraries of the hierarchical blocks, linked after the top level module
+    hierlibs: List[str] = []
+    if hierarchical:
+        hierlibs = [f'{workspace}/{package}/{lib}' for lib in makevar('VM_HIER_LIBS', f'V{module}_hier.mk')]
 
     # compile the VPW testbench interface file and object files into a library
     compile_package = ['g++', '-O3', '-Wall']
     compile_package = compile_package + ['-D', f'PACKAGE={package}']
     compile_package = compile_package + ['-D', f'CLOCK={clock}']
+    if trace == 'fst':
+        compile_package = compile_package + ['-D', 'TRACE_FST']
+    if trace_scope:
+        compile_package = compile_package + ['-D', f'TRACE_SCOPE="{trace_scope}"']
+    if threads:
+        compile_package = compile_package + ['-D', f'THREADS={threads}']
+    if savable:
+        compile_package = compile_package + ['-D', 'SAVABLE']
     compile_package = compile_package + ['-shared']
     compile_package = compile_package + ['-std=c++17']
     compile_package = compile_package + ['-fPIC']
     compile_package = compile_package + pyinc
-    compile_package = compile_package + ['-I.', f'-I{vinc}', f'-I{workspace}/{package}']
+    compile_package = compile_package + ['-I.', f'-I{vinc}', f'-I{vinc}/vltstd', f'-I{workspace}/{package}']
     compile_package = compile_package + [f'-I{os.path.dirname(__file__)}']
-    compile_package = compile_package + [f'{vinc}/verilated.cpp']
-    compile_package = compile_package + [f'{vinc}/verilated_vcd_c.cpp']
-    compile_package = compile_package + [f'{vinc}/verilated_threads.cpp']
     compile_package = compile_package + [f'{workspace}/{package}/{module}.cc']
     compile_package = compile_package + [f'{workspace}/{package}/V{module}__ALL.a']
+    compile_package = compile_package + hierlibs
+    compile_package = compile_package + [runtime]
+    compile_package = compile_package + ldlibs
     compile_package = compile_package + ['-o', f'{workspace}/{output}']
     subprocess.run(compile_package)
 
-    # targeted module load from workspace location
-    spec = importlib.util.spec_from_file_location(package, f'{workspace}/{output}')
+    if cache and os.path.isfile(f'{workspace}/{output}'):
+        return load(package, build_cache.store(digest, f'{workspace}/{output}'))
+
+    return load(package, f'{workspace}/{output}')
+
+
+def load(package: str, path: str) -> ModuleType:
+    """ Targeted load of a built DUT package from its file location """
+    spec = importlib.util.spec_from_file_location(package, path)
     dut = importlib.util.module_from_spec(spec)
     spec.loader.exec_module(dut)
 
@@ -342,30 +1288,64 @@ class Slice:
     def __init__(self, name: str, width: int = 1, concat: int = 1) -> None:
         """Create the slice task object."""
         self._name = name
+        self._port: Union[str, int] = name
         self._width = width
         self._concat = concat
+        self._mask = (1 << width) - 1
         self._apply: int = 0
+        self._dirty = False  # written since the bus was last prepared
         self._receive: int = 0
+        self._io: Any = None  # port list state of the last tick
+        self._decoded = True  # the bus has been decoded from the port list state
+        self._sim: Optional[Simulator] = None  # bound by init
 
     def __len__(self) -> int:
         """Customize length operator, returns the number of slices."""
         return self._concat
 
     def __setitem__(self, key: int, value: int) -> None:
-        """Customize item write operator, only valid for inputs."""
-        zero_mask = ~(((1 << self._width) - 1) << (key * self._width))
-        self._apply = self._apply & zero_mask
-        self._apply = self._apply | (value << (key * self._width))
-        prep(self._name, pack(self._concat * self._width, self._apply))
+        """Customize item write operator, only valid for inputs. The bus is
+        prepared once just before the next tick, or the first tick once
+        registered when written before."""
+        shift = key * self._width
+        self._apply = (self._apply & ~(self._mask << shift)) | (value << shift)
 
-    def __getitem__(self, key: int) -> int:
-        """Customize item read operator."""
-        mask = (1 << self._width) - 1
-        shift = (key * self._width)
-        return (self._receive >> shift) & mask
+        if not self._dirty:
+            self._dirty = True
+            if self._sim is not None:
+                self._sim._slices.append(self)
 
-    def init(self, _) -> Generator:
-        """Background task function returns a generator."""
+    def __getitem__(self, key: int) -> int:
+        """Customize item read operator, the bus is decoded when first read
+        after a tick."""
+        if not self._decoded:
+            self._receive = unpack(self._concat * self._width, self._io[self._port])
+            self._decoded = True
+
+        return (self._receive >> (key * self._width)) & self._mask
+
+    def quiescent(self) -> bool:
+        """Nothing is written to be prepared, reading the bus does not need
+        the slice to be resumed every tick."""
+        return not self._dirty
+
+    def _flush(self) -> None:
+        """Prepare the written bus value."""
+        self._dirty = False
+        self._sim._prepared[self._port] = pack(self._concat * self._width, self._apply)
+
+    def init(self, sim: Simulator) -> Generator:
+        """Background task function returns a generator, the slice is bound
+        to the simulation straight away so it can be written before the
+        generator is started."""
+        self._sim = sim
+        self._port = sim.port(self._name)
+        if self._dirty and self not in sim._slices:
+            sim._slices.append(self)
+
+        return self._receiver()
+
+    def _receiver(self) -> Generator:
         while True:
-            io = yield
-            self._receive = unpack(self._concat * self._width, io[self._name])
+            self._io = yield
+            self._decoded = False
@@ -3,8 +3,7 @@ AXI4Lite Slave Interface
 """
 
 from collections import deque
-from types import ModuleType
-from typing import Callable, Deque, Generator, Optional
+from typing import Any, Callable, Deque, Dict, Generator, Optional
 
 import vpw
 
@@ -22,78 +21,7 @@ class Master:
         self.queue_r: Deque[int] = deque()   # read data channel
         self.queue_ar: Deque[int] = deque()  # read address channel
 
-    def _w(self) -> Generator:
-
-        while True:
-            if not self.queue_w:
-                self._dut.prep(f"{self.interface}_wdata", vpw.pack(self.data_width, 0))
-                self._dut.prep(f"{self.interface}_wstrb", [0])
-                self._dut.prep(f"{self.interface}_wvalid", [0])
-                io = yield
-            else:
-                value: int = self.queue_w[0]
-                strb: int = (1 << int(self.data_width/8)) - 1
-                self._dut.prep(f"{self.interface}_wdata", vpw.pack(self.data_width, value))
-                self._dut.prep(f"{self.interface}_wstrb", [strb])
-                self._dut.prep(f"{self.interface}_wvalid", [1])
-
-                io = yield
-                while io[f"{self.interface}_wready"] == 0:
-                    io = yield
-
-                self.queue_w.popleft()
-
-    def _aw(self) -> Generator:
-
-        while True:
-            if not self.queue_aw:
-                self._dut.prep(f"{self.interface}_awaddr", [0])
-                self._dut.prep(f"{self.interface}_awprot", [0])
-                self._dut.prep(f"{self.interface}_awvalid", [0])
-                io = yield
-            else:
-                addr: int = int(self.queue_aw[0] * (self.data_width/8))
-                self._dut.prep(f"{self.interface}_awaddr", [addr])
-                self._dut.prep(f"{self.interface}_awprot", [0])
-                self._dut.prep(f"{self.interface}_awvalid", [1])
-
-                io = yield
-                while io[f"{self.interface}_awready"] == 0:
-                    io = yield
-
-                self.queue_aw.popleft()
-
-    def _r(self) -> Generator:
-
-        # setup
-        self._dut.prep(f"{self.interface}_rready", [1])
-
-        while True:
-            io = yield
-
-            if io[f"{self.interface}_rready"] and io[f"{self.interface}_rvalid"]:
-                self.queue_r.append(vpw.unpack(self.data_width,
-                                               io[f"{self.interface}_rdata"]))
-
-    def _ar(self) -> Generator:
-
-        while True:
-            if not self.queue_ar:
-                self._dut.prep(f"{self.interface}_araddr", [0])
-                self._dut.prep(f"{self.interface}_arprot", [0])
-                self._dut.prep(f"{self.interface}_arvalid", [0])
-                io = yield
-            else:
-                addr: int = int(self.queue_ar[0] * (self.data_width/8))
-                self._dut.prep(f"{self.interface}_araddr", [addr])
-                self._dut.prep(f"{self.interface}_arprot", [0])
-                self._dut.prep(f"{self.interface}_arvalid", [1])
-
-                io = yield
-                while io[f"{self.interface}_arready"] == 0:
-                    io = yield
-
-                self.queue_ar.popleft()
+        self.pending_r: int = 0  # number of read requests without data
 
     def send_write(self, addr: int, value: int) -> None:
         """ Non-Blocking write address/data send """
@@ -104,6 +32,23 @@ class Master:
         """ Non-Blocking read address send """
         self.queue_ar.append(addr)
 
+    def quiescent(self) -> bool:
+        """ Nothing queued to be sent and no read data pending """
+        return not (self.queue_w or self.queue_aw or self.queue_ar or self.pending_r)
+
+    def checkpoint(self) -> Dict[str, Any]:
+        """ State of the interface, which must be quiescent """
+        assert self.quiescent(), "can not checkpoint with transfers in progress"
+        return {"queue_r": list(self.queue_r)}
+
+    def restore(self, state: Dict[str, Any]) -> None:
+        """ Return the interface to a checkpointed state """
+        self.queue_w.clear()
+        self.queue_aw.clear()
+        self.queue_ar.clear()
+        self.queue_r = deque(state["queue_r"])
+        self.pending_r = 0
+
     def recv_read(self) -> Optional[int]:
         """ Non-Blocking read data receive """
         if not self.queue_r:
@@ -126,25 +71,100 @@ class Master:
             if isinstance(value, int):
                 return value
 
-    def init(self, dut: ModuleType) -> Generator:
-        self._dut: ModuleType = dut
+    def init(self, sim: vpw.Simulator) -> Generator:
+        self._sim = sim
+        prep = sim.prep
+        pack = vpw.pack
+        unpack = vpw.unpack
+        data_width = self.data_width
+        bytes_per_word = self.data_width / 8
+        strb = (1 << int(self.data_width/8)) - 1
+        queue_w, queue_aw, queue_r, queue_ar = self.queue_w, self.queue_aw, self.queue_r, self.queue_ar
+
+        # resolve the handles of the driven ports once
+        (wdata, wstrb, wvalid,
+         awaddr, awprot, awvalid,
+         bready,
+         rready,
+         araddr, arprot, arvalid) = [sim.port(f"{self.interface}_{name}") for name in (
+             "wdata", "wstrb", "wvalid",
+             "awaddr", "awprot", "awvalid",
+             "bready",
+             "rready",
+             "araddr", "arprot", "arvalid")]
+
+        # the ports read every cycle, keyed by name in the port list state
+        names = ("wready", "awready", "rready", "rvalid", "rdata", "arready")
+        (wready_key, awready_key, rready_key, rvalid_key,
+         rdata_key, arready_key) = [f"{self.interface}_{name}" for name in names]
 
-        ch_w = self._w()
-        ch_aw = self._aw()
-        ch_r = self._r()
-        ch_ar = self._ar()
+        # setup
+        prep(rready, [1])
+        prep(bready, [1])
 
-        next(ch_w)
-        next(ch_aw)
-        next(ch_r)
-        next(ch_ar)
+        # each channel is either sending or has its idle values applied, which
+        # the DUT holds so they are prepared once
+        sending_w = sending_aw = sending_ar = False
+        idle_w = idle_aw = idle_ar = False
 
-        self._dut.prep(f"{self.interface}_bready", [1])
+        # resumed once a transfer is queued rather than every tick when quiescent
+        wait = vpw.WaitQueue(queue_w, queue_aw, queue_ar)
 
         while True:
-            io = yield
+            if not sending_w:
+                if queue_w:
+                    prep(wdata, pack(data_width, queue_w[0]))
+                    prep(wstrb, [strb])
+                    prep(wvalid, [1])
+                    sending_w, idle_w = True, False
+                elif not idle_w:
+                    prep(wdata, pack(data_width, 0))
+                    prep(wstrb, [0])
+                    prep(wvalid, [0])
+                    idle_w = True
+
+            if not sending_aw:
+                if queue_aw:
+                    prep(awaddr, [int(queue_aw[0] * bytes_per_word)])
+                    prep(awprot, [0])
+                    prep(awvalid, [1])
+                    sending_aw, idle_aw = True, False
+                elif not idle_aw:
+                    prep(awaddr, [0])
+                    prep(awprot, [0])
+                    prep(awvalid, [0])
+                    idle_aw = True
+
+            if not sending_ar:
+                if queue_ar:
+                    prep(araddr, [int(queue_ar[0] * bytes_per_word)])
+                    prep(arprot, [0])
+                    prep(arvalid, [1])
+                    sending_ar, idle_ar = True, False
+                elif not idle_ar:
+                    prep(araddr, [0])
+                    prep(arprot, [0])
+                    prep(arvalid, [0])
+                    idle_ar = True
+
+            if queue_w or queue_aw or queue_ar or self.pending_r:
+                io = yield
+            else:
+                io = yield wait
+
+            if sending_w and io[wready_key]:
+                sending_w = False
+                queue_w.popleft()
+
+            if sending_aw and io[awready_key]:
+                sending_aw = False
+                queue_aw.popleft()
+
+            if io[rready_key] and io[rvalid_key]:
+                queue_r.append(unpack(data_width, io[rdata_key]))
+                self.pending_r -= 1
 
-            ch_w.send(io)
-            ch_aw.send(io)
-            ch_r.send(io)
-            ch_ar.send(io)
+            if sending_ar and io[arready_key]:
+                sending_ar = False
+                self.pending_r += 1
+                queue_ar.popleft()
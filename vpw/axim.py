@@ -4,12 +4,18 @@ AXIM Master Interface
 
 from collections import deque
 from math import ceil
-from types import ModuleType
-from typing import Any, Callable, Deque, Dict, Generator, List, Union
+from typing import Any, Callable, Deque, Dict, Generator, List, NamedTuple, Union
 
 import vpw
 
 
+class Burst(NamedTuple):
+    """ Address channel transfer of a burst """
+    addr: int
+    len: int  # number of beats less one, as on the AxLEN port
+    id: int
+
+
 class Master:
     def __init__(self, interface: str, data_width: int, addr_width: int) -> None:
         assert((data_width % 8) == 0)
@@ -22,13 +28,13 @@ class Master:
         self.queue_w: Deque[List[int]] = deque()
 
         # write address channel
-        self.queue_aw: Deque[Dict[str, Any]] = deque()
+        self.queue_aw: Deque[Burst] = deque()
 
         # read data channel, queues contained in list addressable via (A)RID
         self.queue_r: List[Deque[List[int]]] = [deque() for _ in range(16)]
 
         # read address channel
-        self.queue_ar: Deque[Dict[str, Any]] = deque()
+        self.queue_ar: Deque[Burst] = deque()
 
         # keep track of lengths of requested read bursts, list addressable via (A)RID
         self.pending_ar: List[Deque[int]] = [deque() for _ in range(16)]
@@ -46,119 +52,6 @@ class Master:
 
             return number
 
-    def _w(self) -> Generator:
-
-        self._dut.prep(f"{self.interface}_wstrb", [(1 << int(self.data_width/8) - 1)])
-
-        while True:
-            if not self.queue_w:
-                self._dut.prep(f"{self.interface}_wdata", vpw.pack(self.data_width, 0))
-                self._dut.prep(f"{self.interface}_wlast", [0])
-                self._dut.prep(f"{self.interface}_wvalid", [0])
-                io = yield
-            else:
-                # access current burst of data to be sent
-                burst_data: List[int] = self.queue_w[0]
-                burst_nb: int = len(burst_data)
-
-                for i, data in enumerate(burst_data):
-                    self._dut.prep(f"{self.interface}_wdata", vpw.pack(self.data_width, data))
-                    self._dut.prep(f"{self.interface}_wlast", [int((i+1) == burst_nb)])
-                    self._dut.prep(f"{self.interface}_wvalid", [1])
-
-                    io = yield
-                    while io[f"{self.interface}_wready"] == 0:
-                        io = yield
-
-                self.queue_w.popleft()
-
-    def _aw(self) -> Generator:
-
-        self._dut.prep(f"{self.interface}_awcache", [0])  # NON_CACHE_NON_BUFFER
-        self._dut.prep(f"{self.interface}_awqos", [0])  # NOT_QOS_PARTICIPANT
-        self._dut.prep(f"{self.interface}_awprot", [0])  # DATA_SECURE_NORMAL
-        self._dut.prep(f"{self.interface}_awsize", [int(self.data_width / 8)])  # BYTES PER BEAT
-        self._dut.prep(f"{self.interface}_awburst", [1])  # INCREMENTING
-
-        while True:
-            if not self.queue_aw:
-                self._dut.prep(f"{self.interface}_awaddr", [0])
-                self._dut.prep(f"{self.interface}_awlen", [0])
-                self._dut.prep(f"{self.interface}_awid", [0])
-                self._dut.prep(f"{self.interface}_awvalid", [0])
-                io = yield
-            else:
-                current_aw: Dict[str, Any] = self.queue_aw[0]
-
-                self._dut.prep(f"{self.interface}_awaddr", [current_aw["awaddr"]])
-                self._dut.prep(f"{self.interface}_awlen", [current_aw["awlen"]])
-                self._dut.prep(f"{self.interface}_awid", [current_aw["awid"]])
-                self._dut.prep(f"{self.interface}_awvalid", [1])
-
-                io = yield
-                while io[f"{self.interface}_awready"] == 0:
-                    io = yield
-
-                self.queue_aw.popleft()
-
-    def _r(self) -> Generator:
-        burst_id: int = 0
-
-        # store current burst of data being received
-        burst_data: List[int] = []
-
-        # setup
-        self._dut.prep(f"{self.interface}_rready", [1])
-
-        while True:
-            io = yield
-
-            if io[f"{self.interface}_rready"] and io[f"{self.interface}_rvalid"]:
-                data = vpw.unpack(self.data_width, io[f"{self.interface}_rdata"])
-                burst_data.append(data)
-
-                if len(burst_data) == 1:
-                    # first beat of a burst
-                    burst_id = io[f"{self.interface}_rid"]
-
-                    # check that there exists a pending read with the same ID
-                    assert(self.pending_ar[burst_id])
-                else:
-                    # check that beat ID is consistent with the bursts
-                    assert(burst_id == io[f"{self.interface}_rid"])
-
-                if io[f"{self.interface}_rlast"]:
-                    # check that received burst is the length requested
-                    assert(self.pending_ar[burst_id][0] == len(burst_data))
-
-                    self.queue_r[burst_id].append(burst_data)
-                    self.pending_ar[burst_id].popleft()
-                    burst_data = []
-
-    def _ar(self) -> Generator:
-
-        while True:
-            if not self.queue_ar:
-                self._dut.prep(f"{self.interface}_araddr", [0])
-                self._dut.prep(f"{self.interface}_arlen", [0])
-                self._dut.prep(f"{self.interface}_arid", [0])
-                self._dut.prep(f"{self.interface}_arvalid", [0])
-                io = yield
-            else:
-                current_ar: Dict[str, Any] = self.queue_ar[0]
-
-                self._dut.prep(f"{self.interface}_araddr", [current_ar["araddr"]])
-                self._dut.prep(f"{self.interface}_arlen", [current_ar["arlen"]])
-                self._dut.prep(f"{self.interface}_arid", [current_ar["arid"]])
-                self._dut.prep(f"{self.interface}_arvalid", [1])
-
-                io = yield
-                while io[f"{self.interface}_arready"] == 0:
-                    io = yield
-
-                self.pending_ar[current_ar["arid"]].append(current_ar["arlen"] + 1)
-                self.queue_ar.popleft()
-
     def send_write(self, addr: int, burst: List[int], write_id: int = 0) -> None:
         """
         Non-Blocking: Queue to send an addressed burst of data, the address is
@@ -170,9 +63,7 @@ class Master:
         assert(((addr % 4096) + int(len(burst) * self.data_width / 8)) <= 4096)
         assert(len(burst) <= 256)
         self.queue_w.append(burst)
-        self.queue_aw.append({"awaddr": int(addr),
-                              "awlen": int(len(burst) - 1),
-                              "awid": int(write_id)})
+        self.queue_aw.append(Burst(int(addr), int(len(burst) - 1), int(write_id)))
 
     def send_read(self, addr: int, length: int, read_id: int = 0) -> None:
         """
@@ -183,9 +74,31 @@ class Master:
         assert(((8 * addr) % self.data_width) == 0)
         assert(((addr % 4096) + int(length * self.data_width / 8)) <= 4096)
         assert(length <= 256)
-        self.queue_ar.append({"araddr": int(addr),
-                              "arlen": int(length - 1),
-                              "arid": int(read_id)})
+        self.queue_ar.append(Burst(int(addr), int(length - 1), int(read_id)))
+
+    def quiescent(self) -> bool:
+        """
+        Nothing is queued to be sent and there are no reads pending.
+        """
+        return not (self.queue_w or self.queue_aw or self.queue_ar or any(self.pending_ar))
+
+    def checkpoint(self) -> Dict[str, Any]:
+        """
+        State of the interface, which must be quiescent, i.e. the received read
+        bursts not yet collected.
+        """
+        assert self.quiescent(), "can not checkpoint with transfers in progress"
+        return {"queue_r": [list(queue) for queue in self.queue_r]}
+
+    def restore(self, state: Dict[str, Any]) -> None:
+        """
+        Return the interface to a checkpointed state.
+        """
+        self.queue_w.clear()
+        self.queue_aw.clear()
+        self.queue_ar.clear()
+        self.queue_r = [deque(queue) for queue in state["queue_r"]]
+        self.pending_ar = [deque() for _ in range(16)]
 
     def recv_read(self, read_id: int = 0) -> List[int]:
         """
@@ -197,15 +110,8 @@ class Master:
         else:
             return self.queue_r[read_id].popleft()
 
-    def write(self, tick: Callable, address: int, data: List[int], tag: int = 0) -> None:
-        """Blocking function to send (write) an array of data over the AXIM.
-
-        Args:
-            tick: Function called to progress the clock some period of time.
-            address: Absolute address in bytes.
-            data: List of data to send with one element per beat.
-            tag: Optional burst ID used to identify a transaction.
-        """
+    def _queue_write(self, address: int, data: List[int], tag: int) -> List[int]:
+        """ Queue the bursts writing an array of data, returning the last burst """
         # size of data array in bytes
         size = int(self.data_width * len(data) / 8)
 
@@ -228,21 +134,10 @@ class Master:
 
             self.send_write(burst_address, data[beat_addr:beat_addr + beat_size], tag)
 
-        # wait until all write data has been sent
-        while self.queue_w:
-            tick()
+        return self.queue_w[-1] if self.queue_w else []
 
-    def read(self, tick: Callable, address: int, size: int, tag: int = 0) -> List[int]:
-        """Blocking function to request (read) an array of data from over the AXIM.
-
-        Args:
-            tick: Function called to progress the clock some period of time.
-            address: Absolute address in bytes.
-            size: Data size in bytes.
-            tag: Optional burst ID used to identify a transaction.
-        Return:
-            List of data read from the module with one element per beat.
-        """
+    def _queue_read(self, address: int, size: int, tag: int) -> int:
+        """ Queue the bursts reading an array of data, returning the number of beats """
         # queue read requests
         burst_address = address
         burst_size = 0
@@ -260,8 +155,37 @@ class Master:
 
             self.send_read(burst_address, int(8 * burst_size / self.data_width), tag)
 
+        return ceil(8 * size / self.data_width)
+
+    def write(self, tick: Callable, address: int, data: List[int], tag: int = 0) -> None:
+        """Blocking function to send (write) an array of data over the AXIM.
+
+        Args:
+            tick: Function called to progress the clock some period of time.
+            address: Absolute address in bytes.
+            data: List of data to send with one element per beat.
+            tag: Optional burst ID used to identify a transaction.
+        """
+        self._queue_write(address, data, tag)
+
+        # wait until all write data has been sent
+        while self.queue_w:
+            tick()
+
+    def read(self, tick: Callable, address: int, size: int, tag: int = 0) -> List[int]:
+        """Blocking function to request (read) an array of data from over the AXIM.
+
+        Args:
+            tick: Function called to progress the clock some period of time.
+            address: Absolute address in bytes.
+            size: Data size in bytes.
+            tag: Optional burst ID used to identify a transaction.
+        Return:
+            List of data read from the module with one element per beat.
+        """
+        data_target = self._queue_read(address, size, tag)
+
         # collect all read bursts resulting from the queued requests
-        data_target = ceil(8 * size / self.data_width)
         data: List[int] = []
         while len(data) < data_target:
             tick()
@@ -269,23 +193,170 @@ class Master:
 
         return data
 
-    def init(self, dut: ModuleType) -> Generator:
-        self._dut: ModuleType = dut
+    async def write_async(self, address: int, data: List[int], tag: int = 0) -> None:
+        """Coroutine sending (writing) an array of data over the AXIM, completes
+        once its write data has been sent so that any number can overlap.
+
+        Args:
+            address: Absolute address in bytes.
+            data: List of data to send with one element per beat.
+            tag: Optional burst ID used to identify a transaction.
+        """
+        last = self._queue_write(address, data, tag)
+
+        # bursts are sent in order, so wait until the last is no longer queued
+        while any(burst is last for burst in self.queue_w):
+            await vpw.clock()
+
+    async def read_async(self, address: int, size: int, tag: int = 0) -> List[int]:
+        """Coroutine requesting (reading) an array of data from over the AXIM,
+        completes once all its data has been received. Reads that overlap must
+        use different tags as the data of a tag is returned in order.
+
+        Args:
+            address: Absolute address in bytes.
+            size: Data size in bytes.
+            tag: Optional burst ID used to identify a transaction.
+        Return:
+            List of data read from the module with one element per beat.
+        """
+        data_target = self._queue_read(address, size, tag)
+
+        data: List[int] = []
+        while len(data) < data_target:
+            await vpw.WaitQueue(self.queue_r[tag])
+            data = data + self.recv_read(tag)
+
+        return data
+
+    def init(self, sim: vpw.Simulator) -> Generator:
+        self._sim = sim
+        prep = sim.prep
+        pack = vpw.pack
+        unpack = vpw.unpack
+        data_width = self.data_width
+        queue_w, queue_aw, queue_r, queue_ar = self.queue_w, self.queue_aw, self.queue_r, self.queue_ar
+        pending_ar = self.pending_ar
+
+        # resolve the handles of the driven ports once
+        (wdata, wstrb, wlast, wvalid,
+         awaddr, awlen, awid, awcache, awqos, awprot, awsize, awburst, awvalid,
+         rready,
+         araddr, arlen, arid, arvalid) = [sim.port(f"{self.interface}_{name}") for name in (
+             "wdata", "wstrb", "wlast", "wvalid",
+             "awaddr", "awlen", "awid", "awcache", "awqos", "awprot", "awsize", "awburst", "awvalid",
+             "rready",
+             "araddr", "arlen", "arid", "arvalid")]
+
+        # the ports read every cycle, keyed by name in the port list state
+        names = ("wready", "awready", "rready", "rvalid", "rdata", "rid", "rlast", "arready")
+        (wready_key, awready_key, rready_key, rvalid_key,
+         rdata_key, rid_key, rlast_key, arready_key) = [f"{self.interface}_{name}" for name in names]
 
-        ch_w = self._w()
-        ch_aw = self._aw()
-        ch_r = self._r()
-        ch_ar = self._ar()
+        # setup
+        prep(wstrb, [(1 << int(self.data_width/8) - 1)])
+        prep(awcache, [0])  # NON_CACHE_NON_BUFFER
+        prep(awqos, [0])  # NOT_QOS_PARTICIPANT
+        prep(awprot, [0])  # DATA_SECURE_NORMAL
+        prep(awsize, [int(self.data_width / 8)])  # BYTES PER BEAT
+        prep(awburst, [1])  # INCREMENTING
+        prep(rready, [1])
+
+        # each channel is either sending or has its idle values applied, which
+        # the DUT holds so they are prepared once
+        sending_w = sending_aw = sending_ar = False
+        idle_w = idle_aw = idle_ar = False
+        beat = 0  # position within the write burst being sent
+
+        # read burst being received
+        burst_id = 0
+        burst_data: List[int] = []
 
-        next(ch_w)
-        next(ch_aw)
-        next(ch_r)
-        next(ch_ar)
+        # resumed once a transfer is queued rather than every tick when quiescent
+        wait = vpw.WaitQueue(queue_w, queue_aw, queue_ar)
 
         while True:
-            io = yield
+            if not sending_w:
+                if queue_w:
+                    burst = queue_w[0]
+                    prep(wdata, pack(data_width, burst[beat]))
+                    prep(wlast, [int((beat + 1) == len(burst))])
+                    prep(wvalid, [1])
+                    sending_w, idle_w = True, False
+                elif not idle_w:
+                    prep(wdata, pack(data_width, 0))
+                    prep(wlast, [0])
+                    prep(wvalid, [0])
+                    idle_w = True
+
+            if not sending_aw:
+                if queue_aw:
+                    current_aw = queue_aw[0]
+                    prep(awaddr, [current_aw.addr])
+                    prep(awlen, [current_aw.len])
+                    prep(awid, [current_aw.id])
+                    prep(awvalid, [1])
+                    sending_aw, idle_aw = True, False
+                elif not idle_aw:
+                    prep(awaddr, [0])
+                    prep(awlen, [0])
+                    prep(awid, [0])
+                    prep(awvalid, [0])
+                    idle_aw = True
+
+            if not sending_ar:
+                if queue_ar:
+                    current_ar = queue_ar[0]
+                    prep(araddr, [current_ar.addr])
+                    prep(arlen, [current_ar.len])
+                    prep(arid, [current_ar.id])
+                    prep(arvalid, [1])
+                    sending_ar, idle_ar = True, False
+                elif not idle_ar:
+                    prep(araddr, [0])
+                    prep(arlen, [0])
+                    prep(arid, [0])
+                    prep(arvalid, [0])
+                    idle_ar = True
+
+            if queue_w or queue_aw or queue_ar or any(pending_ar):
+                io = yield
+            else:
+                io = yield wait
+
+            if sending_w and io[wready_key]:
+                sending_w = False
+                beat += 1
+                if beat == len(queue_w[0]):
+                    queue_w.popleft()
+                    beat = 0
+
+            if sending_aw and io[awready_key]:
+                sending_aw = False
+                queue_aw.popleft()
+
+            if io[rready_key] and io[rvalid_key]:
+                burst_data.append(unpack(data_width, io[rdata_key]))
+
+                if len(burst_data) == 1:
+                    # first beat of a burst
+                    burst_id = io[rid_key]
+
+                    # check that there exists a pending read with the same ID
+                    assert(pending_ar[burst_id])
+                else:
+                    # check that beat ID is consistent with the bursts
+                    assert(burst_id == io[rid_key])
+
+                if io[rlast_key]:
+                    # check that received burst is the length requested
+                    assert(pending_ar[burst_id][0] == len(burst_data))
+
+                    queue_r[burst_id].append(burst_data)
+                    pending_ar[burst_id].popleft()
+                    burst_data = []
 
-            ch_w.send(io)
-            ch_aw.send(io)
-            ch_r.send(io)
-            ch_ar.send(io)
+            if sending_ar and io[arready_key]:
+                sending_ar = False
+                current_ar = queue_ar.popleft()
+                pending_ar[current_ar.id].append(current_ar.len + 1)
@@ -2,164 +2,524 @@
 Simplified AXIM (software) Slave Interface driving a Memory
 """
 
-from queue import Queue
-from types import ModuleType
-from typing import Any, Dict, Generator
+import mmap
+import random
+from collections import deque
+from math import gcd
+from typing import Any, BinaryIO, Callable, Deque, Dict, Generator, Iterator, List, MutableMapping, Optional, \
+    Tuple, Union
 
 import vpw
+from vpw.axim import Burst
 
+Image = Union[bytes, bytearray, memoryview, BinaryIO, Any]  # or any buffer such as a NumPy array
 
-class Memory:
-    def __init__(self, interface: str, data_width: int, addr_width: int) -> None:
-        self.interface = interface
-        self.data_width = data_width
-        self.addr_width = addr_width
-
-        self.queue_w: "Queue[Dict[str, Any]]" = Queue()  # write data channel
-        self.queue_aw: "Queue[Dict[str, Any]]" = Queue(4)  # write address channel
-        self.queue_ar: "Queue[Dict[str, Any]]" = Queue(4)  # read address channel
-
-        self.ram: Dict[int, int] = {}
-
-    def _w(self) -> Generator:
-        beat_nb = 0
-        address = 0
-        length = 0
-        last = 0
-
-        # setup
-        self._dut.prep(f"{self.interface}_wready", [1])
 
+def _chunks(data: Image, size: int) -> Iterator[memoryview]:
+    """ Bytes of an image, read from a binary file in chunks of a size """
+    if hasattr(data, "read"):
         while True:
-            io = yield
-
-            if io[f"{self.interface}_wready"] and io[f"{self.interface}_wvalid"]:
-                self.queue_w.put({"wdata": io[f"{self.interface}_wdata"],
-                                  "wlast": io[f"{self.interface}_wlast"]})
-
-            if beat_nb == 0 and not self.queue_aw.empty():
-                beat_nb = 1
-                burst = self.queue_aw.get()
-                address = burst["awaddr"]
-                length = burst["awlen"] + 1
-                self._dut.prep(f"{self.interface}_wready", [1])
-
-            if beat_nb > 0 and not self.queue_w.empty():
-
-                if beat_nb > length:
-                    assert(last)
-                    self._dut.prep(f"{self.interface}_wready", [0])
-                    last = 0
-                    beat_nb = 0
-                else:
-                    beat = self.queue_w.get()
-                    self.ram[int(8*address/self.data_width) + beat_nb - 1] = \
-                        vpw.unpack(self.data_width, beat["wdata"])
-                    last = beat["wlast"]
-                    beat_nb += 1
-
-    def _aw(self) -> Generator:
+            chunk = data.read(size)
+            if not chunk:
+                return
+            yield memoryview(chunk).cast("B")
+    else:
+        yield memoryview(data).cast("B")
 
-        # setup
-        self._dut.prep(f"{self.interface}_awready", [1])
 
-        while True:
-            io = yield
+class Pages(MutableMapping[int, int]):
+    """ Beats of a sparse memory by beat address, held in pages of bytes
+    allocated on demand. Every beat of an allocated page is present, reading as
+    zero until written, and deleting a beat zeroes it.
 
-            if io[f"{self.interface}_awready"] and io[f"{self.interface}_awvalid"]:
-                self.queue_aw.put({"awaddr": io[f"{self.interface}_awaddr"],
-                                   "awlen": io[f"{self.interface}_awlen"]})
+    When given a path the pages are held in that file through mmap, in the
+    order they are allocated so the whole of a 64 bit address space can be
+    used. The file is shared with forked processes, so it should not be used
+    with vpw.fork_tests. """
 
-            if self.queue_aw.full():
-                self._dut.prep(f"{self.interface}_awready", [0])
-            else:
-                self._dut.prep(f"{self.interface}_awready", [1])
-
-    def _r(self) -> Generator:
-        beat_nb = 0
-        address = 0
-        length = 0
-        read_id = 0
+    def __init__(self, data_width: int, page_size: int = 1 << 16, path: Optional[str] = None) -> None:
+        self.data_width = data_width
+        self.page_size = page_size
+        self._beat = (data_width + 7) // 8  # bytes of each beat
+        assert page_size % self._beat == 0, "page size must be a multiple of the beat size"
+        self._beats = page_size // self._beat  # of each page
+        self._mask = (1 << data_width) - 1
+        self._pages: Dict[int, memoryview] = {}
+
+        # the backing file grows by chunks of pages, each mapped once, as mmap
+        # offsets must be a multiple of the allocation granularity
+        self._file: Optional[BinaryIO] = open(path, "w+b") if path is not None else None
+        self._maps: List[mmap.mmap] = []
+        granule = page_size * mmap.ALLOCATIONGRANULARITY // gcd(page_size, mmap.ALLOCATIONGRANULARITY)
+        self._chunk = granule * max(1, (1 << 20) // granule)  # bytes of each chunk
+
+    def _page(self, number: int) -> memoryview:
+        """ Allocate a page of zeros """
+        if self._file is None:
+            page = memoryview(bytearray(self.page_size))
+        else:
+            offset = len(self._pages) * self.page_size
+            chunk, offset = divmod(offset, self._chunk)
+            if chunk == len(self._maps):
+                self._file.truncate((chunk + 1) * self._chunk)
+                self._maps.append(mmap.mmap(self._file.fileno(), self._chunk, offset=chunk * self._chunk))
+            page = memoryview(self._maps[chunk])[offset:offset + self.page_size]
+        self._pages[number] = page
+        return page
+
+    def __getitem__(self, index: int) -> int:
+        value = self.get(index)
+        if value is None:
+            raise KeyError(index)
+        return value
+
+    def get(self, index: int, default: Any = None) -> Any:
+        page = self._pages.get(index // self._beats)
+        if page is None:
+            return default
+        offset = (index % self._beats) * self._beat
+        return int.from_bytes(page[offset:offset + self._beat], "little")
+
+    def __setitem__(self, index: int, value: int) -> None:
+        number, offset = divmod(index, self._beats)
+        page = self._pages.get(number)
+        if page is None:
+            page = self._page(number)
+        offset *= self._beat
+        page[offset:offset + self._beat] = (value & self._mask).to_bytes(self._beat, "little")
+
+    def __delitem__(self, index: int) -> None:
+        if index // self._beats not in self._pages:
+            raise KeyError(index)
+        self[index] = 0
+
+    def __iter__(self) -> Iterator[int]:
+        for number in sorted(self._pages):
+            yield from range(number * self._beats, (number + 1) * self._beats)
+
+    def __len__(self) -> int:
+        return len(self._pages) * self._beats
+
+    def load(self, address: int, data: Image) -> None:
+        """ Write the bytes of an image, from a binary file or a buffer such as
+        a NumPy array, at a byte address """
+        for view in _chunks(data, self.page_size):
+            while view:
+                number, offset = divmod(address, self.page_size)
+                size = min(self.page_size - offset, len(view))
+                page = self._pages.get(number)
+                if page is None:
+                    page = self._page(number)
+                page[offset:offset + size] = view[:size]
+                view = view[size:]
+                address += size
+
+    def dump(self, address: int, size: int) -> bytes:
+        """ Read the bytes at a byte address, those of pages not allocated are
+        zero """
+        data = bytearray(size)
+        end = address + size
+        while address < end:
+            number, offset = divmod(address, self.page_size)
+            length = min(self.page_size - offset, end - address)
+            page = self._pages.get(number)
+            if page is not None:
+                start = size - (end - address)
+                data[start:start + length] = page[offset:offset + length]
+            address += length
+        return bytes(data)
+
+    def extents(self) -> Dict[int, bytes]:
+        """ Bytes of each allocated page by byte address """
+        return {number * self.page_size: bytes(page) for number, page in self._pages.items()}
+
+    def clear(self) -> None:
+        """ Free all pages """
+        for page in self._pages.values():
+            page.release()
+        self._pages.clear()
+        for chunk in self._maps:
+            chunk.close()
+        self._maps.clear()
+        if self._file is not None:
+            self._file.truncate(0)
+
+    def close(self) -> None:
+        """ Free all pages and close any backing file """
+        self.clear()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class _Ram(MutableMapping[int, int]):
+    """ Beats of a native memory by beat address, held within the DUT in pages
+    as Pages are """
+
+    def __init__(self, bfm: Any, data_width: int, page_size: int) -> None:
+        self._bfm = bfm
+        self.data_width = data_width
+        self.page_size = page_size
+        self._mask = (1 << data_width) - 1
+
+    def __getitem__(self, index: int) -> int:
+        return vpw.unpack(self.data_width, self._bfm.read(index))
+
+    def __setitem__(self, index: int, value: int) -> None:
+        value &= self._mask
+        self._bfm.write(index, [(value >> s) & 0xffffffff for s in range(0, self.data_width, 32)])
+
+    def __delitem__(self, index: int) -> None:
+        self._bfm.erase(index)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._bfm.indices())
+
+    def __len__(self) -> int:
+        return len(self._bfm)
+
+    def load(self, address: int, data: Image) -> None:
+        for view in _chunks(data, self.page_size):
+            self._bfm.load(address, view)
+            address += len(view)
+
+    def dump(self, address: int, size: int) -> bytes:
+        return self._bfm.dump(address, size)
+
+    def extents(self) -> Dict[int, bytes]:
+        return self._bfm.extents()
+
+    def clear(self) -> None:
+        self._bfm.clear()
+
+
+class RowHit:
+    """ Latency of a read by whether it hits the row open in its bank, as a DDR
+    memory's does, the row read being left open. Rows of a row size in bytes
+    are interleaved across the banks. """
+
+    def __init__(self, hit: int, miss: int, row_size: int = 2048, banks: int = 8) -> None:
+        self.hit = hit
+        self.miss = miss
+        self.row_size = row_size
+        self.banks = banks
+        self.rows: Dict[int, int] = {}  # row open by bank
+
+    def __call__(self, address: int) -> int:
+        row, bank = divmod(address // self.row_size, self.banks)
+        if self.rows.get(bank) == row:
+            return self.hit
+        self.rows[bank] = row
+        return self.miss
+
+
+class Timing:
+    """ Timing of a memory, by default that of an ideal one.
+
+    The latency is the cycles added before the first beat of a read burst,
+    either fixed, uniformly random between a (low, high) pair or given by a
+    callable of the burst address such as RowHit. The write and read data
+    channels transfer at most their rate of beats per cycle, no write beats
+    are accepted and no new read beats presented for the first cycles of each
+    period of a (period, cycles) refresh, a read beat already presented being
+    held, and each ready is low in a cycle with the probability of a stall.
+    The random choices are seeded by seed. """
+
+    def __init__(self, latency: Union[int, Tuple[int, int], Callable[[int], int]] = 0,
+                 write_rate: float = 1.0, read_rate: float = 1.0, stall: float = 0.0,
+                 refresh: Optional[Tuple[int, int]] = None, seed: Optional[int] = None) -> None:
+        assert 0 < write_rate <= 1 and 0 < read_rate <= 1
+        assert 0 <= stall < 1
+        self.latency = latency
+        self.write_rate = write_rate
+        self.read_rate = read_rate
+        self.stall = stall
+        self.refresh = refresh
+        self.random = random.Random(seed)
+
+    def delay(self, address: int) -> int:
+        """ Latency of a read burst from a byte address """
+        if isinstance(self.latency, int):
+            return self.latency
+        elif isinstance(self.latency, tuple):
+            return self.random.randint(*self.latency)
+        return self.latency(address)
 
-        # setup
-        self._dut.prep(f"{self.interface}_rdata", vpw.pack(self.data_width, 0))
-        self._dut.prep(f"{self.interface}_rid", [0])
-        self._dut.prep(f"{self.interface}_rlast", [0])
-        self._dut.prep(f"{self.interface}_rvalid", [0])
 
-        while True:
-            io = yield
-
-            if io[f"{self.interface}_rready"] and io[f"{self.interface}_rvalid"]:
-
-                if beat_nb == length:
-                    beat_nb = 0
-                    self._dut.prep(f"{self.interface}_rdata", vpw.pack(self.data_width, 0))
-                    self._dut.prep(f"{self.interface}_rid", [0])
-                    self._dut.prep(f"{self.interface}_rlast", [0])
-                    self._dut.prep(f"{self.interface}_rvalid", [0])
-                else:
-                    beat = 0
-                    if int(8 * address / self.data_width) + beat_nb in self.ram:
-                        beat = self.ram[int(8 * address / self.data_width) + beat_nb]
-
-                    beat_nb += 1
-                    self._dut.prep(f"{self.interface}_rdata", vpw.pack(self.data_width, beat))
-                    self._dut.prep(f"{self.interface}_rid", [read_id])
-                    self._dut.prep(f"{self.interface}_rlast", [int(length == beat_nb)])
-                    self._dut.prep(f"{self.interface}_rvalid", [1])
-
-            if beat_nb == 0 and not self.queue_ar.empty():
-                beat_nb = 1
-                burst = self.queue_ar.get()
-                address = burst["araddr"]
-                length = burst["arlen"] + 1
-                read_id = burst["arid"]
-
-                beat = 0
-                if int(8 * address / self.data_width) + beat_nb - 1 in self.ram:
-                    beat = self.ram[int(8 * address / self.data_width) + beat_nb - 1]
-
-                self._dut.prep(f"{self.interface}_rdata", vpw.pack(self.data_width, beat))
-                self._dut.prep(f"{self.interface}_rid", [read_id])
-                self._dut.prep(f"{self.interface}_rlast", [int(length == beat_nb)])
-                self._dut.prep(f"{self.interface}_rvalid", [1])
-
-    def _ar(self) -> Generator:
+class Memory:
+    def __init__(self, interface: str, data_width: int, addr_width: int, native: bool = False,
+                 page_size: int = 1 << 16, path: Optional[str] = None, depth: int = 4,
+                 timing: Optional[Timing] = None) -> None:
+        """ The ram is held in pages of a page size in bytes, within a file when
+        given a path, and up to depth bursts are queued by each of the address
+        channels. The memory responds as an ideal one unless given a timing.
+        When native the memory is run within the DUT, rather than by Python
+        every cycle, and once registered the ram is held within the DUT, which
+        can not be file backed or timed. """
+        assert addr_width <= 64
+        assert depth > 0
+        if native and path is not None:
+            raise ValueError("a native memory can not be file backed")
+        if native and timing is not None:
+            raise ValueError("a native memory can not be timed")
+        self.interface = interface
+        self.data_width = data_width
+        self.addr_width = addr_width
+        self.page_size = page_size
+        self._native = native
+        self._bfm: Any = None  # native model once registered
+
+        self.depth = depth  # of the address channel queues
+        self.timing = timing
+        self.queue_aw: Deque[Burst] = deque()  # write address channel
+        self.queue_ar: Deque[Burst] = deque()  # read address channel
+
+        self.ram: Union[Pages, _Ram] = Pages(data_width, page_size, path)
+
+        # beats left to transfer of the write and read bursts in progress
+        self._beats_w: int = 0
+        self._beats_r: int = 0
+        self._asleep = False  # waiting for the DUT to request a burst
+
+    def quiescent(self) -> bool:
+        """ No bursts are queued or in progress, the memory being resumed only
+        once the DUT requests one """
+        if self._bfm is not None:
+            return bool(self._bfm.idle)
+        return self._asleep
+
+    def checkpoint(self) -> Dict[str, Any]:
+        """ State of the memory, which must have no bursts queued or in
+        progress. """
+        if self._bfm is not None:
+            assert self._bfm.idle, "can not checkpoint with bursts in progress"
+        else:
+            assert not (self.queue_aw or self.queue_ar) \
+                and not (self._beats_w or self._beats_r), "can not checkpoint with bursts in progress"
+        state: Dict[str, Any] = {"ram": self.ram.extents()}
+        if self.timing is not None:
+            state["random"] = self.timing.random.getstate()
+            if isinstance(self.timing.latency, RowHit):
+                state["rows"] = dict(self.timing.latency.rows)
+        return state
+
+    def restore(self, state: Dict[str, Any]) -> None:
+        """ Return the memory to a checkpointed state. """
+        self.queue_aw.clear()
+        self.queue_ar.clear()
+        self._beats_w = 0
+        self._beats_r = 0
+        self.ram.clear()
+        for address, data in state["ram"].items():
+            self.ram.load(address, data)
+        if self.timing is not None and "random" in state:
+            self.timing.random.setstate(state["random"])
+        if self.timing is not None and isinstance(self.timing.latency, RowHit) and "rows" in state:
+            self.timing.latency.rows = dict(state["rows"])
+
+    def load(self, address: int, data: Image) -> None:
+        """ Write an image, the bytes of a binary file or of a buffer such as a
+        NumPy array, at a byte address without going over the bus """
+        for view in _chunks(data, self.page_size):
+            assert address + len(view) <= 1 << self.addr_width
+            self.ram.load(address, view)
+            address += len(view)
+
+    def dump(self, address: int, size: int) -> bytes:
+        """ Read the bytes at a byte address without going over the bus """
+        assert address + size <= 1 << self.addr_width
+        return self.ram.dump(address, size)
+
+    def init(self, sim: vpw.Simulator) -> Generator:
+        if self._native:
+            handles = {name: sim.port(f"{self.interface}_{name}")
+                       for name in ("wready", "awready", "rdata", "rid", "rlast", "rvalid", "arready",
+                                    "wvalid", "wdata", "wlast",
+                                    "awvalid", "awaddr", "awlen", "awid",
+                                    "rready",
+                                    "arvalid", "araddr", "arlen", "arid")}
+            self._bfm = sim.testbench.AximMemory(handles, self.data_width, self.page_size, self.depth)
+
+            # the native ram takes over from that written so far
+            ram = _Ram(self._bfm, self.data_width, self.page_size)
+            for address, data in self.ram.extents().items():
+                ram.load(address, data)
+            if isinstance(self.ram, Pages):
+                self.ram.close()
+            self.ram = ram
+
+            return sim.attach(self._bfm)
+
+        return self._run(sim)
+
+    def _run(self, sim: vpw.Simulator) -> Generator:
+        self._sim = sim
+        prep = sim.prep
+        pack = vpw.pack
+        unpack = vpw.unpack
+        data_width = self.data_width
+        depth = self.depth
+        queue_aw, queue_ar = self.queue_aw, self.queue_ar
+        zero = pack(data_width, 0)
+
+        # resolve the handles of the driven ports once
+        (wready, awready,
+         rdata, rid, rlast, rvalid, arready) = [sim.port(f"{self.interface}_{name}") for name in (
+             "wready", "awready",
+             "rdata", "rid", "rlast", "rvalid", "arready")]
+
+        # with no bursts the memory is resumed once the DUT requests one
+        request = vpw.WaitAny(vpw.WaitFor(sim.port(f"{self.interface}_awvalid")),
+                              vpw.WaitFor(sim.port(f"{self.interface}_arvalid")))
+        wait = None
+
+        # the ports read every cycle, keyed by name in the port list state
+        names = ("wready", "wvalid", "wdata", "wlast",
+                 "awready", "awvalid", "awaddr", "awlen", "awid",
+                 "rready", "rvalid",
+                 "arready", "arvalid", "araddr", "arlen", "arid")
+        (wready_key, wvalid_key, wdata_key, wlast_key,
+         awready_key, awvalid_key, awaddr_key, awlen_key, awid_key,
+         rready_key, rvalid_key,
+         arready_key, arvalid_key, araddr_key, arlen_key, arid_key) = \
+            [f"{self.interface}_{name}" for name in names]
+
+        # write burst being received, beat_w counting the beats received and
+        # zero until the first
+        beat_w = 0
+        base_w = 0
+        length_w = 0
+
+        # read burst being sent, beat_r counting from one and zero when there
+        # is none, whether its beat is presented and the read data values
+        # applied, 0 idle, 1 a beat or 2 waiting between beats
+        beat_r = 0
+        base_r = 0
+        length_r = 0
+        valid_r = 0
+        applied_r = 0
+
+        # timing, the data channels transferring a beat while they hold a
+        # token and the cycle each queued read burst is due
+        timing = self.timing
+        timed = timing is not None
+        if timed:
+            chance = timing.random.random
+            write_rate, read_rate, stall = timing.write_rate, timing.read_rate, timing.stall
+            period, refresh = timing.refresh or (0, 0)
+            refilled = sim.cycles  # cycle the tokens were last refilled
+        tokens_w = tokens_r = 1.0
+        due_ar: Deque[int] = deque()
+        open_w = open_r = True  # data channels transferring in the next cycle
+        stall_w = stall_aw = stall_ar = False  # readies stalled in the next cycle
 
         # setup
-        self._dut.prep(f"{self.interface}_arready", [1])
-
-        while True:
-            io = yield
-
-            if io[f"{self.interface}_arready"] and io[f"{self.interface}_arvalid"]:
-                self.queue_ar.put({"araddr": io[f"{self.interface}_araddr"],
-                                   "arlen": io[f"{self.interface}_arlen"],
-                                   "arid": io[f"{self.interface}_arid"]})
-
-            if self.queue_ar.full():
-                self._dut.prep(f"{self.interface}_arready", [0])
-            else:
-                self._dut.prep(f"{self.interface}_arready", [1])
-
-    def init(self, dut: ModuleType) -> Generator:
-        self._dut: ModuleType = dut
-
-        ch_w = self._w()
-        ch_aw = self._aw()
-        ch_r = self._r()
-        ch_ar = self._ar()
-
-        next(ch_w)
-        next(ch_aw)
-        next(ch_r)
-        next(ch_ar)
+        prep(wready, [0])
+        prep(awready, [1])
+        prep(rdata, zero)
+        prep(rid, [0])
+        prep(rlast, [0])
+        prep(rvalid, [0])
+        prep(arready, [1])
+        ready_w, ready_aw, ready_ar = 0, 1, 1  # the ready values applied
 
         while True:
-            io = yield
-
-            ch_w.send(io)
-            ch_aw.send(io)
-            ch_r.send(io)
-            ch_ar.send(io)
+            self._asleep = wait is not None
+            io = yield wait
+
+            # write data channel, each beat stored as it is received into the
+            # burst at the head of the write address queue
+            if io[wready_key] and io[wvalid_key]:
+                if beat_w == 0:
+                    burst = queue_aw.popleft()
+                    base_w = (8 * burst.addr) // data_width
+                    length_w = burst.len + 1
+
+                self.ram[base_w + beat_w] = unpack(data_width, io[wdata_key])
+                beat_w += 1
+                self._beats_w = length_w - beat_w
+                tokens_w -= 1
+
+                if beat_w == length_w:
+                    assert io[wlast_key], "write burst longer than its length"
+                    beat_w = 0
+
+            # read data channel, the beat presented being transferred
+            if io[rready_key] and io[rvalid_key]:
+                self._beats_r -= 1
+                tokens_r -= 1
+                valid_r = 0
+                beat_r = beat_r + 1 if beat_r < length_r else 0
+
+            # write address channel
+            if io[awready_key] and io[awvalid_key]:
+                queue_aw.append(Burst(io[awaddr_key], io[awlen_key], io[awid_key]))
+
+            if timed:
+                blackout = bool(period) and (sim.cycles + 1) % period < refresh
+                elapsed, refilled = sim.cycles - refilled, sim.cycles
+                tokens_w = min(tokens_w + write_rate * elapsed, 1.0)
+                tokens_r = min(tokens_r + read_rate * elapsed, 1.0)
+                open_w = tokens_w >= 1 and not blackout
+                open_r = tokens_r >= 1 and not blackout
+                if stall:
+                    stall_w, stall_aw, stall_ar = chance() < stall, chance() < stall, chance() < stall
+
+            # ready for write data while there is a burst to fill, so the beats
+            # of consecutive bursts are received without a break
+            ready = int((beat_w > 0 or bool(queue_aw)) and open_w and not stall_w)
+            if ready != ready_w:
+                ready_w = ready
+                prep(wready, [ready])
+
+            ready = int(len(queue_aw) < depth and not stall_aw)
+            if ready != ready_aw:
+                ready_aw = ready
+                prep(awready, [ready])
+
+            # read data channel, the first beat of a queued burst following on
+            # from the last beat of the one before
+            if beat_r == 0 and queue_ar and (not timed or due_ar[0] <= sim.cycles):
+                beat_r = 1
+                burst = queue_ar.popleft()
+                base_r = (8 * burst.addr) // data_width
+                length_r = burst.len + 1
+                self._beats_r = length_r
+                prep(rid, [burst.id])
+                if timed:
+                    due_ar.popleft()
+
+            # a beat once presented is held until it is transferred, even
+            # through a refresh, no new beat being presented while refreshing
+            if not valid_r:
+                if beat_r and open_r:
+                    valid_r = applied_r = 1
+                    prep(rdata, pack(data_width, self.ram.get(base_r + beat_r - 1, 0)))
+                    prep(rlast, [int(length_r == beat_r)])
+                    prep(rvalid, [1])
+                elif beat_r:
+                    if applied_r != 2:
+                        applied_r = 2
+                        prep(rvalid, [0])
+                elif applied_r != 0:
+                    applied_r = 0
+                    prep(rdata, zero)
+                    prep(rid, [0])
+                    prep(rlast, [0])
+                    prep(rvalid, [0])
+
+            # read address channel
+            if io[arready_key] and io[arvalid_key]:
+                queue_ar.append(Burst(io[araddr_key], io[arlen_key], io[arid_key]))
+                if timed:
+                    due_ar.append(sim.cycles + 1 + timing.delay(io[araddr_key]))
+
+            ready = int(len(queue_ar) < depth and not stall_ar)
+            if ready != ready_ar:
+                ready_ar = ready
+                prep(arready, [ready])
+
+            # asleep until the next request once every burst is done and the
+            # idle values applied, unless the readies stall every cycle
+            idle = not (queue_aw or queue_ar or beat_w or beat_r or applied_r)
+            wait = request if idle and not (timed and stall) else None
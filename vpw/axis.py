@@ -3,20 +3,27 @@ AXIS Slave and Master Interface
 """
 
 from collections import deque
-from types import ModuleType
-from typing import Deque, Generator, List
+from typing import Any, Deque, Dict, Generator, List
 
 import vpw
 
 
 class Master:
-    def __init__(self, interface: str, data_width: int, concat: int = 1) -> None:
+    def __init__(self, interface: str, data_width: int, concat: int = 1, native: bool = False) -> None:
+        """ When native the streams are run within the DUT, rather than by
+        Python every cycle, and the queues are those of the native model once
+        registered. Native streams are no wider than 64 bits. """
         assert(concat > 0)
+        assert not native or data_width <= 64, "native streams are no wider than 64 bits"
+        self._interface = interface
+        self._width = data_width
         self._concat = concat
+        self._native = native
+        self._bfm: Any = None  # native model once registered
 
         self.queue: List[Deque[List[int]]] = [deque() for _ in range(concat)]
         self.current: List[List[int]] = [[] for _ in range(concat)]
-        self.pending: List[int] = [0] * concat
+        self._pending: List[int] = [0] * concat
         self._pause: List[bool] = [False] * concat
 
         # create sub-tasks
@@ -29,12 +36,43 @@ class Master:
         """ Turn on/off AXIS valid signal. """
         assert self._concat > position, "given concatenate position not supported"
         self._pause[position] = active
+        if self._bfm is not None:
+            self._bfm.pause(position, active)
 
     def send(self, data: List[int], position: int = 0) -> None:
         """ Pass in a list of data to send, one element per beat. """
         assert self._concat > position, "given concatenate position not supported"
         self.queue[position].append(data)
-        self.pending[position] += len(data)
+        if self._bfm is None:
+            self._pending[position] += len(data)
+
+    @property
+    def pending(self) -> List[int]:
+        """ Number of beats queued and not yet sent by each stream. """
+        if self._bfm is not None:
+            return [queue.beats for queue in self.queue]
+        return self._pending
+
+    def quiescent(self) -> bool:
+        """ No data is queued to be sent on any of the streams. """
+        return not any(self.queue)
+
+    def checkpoint(self) -> Dict[str, Any]:
+        """ State of the streams, none of which may be part way through sending
+        a list of data. """
+        for pos in range(self._concat):
+            assert self.pending[pos] == sum(len(data) for data in self.queue[pos]), \
+                "can not checkpoint part way through sending data"
+        return {"queue": [list(queue) for queue in self.queue],
+                "pending": list(self.pending),
+                "pause": list(self._pause)}
+
+    def restore(self, state: Dict[str, Any]) -> None:
+        """ Return the streams to a checkpointed state. """
+        self.queue = [deque(queue) for queue in state["queue"]]
+        self.current = [[] for _ in range(self._concat)]
+        self._pending = list(state["pending"])
+        self._pause = list(state["pause"])
 
     def _section(self, position: int = 0) -> Generator:
         while True:
@@ -57,18 +95,35 @@ class Master:
                         self._valid[position] = int(not self._pause[position])
                         yield
 
-                    self.pending[position] -= 1
+                    self._pending[position] -= 1
 
                 self.queue[position].popleft()
 
-    def init(self, dut: ModuleType) -> Generator:
+    def init(self, sim: vpw.Simulator) -> Generator:
+        if self._native:
+            handles = {name: sim.port(f"{self._interface}_{name}")
+                       for name in ("tdata", "tlast", "tvalid", "tready")}
+            self._bfm = sim.testbench.AxisSource(handles, self._width, self._concat)
+
+            # the native queues take over from those queued so far
+            for pos in range(self._concat):
+                for data in self.queue[pos]:
+                    self._bfm.queue(pos).append(data)
+                self._bfm.pause(pos, self._pause[pos])
+            self.queue = [self._bfm.queue(pos) for pos in range(self._concat)]
+
+            return sim.attach(self._bfm)
+
+        return self._run(sim)
+
+    def _run(self, sim: vpw.Simulator) -> Generator:
 
         # init sub-tasks
         ports = []
-        ports.append(self._data.init(dut))
-        ports.append(self._last.init(dut))
-        ports.append(self._valid.init(dut))
-        ports.append(self._ready.init(dut))
+        ports.append(self._data.init(sim))
+        ports.append(self._last.init(sim))
+        ports.append(self._valid.init(sim))
+        ports.append(self._ready.init(sim))
         for port in ports:
             next(port)
 
@@ -78,7 +133,11 @@ class Master:
             next(streams[pos])
 
         while True:
-            io = yield
+            if self.quiescent():
+                # resumed once data is queued rather than every tick
+                io = yield vpw.WaitQueue(*self.queue)
+            else:
+                io = yield
 
             # update sub-tasks
             for port in ports:
@@ -89,13 +148,22 @@ class Master:
 
 
 class Slave:
-    def __init__(self, interface: str, data_width: int, concat: int = 1) -> None:
+    def __init__(self, interface: str, data_width: int, concat: int = 1, native: bool = False) -> None:
+        """ When native the streams are run within the DUT, rather than by
+        Python every cycle, and the queues are those of the native model once
+        registered. Native streams are no wider than 64 bits. """
         assert(concat > 0)
+        assert not native or data_width <= 64, "native streams are no wider than 64 bits"
+        self._interface = interface
+        self._width = data_width
         self._concat = concat
+        self._native = native
+        self._bfm: Any = None  # native model once registered
 
         self.queue: List[Deque[List[int]]] = [deque() for _ in range(concat)]
         self.current: List[List[int]] = [[] for _ in range(concat)]
-        self.pending: List[int] = [0] * concat
+        self._pending: List[int] = [0] * concat
+        self._active: List[bool] = [False] * concat
 
         # create sub-tasks
         self._data = vpw.Slice(f"{interface}_tdata", data_width, concat)
@@ -106,7 +174,40 @@ class Slave:
     def ready(self, active: bool, position: int = 0) -> None:
         """ Turn on/off AXIS ready signal. """
         assert self._concat > position, "given concatenate position not supported"
-        self._ready[position] = int(active)
+        self._active[position] = active
+        if self._bfm is not None:
+            self._bfm.ready(position, active)
+        elif not self._native:
+            self._ready[position] = int(active)
+
+    @property
+    def pending(self) -> List[int]:
+        """ Number of beats received and not yet returned by each stream. """
+        if self._bfm is not None:
+            return [queue.beats + len(self._bfm.current(pos)) for pos, queue in enumerate(self.queue)]
+        return self._pending
+
+    def quiescent(self) -> bool:
+        """ The ready signal is off for all of the streams. """
+        return not any(self._active)
+
+    def checkpoint(self) -> Dict[str, Any]:
+        """ State of the streams, including any partly received data. """
+        if self._bfm is not None:
+            current = [self._bfm.current(pos) for pos in range(self._concat)]
+        else:
+            current = [list(current) for current in self.current]
+        return {"queue": [list(queue) for queue in self.queue],
+                "current": current,
+                "pending": list(self.pending),
+                "active": list(self._active)}
+
+    def restore(self, state: Dict[str, Any]) -> None:
+        """ Return the streams to a checkpointed state. """
+        self.queue = [deque(queue) for queue in state["queue"]]
+        self.current = [list(current) for current in state["current"]]
+        self._pending = list(state["pending"])
+        self._active = list(state["active"])
 
     def recv(self, position: int = 0) -> List[int]:
         """ Returns a list of data recived, one element per beat. """
@@ -115,23 +216,42 @@ class Slave:
             return []
         else:
             stream: List[int] = self.queue[position].popleft()
-            self.pending[position] -= len(stream)
+            if self._bfm is None:
+                self._pending[position] -= len(stream)
             return stream
 
-    def init(self, dut: ModuleType) -> Generator:
-        # setup
-        for pos in range(self._concat):
-            self._ready[pos] = 0
+    def init(self, sim: vpw.Simulator) -> Generator:
+        if self._native:
+            handles = {name: sim.port(f"{self._interface}_{name}")
+                       for name in ("tdata", "tlast", "tvalid", "tready")}
+            self._bfm = sim.testbench.AxisSink(handles, self._width, self._concat)
+
+            # the native queues take over from those received so far
+            for pos in range(self._concat):
+                for data in self.queue[pos]:
+                    self._bfm.queue(pos).append(data)
+                self._bfm.set_current(pos, self.current[pos])
+                self._bfm.ready(pos, self._active[pos])
+            self.queue = [self._bfm.queue(pos) for pos in range(self._concat)]
+
+            return sim.attach(self._bfm)
 
+        return self._run(sim)
+
+    def _run(self, sim: vpw.Simulator) -> Generator:
         # init sub-tasks
         ports = []
-        ports.append(self._data.init(dut))
-        ports.append(self._last.init(dut))
-        ports.append(self._valid.init(dut))
-        ports.append(self._ready.init(dut))
+        ports.append(self._data.init(sim))
+        ports.append(self._last.init(sim))
+        ports.append(self._valid.init(sim))
+        ports.append(self._ready.init(sim))
         for port in ports:
             next(port)
 
+        # setup
+        for pos in range(self._concat):
+            self._ready[pos] = int(self._active[pos])
+
         while True:
             io = yield
 
@@ -142,7 +262,7 @@ class Slave:
             for pos in range(self._concat):
                 if self._valid[pos] and self._ready[pos]:
                     self.current[pos].append(self._data[pos])
-                    self.pending[pos] += 1
+                    self._pending[pos] += 1
 
                     if self._last[pos]:
                         self.queue[pos].append(list(self.current[pos]))
@@ -0,0 +1,127 @@
+"""
+Simulation Benchmark Helpers
+"""
+
+import sys
+import time
+from typing import Any, Dict, Generator, List, Sequence, Tuple
+
+import vpw
+import vpw.axi4lite
+import vpw.axim
+import vpw.axim2ram
+
+
+def threads(counts: Sequence[int] = (1, 2, 4), cycles: int = 100000, **kwargs: Any) -> Tuple[int, Dict[int, float]]:
+    """
+    Build the module once per thread count and time the same number of cycles
+    on each, returning the fastest thread count and the seconds taken by all.
+
+    Any keyword arguments are passed to vpw.create(), the package name is
+    suffixed with the thread count so every build is loaded separately.
+    """
+
+    package = kwargs.pop('package', None) or kwargs.get('module', 'testbench')
+
+    timings: Dict[int, float] = {}
+    for count in counts:
+        dut = vpw.create(package=f'{package}_threads{count}', threads=count, **kwargs)
+
+        vpw.init(dut, trace=False)
+        start = time.perf_counter()
+        vpw.run(cycles)
+        timings[count] = time.perf_counter() - start
+        vpw.finish()
+
+        print(f"threads {count}: {cycles} cycles in {timings[count]:.3f}s "
+              f"({cycles / timings[count]:.0f} cycles/s)", file=sys.stderr)
+
+    best = min(timings, key=timings.get)  # type: ignore
+    print(f"fastest with {best} threads", file=sys.stderr)
+
+    return best, timings
+
+
+class _Loopback:
+    """ Stands in for the simulation of an interface driver, the port list
+    state is a dict of the values prepared by the driver and the fixed values of
+    the ports driven by the other side """
+
+    def __init__(self, io: Dict[str, Any]) -> None:
+        self.io: Dict[str, Any] = dict(io)
+        self._names: List[str] = []
+        self._prepared: Dict[int, List[int]] = {}
+
+    def port(self, name: str) -> int:
+        self._names.append(name)
+        return len(self._names) - 1
+
+    def prep(self, port: int, value: List[int]) -> None:
+        self._prepared[port] = value
+
+    def tick(self) -> Dict[str, Any]:
+        for port, value in self._prepared.items():
+            self.io[self._names[port]] = value[0] if len(value) == 1 else value
+        self._prepared.clear()
+        return self.io
+
+
+def _driver(interface: Any, io: Dict[str, Any], cycles: int) -> float:
+    """ Seconds spent within the driver of an interface over the cycles """
+
+    sim = _Loopback(io)
+    task: Generator = interface.init(sim)
+    next(task)
+
+    seconds = 0.0
+    for _ in range(cycles):
+        state = sim.tick()
+        start = time.perf_counter()
+        task.send(state)
+        seconds += time.perf_counter() - start
+
+    return seconds
+
+
+def drivers(cycles: int = 100000) -> Dict[str, float]:
+    """
+    Time the Python interface drivers with every channel busy, returning the
+    nanoseconds each spends per cycle. Each driver runs on its own against a
+    loopback rather than a DUT, so only the time within the driver is counted.
+    """
+
+    # AXIM master writing and reading bursts
+    axim = vpw.axim.Master("axim", 128, 16)
+    for _ in range(cycles // 16):
+        axim.send_write(0, list(range(16)))
+    for _ in range(cycles):
+        axim.send_read(0, 1)
+    axim.pending_ar[0].extend([1] * cycles)  # as if the read requests were sent
+
+    # AXI4Lite master writing and reading
+    axi4lite = vpw.axi4lite.Master("axi4lite", 32, 16)
+    for n in range(cycles):
+        axi4lite.send_write(n, n)
+        axi4lite.send_read(n)
+
+    # memory accepting back to back write and read bursts
+    memory = vpw.axim2ram.Memory("axim2ram", 128, 16)
+
+    timings: Dict[str, float] = {}
+    for name, interface, io in (
+            ("axim.Master", axim,
+             {"axim_wready": 1, "axim_awready": 1, "axim_arready": 1, "axim_rvalid": 1,
+              "axim_rdata": [1, 2, 3, 4], "axim_rid": 0, "axim_rlast": 1}),
+            ("axi4lite.Master", axi4lite,
+             {"axi4lite_wready": 1, "axi4lite_awready": 1, "axi4lite_arready": 1,
+              "axi4lite_rvalid": 1, "axi4lite_rdata": 1}),
+            ("axim2ram.Memory", memory,
+             {"axim2ram_awvalid": 1, "axim2ram_awaddr": 0, "axim2ram_awlen": 15, "axim2ram_awid": 0,
+              "axim2ram_wvalid": 1, "axim2ram_wdata": [1, 2, 3, 4], "axim2ram_wlast": 1,
+              "axim2ram_arvalid": 1, "axim2ram_araddr": 0, "axim2ram_arlen": 15, "axim2ram_arid": 0,
+              "axim2ram_rready": 1})):
+        timings[name] = 1e9 * _driver(interface, io, cycles) / cycles
+
+        print(f"{name}: {timings[name]:.0f} ns/cycle", file=sys.stderr)
+
+    return timings
@@ -0,0 +1,105 @@
+"""
+Content Addressed Cache of Built DUT Packages
+"""
+
+import hashlib
+import os
+import shutil
+from typing import Iterable, List, Optional, Tuple
+
+# Directory holding one sub-directory of built files per cache key
+directory: str = os.environ.get('VPW_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'vpw'))
+
+# Least recently used entries are evicted when either limit is exceeded,
+# a limit of zero disables it
+max_entries: int = 32
+max_size: int = 1 << 30
+
+# Source file extensions that are hashed when found in an include directory
+extensions: Tuple[str, ...] = ('.sv', '.svh', '.v', '.vh')
+
+
+def key(include: Iterable[str], *parts: str, sources: Iterable[str] = ()) -> str:
+    """ Hash the HDL sources found under the include directories and the source files given to verilator, by
+    absolute path and contents, along with the given build parts """
+    digest = hashlib.sha256()
+
+    for filename in sources:
+        digest.update(os.path.abspath(filename).encode())
+        if os.path.isfile(filename):
+            with open(filename, 'rb') as source:
+                digest.update(source.read())
+
+    for dirname in include:
+        digest.update(os.path.abspath(dirname).encode())
+        for root, _, files in sorted(os.walk(dirname)):
+            for name in sorted(files):
+                if name.endswith(extensions):
+                    digest.update(os.path.join(os.path.relpath(root, dirname), name).encode())
+                    with open(os.path.join(root, name), 'rb') as source:
+                        digest.update(source.read())
+
+    for part in parts:
+        digest.update(b'\0')
+        digest.update(part.encode())
+
+    return digest.hexdigest()
+
+
+def lookup(digest: str, filename: str) -> Optional[str]:
+    """ Path to a cached file if present, marking the entry as recently used """
+    path = os.path.join(directory, digest, filename)
+    if not os.path.isfile(path):
+        return None
+
+    os.utime(os.path.join(directory, digest))
+    return path
+
+
+def store(digest: str, path: str) -> str:
+    """ Copy a built file into the cache and return its cached path """
+    entry = os.path.join(directory, digest)
+    os.makedirs(entry, exist_ok=True)
+
+    # copy then rename so concurrent sessions never load a partial file
+    cached = os.path.join(entry, os.path.basename(path))
+    shutil.copyfile(path, f'{cached}.{os.getpid()}.tmp')
+    os.replace(f'{cached}.{os.getpid()}.tmp', cached)
+
+    evict(keep=digest)
+    return cached
+
+
+def entries() -> List[Tuple[float, int, str]]:
+    """ List of (last used time, size in bytes, path) for every cache entry, oldest first """
+    found = []
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            entry = os.path.join(directory, name)
+            if os.path.isdir(entry):
+                size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+                found.append((os.path.getmtime(entry), size, entry))
+
+    return sorted(found)
+
+
+def evict(keep: Optional[str] = None) -> None:
+    """ Remove the least recently used entries until the cache is within its limits """
+    found = entries()
+    total = sum(size for _, size, _ in found)
+
+    for used, size, entry in list(found):
+        if not ((max_entries and len(found) > max_entries) or (max_size and total > max_size)):
+            break
+
+        if os.path.basename(entry) == keep:
+            continue
+
+        shutil.rmtree(entry, ignore_errors=True)
+        found.remove((used, size, entry))
+        total -= size
+
+
+def clear() -> None:
+    """ Remove every cache entry """
+    shutil.rmtree(directory, ignore_errors=True)
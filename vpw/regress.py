@@ -0,0 +1,213 @@
+"""
+Parallel Regression Runners
+"""
+
+import concurrent.futures
+import itertools
+import os
+import pickle
+import random
+import select
+import sys
+import time
+import traceback
+from types import ModuleType
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import vpw
+
+
+class Result(NamedTuple):
+    """ Outcome of one (test, seed, parameters) regression job """
+    test: str
+    seed: int
+    params: Dict[str, Any]
+    passed: bool
+    cycles: int
+    seconds: float
+    error: str = ""
+    trace: Optional[str] = None  # trace file name of the re-run of a failed job
+
+
+# DUT package loaded once by each worker process
+_dut: ModuleType
+
+
+def _load(package: str, path: str) -> None:
+    """ Worker initializer, loads the shared built DUT package """
+
+    global _dut
+    _dut = vpw.load(package, path)
+
+
+def _job(test: Callable, seed: int, params: Dict[str, Any], trace: Optional[str]) -> Result:
+    """ Run one job on a fresh simulation, which is also the one used by the
+    vpw module level functions """
+
+    random.seed(seed)
+    vpw.init(_dut, trace=trace is not None, name=trace or "")
+
+    start = time.perf_counter()
+    try:
+        test(vpw.simulator, seed, **params)
+        passed, error = True, ""
+    except Exception:
+        passed, error = False, traceback.format_exc()
+    seconds = time.perf_counter() - start
+
+    cycles = vpw.simulator.cycles
+    vpw.simulator.finish()
+
+    return Result(test.__name__, seed, params, passed, cycles, seconds, error, trace)
+
+
+def run(tests: Sequence[Callable], seeds: Iterable[int], params: Sequence[Dict[str, Any]] = ({},),
+        workers: Optional[int] = None, rerun: bool = True, **kwargs: Any) -> List[Result]:
+    """
+    Build the design once and spread every (test, seed, parameters) job over a
+    pool of worker processes that load the shared built package.
+
+    Each test is a module level function called as test(sim, seed, **params)
+    with a fresh simulation, the random module seeded and the vpw module level
+    functions acting on that simulation. A test fails by raising an exception.
+    When rerun is set failing jobs are run again with tracing turned on, their
+    trace file named after the package, test, seed and the position of the
+    parameter set when there is more than one.
+
+    Any keyword arguments are passed to vpw.create().
+    """
+
+    dut = vpw.create(**kwargs)
+    package = dut.__name__
+
+    jobs = list(itertools.product(tests, seeds, range(len(params))))
+
+    def name(test: Callable, seed: int, param: int) -> str:
+        """ Trace file name of a job, the parameter set is numbered when there is more than one """
+        return f"{package}_{test.__name__}_{seed}" + (f"_{param}" if len(params) > 1 else "")
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_load,
+                                                initargs=(package, dut.__file__)) as pool:
+        futures = [pool.submit(_job, test, seed, params[param], None) for test, seed, param in jobs]
+        results = [future.result() for future in futures]
+
+        if rerun:
+            traced = {index: pool.submit(_job, test, seed, params[param], name(test, seed, param))
+                      for index, (test, seed, param) in enumerate(jobs) if not results[index].passed}
+
+            for index, future in traced.items():
+                results[index] = results[index]._replace(trace=future.result().trace)
+
+    return results
+
+
+def _forked(sim: vpw.Simulator, test: Callable, seed: int, params: Dict[str, Any]) -> Result:
+    """ Run one job within a forked child on its copy of the simulation """
+
+    random.seed(seed)
+    sim.dut.trace_detach()  # the trace file is the parent's, so it is never written, rotated or closed
+    warm = sim.cycles
+
+    start = time.perf_counter()
+    try:
+        test(sim, seed, **params)
+        passed, error = True, ""
+    except Exception:
+        passed, error = False, traceback.format_exc()
+    seconds = time.perf_counter() - start
+
+    return Result(test.__name__, seed, params, passed, sim.cycles - warm, seconds, error)
+
+
+def fork(tests: Sequence[Callable], seeds: Iterable[int] = (0,), params: Sequence[Dict[str, Any]] = ({},),
+         sim: Optional[vpw.Simulator] = None, workers: Optional[int] = None) -> List[Result]:
+    """
+    Run every (test, seed, parameters) job from the current state of a
+    simulation, by default the one used by the vpw module level functions,
+    each within a forked child process so the warmed up model and interfaces
+    are shared copy-on-write rather than rebuilt or replayed.
+
+    Tests are called as test(sim, seed, **params) as with run() but need not be
+    module level functions. No more than workers children, by default the
+    number of CPUs, run at once and the simulation of the parent is left
+    untouched. Children do not trace and the model must not be multithreaded,
+    as only the forking thread exists within a child. The cycle count of a
+    result is the number of cycles run from the shared state.
+    """
+
+    sim = sim or vpw.simulator
+    jobs = list(itertools.product(tests, seeds, params))
+    results: List[Optional[Result]] = [None] * len(jobs)
+
+    # nothing buffered by the parent may be written again by a child
+    sim.flush()
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    queued = iter(enumerate(jobs))
+    running: Dict[int, Tuple[int, int, List[bytes]]] = {}  # read end of pipe -> (job, pid, data)
+
+    while True:
+        while len(running) < (workers or os.cpu_count() or 1):
+            job = next(queued, None)
+            if job is None:
+                break
+
+            index, (test, seed, param) = job
+            read, write = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                os.close(read)
+                try:
+                    with os.fdopen(write, "wb") as pipe:
+                        pickle.dump(_forked(sim, test, seed, param), pipe)
+                finally:
+                    os._exit(0)
+
+            os.close(write)
+            running[read] = (index, pid, [])
+
+        if not running:
+            break
+
+        ready, _, _ = select.select(list(running), [], [])
+        for read in ready:
+            data = os.read(read, 1 << 16)
+            index, pid, received = running[read]
+            if data:
+                received.append(data)
+                continue
+
+            # end of the result, the child has finished
+            os.close(read)
+            del running[read]
+            _, status = os.waitpid(pid, 0)
+
+            test, seed, param = jobs[index]
+            if received:
+                results[index] = pickle.loads(b"".join(received))
+            else:
+                results[index] = Result(test.__name__, seed, param, False, 0, 0.0,
+                                        f"child exited without a result, status {status}")
+
+    return [result for result in results if result is not None]
+
+
+def report(results: Sequence[Result]) -> str:
+    """ Format the results as a table of one job per line followed by a summary """
+
+    lines = []
+    for result in results:
+        status = "PASS" if result.passed else "FAIL"
+        params = ", ".join(f"{key}={value}" for key, value in result.params.items())
+        line = f"{status} {result.test}[{result.seed}]({params}) {result.cycles} cycles {result.seconds:.3f}s"
+        if result.trace:
+            line += f" trace {result.trace}"
+        lines.append(line)
+
+    failed = sum(not result.passed for result in results)
+    lines.append(f"{len(results) - failed} passed, {failed} failed, "
+                 f"{sum(result.cycles for result in results)} cycles in "
+                 f"{sum(result.seconds for result in results):.3f}s")
+
+    return "\n".join(lines)
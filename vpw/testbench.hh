@@ -1,6 +1,17 @@
+#include <pybind11/numpy.h>
 #include <pybind11/pybind11.h>
 #include <pybind11/stl.h>
 
+#include <algorithm>
+#include <cstdio>
+#include <cstring>
+#include <deque>
+#include <memory>
+#include <limits>
+#include <stdexcept>
+#include <string>
+#include <tuple>
+#include <unordered_map>
 #include <vector>
 
 using namespace pybind11::literals;
@@ -17,72 +28,1661 @@ namespace py = pybind11;
 #define CLOCK clk
 #endif
 
-TB *dut;
-VerilatedVcdC *wave;
-vluint64_t timestamp;
-bool trace_on;
+#ifdef TRACE_FST
+#include "verilated_fst_c.h"
+typedef VerilatedFstC Wave;
+#define TRACE_EXT ".fst"
+#else
+#include "verilated_vcd_c.h"
+typedef VerilatedVcdC Wave;
+#define TRACE_EXT ".vcd"
+#endif
 
-void prep(const std::string, const std::vector<uint64_t> &);
+#ifdef SAVABLE
+// Serializes the model into memory, rather than the file of a VerilatedSave,
+// so checkpoints can be handed to Python as bytes
+class MemorySave final : public VerilatedSerialize {
+ public:
+  std::string data;
 
-py::dict update();
+  MemorySave() {
+    m_isOpen = true;
+    header();
+  }
 
-void init(const bool trace = true) {
-  timestamp = 0;
-  trace_on = trace;
+  ~MemorySave() override { close(); }
 
-  // Instantiate design
-  dut = new TB;
+  void close() override {
+    if (m_isOpen) {
+      trailer();
+      flush();
+      m_isOpen = false;
+    }
+  }
 
-  if (trace_on) {
-    // Generate a trace
-    Verilated::traceEverOn(true);
-    wave = new VerilatedVcdC;
-    dut->trace(wave, 99);
-    wave->open(STRINGIFY(PACKAGE.vcd));
+  void flush() override {
+    data.append(reinterpret_cast<const char *>(m_bufp), m_cp - m_bufp);
+    m_cp = m_bufp;
+  }
+};
+
+// Deserializes the model from a checkpoint held in memory
+class MemoryRestore final : public VerilatedDeserialize {
+ public:
+  explicit MemoryRestore(const std::string &checkpoint) : data(checkpoint) {
+    m_isOpen = true;
+    m_cp = m_bufp;
+    m_endp = m_bufp;
+    header();
+  }
+
+  ~MemoryRestore() override { close(); }
+
+  void close() override {
+    if (m_isOpen) {
+      trailer();
+      m_isOpen = false;
+    }
+  }
+
+  void fill() override {
+    // move the unread bytes to the start of the buffer then top it up
+    const std::size_t unread = m_endp - m_cp;
+    std::memmove(m_bufp, m_cp, unread);
+    m_cp = m_bufp;
+    m_endp = m_bufp + unread;
+
+    const std::size_t size =
+        std::min(data.size() - read, bufferSize() - unread);
+    std::memcpy(m_endp, data.data() + read, size);
+    m_endp += size;
+    read += size;
+  }
+
+ private:
+  const std::string &data;
+  std::size_t read = 0;
+};
+#endif
+
+struct Port {
+  std::string name;
+  int width;
+  bool input;
+  std::size_t offset;  // first word of the port within the snapshot
+};
+
+// Port table generated alongside the module, a port handle is its index
+extern const std::vector<Port> ports;
+
+void prep_id(TB *, const int, const std::vector<uint64_t> &);
+
+void update(TB *, uint32_t *);
+
+void update_id(TB *, const int, uint32_t *);
+
+int port_id(const std::string &);
+
+// Port values as sampled on the posedge, each port is stored as a run of 32
+// bit words within a persistent buffer that is overwritten every tick
+struct Snapshot {
+  TB *dut = nullptr;
+  std::vector<uint32_t> words;
+
+  void resize(TB *model) {
+    const Port &last = ports.back();
+    dut = model;
+    words.assign(last.offset + (last.width + 31) / 32, 0);
+  }
+
+  void update() { ::update(dut, words.data()); }
+
+  uint64_t scalar(const int handle) const {
+    const Port &port = ports.at(handle);
+    const uint32_t *io = words.data() + port.offset;
+
+    if (port.width <= 32) {
+      return io[0];
+    }
+
+    return static_cast<uint64_t>(io[1]) << 32 | io[0];
+  }
+
+  py::object value(const int handle) const {
+    const Port &port = ports.at(handle);
+    const uint32_t *io = words.data() + port.offset;
+
+    if (port.width <= 64) {
+      return py::int_(scalar(handle));
+    }
+
+    py::list wide;
+    for (int i = 0; i != (port.width + 31) / 32; ++i) {
+      wide.append(io[i]);
+    }
+
+    return wide;
+  }
+
+  py::object value(const std::string &name) const {
+    const int handle = port_id(name);
+
+    if (handle < 0) {
+      throw py::key_error(name);
+    }
+
+    return value(handle);
+  }
+
+  py::list keys() const {
+    py::list names;
+    for (auto &port : ports) {
+      names.append(port.name);
+    }
+
+    return names;
+  }
+
+  py::dict copy() const {
+    py::dict IO;
+    for (std::size_t i = 0; i != ports.size(); ++i) {
+      IO[py::str(ports[i].name)] = value(static_cast<int>(i));
+    }
+
+    return IO;
+  }
+};
+
+int port_id(const std::string &name) {
+  static std::unordered_map<std::string, int> handles;
+
+  if (handles.empty()) {
+    for (std::size_t i = 0; i != ports.size(); ++i) {
+      handles[ports[i].name] = static_cast<int>(i);
+    }
+  }
+
+  auto handle = handles.find(name);
+  if (handle == handles.end()) {
+    return -1;
   }
+
+  return handle->second;
 }
 
-void finish() {
-  if (trace_on) {
-    wave->close();
+std::vector<std::tuple<std::string, int, std::string>> port_list() {
+  std::vector<std::tuple<std::string, int, std::string>> table;
+
+  for (auto &port : ports) {
+    table.emplace_back(port.name, port.width, port.input ? "input" : "output");
+  }
+
+  return table;
+}
+
+// Bits [lsb, lsb + width) of a value held as 32 bit words, width 64 or less
+uint64_t get_bits(const uint32_t *words, const unsigned lsb,
+                  const unsigned width) {
+  uint64_t value = 0;
+  for (unsigned i = 0; i < width;) {
+    const unsigned shift = (lsb + i) % 32;
+    const unsigned take = std::min(32 - shift, width - i);
+    const uint64_t chunk = words[(lsb + i) / 32] >> shift;
+    value |= (chunk & ((uint64_t{1} << take) - 1)) << i;
+    i += take;
   }
 
-  delete dut;
+  return value;
 }
 
-py::dict tick() {
-  timestamp++;
+// Sets bits [lsb, lsb + width) of a value held as 32 bit words
+void set_bits(uint32_t *words, const unsigned lsb, const unsigned width,
+              const uint64_t value) {
+  for (unsigned i = 0; i < width;) {
+    const unsigned shift = (lsb + i) % 32;
+    const unsigned take = std::min(32 - shift, width - i);
+    const uint32_t mask = static_cast<uint32_t>(((uint64_t{1} << take) - 1)
+                                                << shift);
+    uint32_t &word = words[(lsb + i) / 32];
+    word = (word & ~mask) | (static_cast<uint32_t>(value >> i) << shift & mask);
+    i += take;
+  }
+}
+
+const Port &port_at(const int handle) {
+  if (handle < 0 || static_cast<std::size_t>(handle) >= ports.size()) {
+    throw std::invalid_argument("port handle " + std::to_string(handle) +
+                                " not found");
+  }
+
+  return ports[handle];
+}
+
+// Input port driven by a bus functional model, its value held as 32 bit
+// words that are applied to the model before every posedge
+struct Drive {
+  int handle;
+  std::vector<uint32_t> words;
+  std::vector<uint64_t> value;
+
+  explicit Drive(const int port) : handle(port) {
+    const int width = port_at(port).width;
+    words.assign((width + 31) / 32, 0);
+    value.assign(width <= 64 ? 1 : words.size(), 0);
+  }
 
-  dut->eval();
-  if (trace_on) {
-    wave->dump(timestamp * 10 - 2);
+  uint64_t get(const unsigned lsb = 0, const unsigned width = 1) const {
+    return get_bits(words.data(), lsb, width);
   }
 
-  py::dict IO = update();
+  void set(const unsigned lsb, const unsigned width, const uint64_t bits) {
+    set_bits(words.data(), lsb, width, bits);
+  }
 
-  dut->CLOCK = 1;
-  dut->eval();
-  if (trace_on) {
-    wave->dump(timestamp * 10);
+  void set(const uint64_t bits) {
+    set(0, std::min(64, ports[handle].width), bits);
   }
 
-  dut->CLOCK = 0;
-  dut->eval();
-  if (trace_on) {
-    wave->dump(timestamp * 10 + 5);
-    wave->flush();
+  void apply(TB *dut) {
+    if (value.size() == 1) {
+      value[0] = words.size() == 1
+                     ? words[0]
+                     : static_cast<uint64_t>(words[1]) << 32 | words[0];
+    } else {
+      std::copy(words.begin(), words.end(), value.begin());
+    }
+
+    ::prep_id(dut, handle, value);
   }
+};
 
-  return IO;
+// Output port sampled by a bus functional model, returns its posedge value
+// as 32 bit words within the port list state
+const uint32_t *sample(TB *dut, uint32_t *io, const int handle) {
+  update_id(dut, handle, io);
+  return io + ports[handle].offset;
+}
+
+// Queue of packets, each a list of beats, shared by Python and a bus
+// functional model. A source sends the beats of the first packet in turn.
+struct Packets {
+  std::deque<std::vector<uint64_t>> packets;
+  std::size_t offset = 0;  // beats of the first packet sent
+  std::size_t beats = 0;   // beats queued less those sent
+
+  void append(std::vector<uint64_t> packet) {
+    beats += packet.size();
+    packets.push_back(std::move(packet));
+  }
+
+  std::vector<uint64_t> popleft() {
+    if (packets.empty()) {
+      throw py::index_error("pop from an empty queue");
+    }
+
+    std::vector<uint64_t> packet = std::move(packets.front());
+    packets.pop_front();
+    beats -= packet.size() - offset;
+    offset = 0;
+
+    return packet;
+  }
+
+  void clear() {
+    packets.clear();
+    offset = 0;
+    beats = 0;
+  }
+
+  const std::vector<uint64_t> &at(const py::ssize_t index) const {
+    const py::ssize_t size = static_cast<py::ssize_t>(packets.size());
+    if (index < -size || index >= size) {
+      throw py::index_error("queue index out of range");
+    }
+
+    return packets[index < 0 ? index + size : index];
+  }
+};
+
+// Bus functional model run natively with every cycle, its inputs are applied
+// before the model settles for the posedge and the posedge values sampled
+// straight after. Sampling returns whether any state visible to Python, which
+// a background task may be waiting on, has changed.
+class Bfm {
+ public:
+  virtual ~Bfm() = default;
+
+  virtual void drive(TB *dut) = 0;
+
+  virtual bool sample(TB *dut, uint32_t *io) = 0;
+};
+
+// AXIS source of a number of concatenated streams, each sending the packets
+// queued from Python in turn
+class AxisSource final : public Bfm {
+ public:
+  AxisSource(const std::unordered_map<std::string, int> &handles,
+             const int width, const int concat)
+      : width(width),
+        tdata(handles.at("tdata")),
+        tlast(handles.at("tlast")),
+        tvalid(handles.at("tvalid")),
+        tready(handles.at("tready")),
+        queues(concat),
+        paused(concat, false) {
+    port_at(tready);
+    if (width > 64) {
+      throw std::invalid_argument("stream wider than 64 bits");
+    }
+
+    for (auto &queue : queues) {
+      queue = std::make_shared<Packets>();
+    }
+    stage();
+  }
+
+  std::shared_ptr<Packets> queue(const std::size_t position) const {
+    return queues.at(position);
+  }
+
+  void pause(const std::size_t position, const bool active) {
+    paused.at(position) = active;
+    stage();
+  }
+
+  void drive(TB *dut) override {
+    tdata.apply(dut);
+    tlast.apply(dut);
+    tvalid.apply(dut);
+  }
+
+  bool sample(TB *dut, uint32_t *io) override {
+    const uint32_t *ready = ::sample(dut, io, tready);
+    bool sent = false;
+
+    for (std::size_t pos = 0; pos != queues.size(); ++pos) {
+      Packets &queue = *queues[pos];
+      if (tvalid.get(pos) && get_bits(ready, pos, 1) &&
+          !queue.packets.empty()) {
+        queue.beats--;
+        if (++queue.offset == queue.packets.front().size()) {
+          queue.packets.pop_front();
+          queue.offset = 0;
+          sent = true;
+        }
+      }
+    }
+
+    return stage() || sent;
+  }
+
+ private:
+  int width;
+  Drive tdata;
+  Drive tlast;
+  Drive tvalid;
+  int tready;
+  std::vector<std::shared_ptr<Packets>> queues;
+  std::vector<bool> paused;
+
+  // Prepare the beat each stream sends next, returns whether empty packets
+  // were skipped
+  bool stage() {
+    bool skipped = false;
+
+    for (std::size_t pos = 0; pos != queues.size(); ++pos) {
+      Packets &queue = *queues[pos];
+      while (!queue.packets.empty() && queue.packets.front().empty()) {
+        queue.packets.pop_front();
+        skipped = true;
+      }
+
+      if (queue.packets.empty()) {
+        tdata.set(pos * width, width, 0);
+        tlast.set(pos, 1, 0);
+        tvalid.set(pos, 1, 0);
+      } else {
+        const std::vector<uint64_t> &packet = queue.packets.front();
+        tdata.set(pos * width, width, packet[queue.offset]);
+        tlast.set(pos, 1, queue.offset + 1 == packet.size());
+        tvalid.set(pos, 1, !paused[pos]);
+      }
+    }
+
+    return skipped;
+  }
+};
+
+// AXIS sink of a number of concatenated streams, queuing each packet for
+// Python once its last beat is received
+class AxisSink final : public Bfm {
+ public:
+  AxisSink(const std::unordered_map<std::string, int> &handles,
+           const int width, const int concat)
+      : width(width),
+        tdata(handles.at("tdata")),
+        tlast(handles.at("tlast")),
+        tvalid(handles.at("tvalid")),
+        tready(handles.at("tready")),
+        queues(concat),
+        currents(concat) {
+    port_at(tdata);
+    port_at(tlast);
+    port_at(tvalid);
+    if (width > 64) {
+      throw std::invalid_argument("stream wider than 64 bits");
+    }
+
+    for (auto &queue : queues) {
+      queue = std::make_shared<Packets>();
+    }
+  }
+
+  std::shared_ptr<Packets> queue(const std::size_t position) const {
+    return queues.at(position);
+  }
+
+  void ready(const std::size_t position, const bool active) {
+    tready.set(position, 1, active);
+  }
+
+  // Beats of the packet being received
+  std::vector<uint64_t> current(const std::size_t position) const {
+    return currents.at(position);
+  }
+
+  void set_current(const std::size_t position,
+                   const std::vector<uint64_t> &beats) {
+    currents.at(position) = beats;
+  }
+
+  void drive(TB *dut) override { tready.apply(dut); }
+
+  bool sample(TB *dut, uint32_t *io) override {
+    const uint32_t *valid = ::sample(dut, io, tvalid);
+    bool received = false;
+
+    for (std::size_t pos = 0; pos != queues.size(); ++pos) {
+      if (get_bits(valid, pos, 1) && tready.get(pos)) {
+        const uint32_t *data = ::sample(dut, io, tdata);
+        currents[pos].push_back(get_bits(data, pos * width, width));
+
+        if (get_bits(::sample(dut, io, tlast), pos, 1)) {
+          queues[pos]->append(std::move(currents[pos]));
+          currents[pos].clear();
+          received = true;
+        }
+      }
+    }
+
+    return received;
+  }
+
+ private:
+  int width;
+  int tdata;
+  int tlast;
+  int tvalid;
+  Drive tready;
+  std::vector<std::shared_ptr<Packets>> queues;
+  std::vector<std::vector<uint64_t>> currents;
+};
+
+// Sparse memory of bytes held in pages allocated on demand, by byte address
+struct Pages {
+  explicit Pages(const std::size_t size) : size(size) {}
+
+  std::size_t size;  // of each page
+  std::unordered_map<uint64_t, std::vector<uint8_t>> pages;
+
+  // Page holding a byte address, null when not allocated unless allocating
+  uint8_t *page(const uint64_t address, const bool allocate) {
+    auto found = pages.find(address / size);
+    if (found != pages.end()) {
+      return found->second.data();
+    } else if (allocate) {
+      auto &page = pages[address / size];
+      page.resize(size);
+      return page.data();
+    }
+    return nullptr;
+  }
+
+  void load(uint64_t address, const uint8_t *data, std::size_t length) {
+    while (length > 0) {
+      const std::size_t offset = address % size;
+      const std::size_t part = std::min(size - offset, length);
+      std::memcpy(page(address, true) + offset, data, part);
+      address += part;
+      data += part;
+      length -= part;
+    }
+  }
+
+  // Bytes of pages not allocated are zero
+  void dump(uint64_t address, uint8_t *data, std::size_t length) {
+    while (length > 0) {
+      const std::size_t offset = address % size;
+      const std::size_t part = std::min(size - offset, length);
+      const uint8_t *held = page(address, false);
+      if (held != nullptr) {
+        std::memcpy(data, held + offset, part);
+      } else {
+        std::memset(data, 0, part);
+      }
+      address += part;
+      data += part;
+      length -= part;
+    }
+  }
+};
+
+// AXI slave memory of beats held in pages, indexed by beat address
+class AximMemory final : public Bfm {
+ public:
+  AximMemory(const std::unordered_map<std::string, int> &handles,
+             const int data_width, const std::size_t page_size,
+             const std::size_t depth)
+      : ram(page_size),
+        data_width(data_width),
+        words((data_width + 31) / 32),
+        bytes((data_width + 7) / 8),
+        wready(handles.at("wready")),
+        awready(handles.at("awready")),
+        rdata(handles.at("rdata")),
+        rid(handles.at("rid")),
+        rlast(handles.at("rlast")),
+        rvalid(handles.at("rvalid")),
+        arready(handles.at("arready")),
+        wvalid(handles.at("wvalid")),
+        wdata(handles.at("wdata")),
+        wlast(handles.at("wlast")),
+        awvalid(handles.at("awvalid")),
+        awaddr(handles.at("awaddr")),
+        awlen(handles.at("awlen")),
+        awid(handles.at("awid")),
+        rready(handles.at("rready")),
+        arvalid(handles.at("arvalid")),
+        araddr(handles.at("araddr")),
+        arlen(handles.at("arlen")),
+        arid(handles.at("arid")),
+        depth(depth) {
+    for (const int handle : {wvalid, wdata, wlast, awvalid, awaddr, awlen,
+                             awid, rready, arvalid, araddr, arlen, arid}) {
+      port_at(handle);
+    }
+    if (page_size % bytes != 0) {
+      throw std::invalid_argument(
+          "page size must be a multiple of the beat size");
+    }
+
+    awready.set(1);
+    arready.set(1);
+  }
+
+  Pages ram;
+  int data_width;
+  std::size_t words;  // of each beat
+  std::size_t bytes;  // of each beat
+
+  // Words of the beat at an index, zero and false when its page is not
+  // allocated. The beats are held as the little endian bytes of their words.
+  bool read(const uint64_t index, uint32_t *beat) {
+    const uint8_t *page = ram.page(index * bytes, false);
+    std::fill(beat, beat + words, 0);
+    if (page == nullptr) {
+      return false;
+    }
+    std::memcpy(beat, page + index * bytes % ram.size, bytes);
+    return true;
+  }
+
+  void write(const uint64_t index, const uint32_t *beat) {
+    std::memcpy(ram.page(index * bytes, true) + index * bytes % ram.size, beat,
+                bytes);
+  }
+
+  // No bursts are queued or in progress
+  bool idle() const {
+    return queue_aw.empty() && queue_ar.empty() &&
+           beats_w == 0 && beats_r == 0;
+  }
+
+  void drive(TB *dut) override {
+    wready.apply(dut);
+    awready.apply(dut);
+    rdata.apply(dut);
+    rid.apply(dut);
+    rlast.apply(dut);
+    rvalid.apply(dut);
+    arready.apply(dut);
+  }
+
+  bool sample(TB *dut, uint32_t *io) override {
+    // write data channel, each beat stored as it is received into the burst
+    // at the head of the write address queue
+    if (wready.get() && get_bits(::sample(dut, io, wvalid), 0, 1)) {
+      if (beat_w == 0) {
+        base_w = 8 * queue_aw.front().addr / data_width;
+        length_w = queue_aw.front().len + 1;
+        queue_aw.pop_front();
+      }
+
+      write(base_w + beat_w, ::sample(dut, io, wdata));
+      beat_w++;
+      beats_w = length_w - beat_w;
+
+      if (beat_w == length_w) {
+        if (!get_bits(::sample(dut, io, wlast), 0, 1)) {
+          throw std::runtime_error("write burst longer than its length");
+        }
+        beat_w = 0;
+      }
+    }
+
+    // write address channel
+    if (awready.get() && get_bits(::sample(dut, io, awvalid), 0, 1)) {
+      queue_aw.push_back({scalar(dut, io, awaddr), scalar(dut, io, awlen),
+                          scalar(dut, io, awid)});
+    }
+
+    // ready for write data while there is a burst to fill, so the beats of
+    // consecutive bursts are received without a break
+    wready.set(beat_w > 0 || !queue_aw.empty());
+    awready.set(queue_aw.size() < depth);
+
+    // read data channel, the first beat of a queued burst following on from
+    // the last beat of the one before
+    if (get_bits(::sample(dut, io, rready), 0, 1) && rvalid.get()) {
+      beats_r--;
+
+      if (beat_r < length_r) {
+        beat_r++;
+        stage_r(base_r + beat_r - 1, rid.get(0, 32), length_r == beat_r, true);
+      } else {
+        beat_r = 0;
+        stage_r(0, 0, false, false);
+      }
+    }
+
+    if (beat_r == 0 && !queue_ar.empty()) {
+      const Burst &burst = queue_ar.front();
+      beat_r = 1;
+      base_r = 8 * burst.addr / data_width;
+      length_r = burst.len + 1;
+      beats_r = length_r;
+      stage_r(base_r, burst.id, length_r == beat_r, true);
+      queue_ar.pop_front();
+    }
+
+    // read address channel
+    if (arready.get() && get_bits(::sample(dut, io, arvalid), 0, 1)) {
+      queue_ar.push_back({scalar(dut, io, araddr), scalar(dut, io, arlen),
+                          scalar(dut, io, arid)});
+    }
+    arready.set(queue_ar.size() < depth);
+
+    return false;
+  }
+
+ private:
+  struct Burst {
+    uint64_t addr;
+    uint64_t len;  // number of beats less one, as on the AxLEN port
+    uint64_t id;
+  };
+
+  Drive wready;
+  Drive awready;
+  Drive rdata;
+  Drive rid;
+  Drive rlast;
+  Drive rvalid;
+  Drive arready;
+  int wvalid;
+  int wdata;
+  int wlast;
+  int awvalid;
+  int awaddr;
+  int awlen;
+  int awid;
+  int rready;
+  int arvalid;
+  int araddr;
+  int arlen;
+  int arid;
+  std::size_t depth;  // of the address channel queues
+
+  std::deque<Burst> queue_aw;
+  std::deque<Burst> queue_ar;
+
+  // write burst being received, beat_w counting the beats received and zero
+  // until the first
+  uint64_t beat_w = 0;
+  uint64_t base_w = 0;
+  uint64_t length_w = 0;
+  uint64_t beats_w = 0;
+
+  // read burst being sent, beat_r counting from one and zero when there is
+  // none
+  uint64_t beat_r = 0;
+  uint64_t base_r = 0;
+  uint64_t length_r = 0;
+  uint64_t beats_r = 0;
+
+  static uint64_t scalar(TB *dut, uint32_t *io, const int handle) {
+    return get_bits(::sample(dut, io, handle), 0,
+                    std::min(64, ports[handle].width));
+  }
+
+  // Prepare a beat of read data, a missing beat reads as zero
+  void stage_r(const uint64_t index, const uint64_t id, const bool is_last,
+               const bool valid) {
+    if (valid) {
+      read(index, rdata.words.data());
+    } else {
+      std::fill(rdata.words.begin(), rdata.words.end(), 0);
+    }
+
+    rid.set(id);
+    rlast.set(is_last);
+    rvalid.set(valid);
+  }
+};
+
+// Simulation of one instance of the design, owning its model, trace file,
+// clock counter and port list state
+class Simulator {
+ public:
+  Snapshot snapshot;
+
+  ~Simulator() {
+    if (dut) {
+      finish();
+    }
+  }
+
+  void init(const bool trace = true, const uint64_t flush = 0,
+            const uint64_t start = 0,
+            const uint64_t stop = std::numeric_limits<uint64_t>::max(),
+            const uint64_t rotate = 0, const std::string &name = "") {
+    if (dut) {
+      finish();
+    }
+
+    timestamp = 0;
+    flush_interval = flush;
+    rotate_interval = rotate;
+    rotate_count = 0;
+    trace_start = start;
+    trace_stop = stop;
+    trace_name = name.empty() ? STRINGIFY(PACKAGE) : name;
+    tracing = trace;
+    dumping = true;
+    armed.clear();
+    fired.clear();
+
+    // Instantiate design in a fresh context so trace state does not leak
+    // between init/finish pairs
+    context = new VerilatedContext;
+    context->traceEverOn(tracing);
+#ifdef THREADS
+    context->threads(THREADS);
+#endif
+    dut = new TB{context};
+    snapshot.resize(dut);
+
+    if (tracing) {
+      // Generate a trace
+      trace_open();
+    }
+  }
+
+  void finish() {
+    if (tracing) {
+      trace_close();
+      tracing = false;
+    }
+
+    delete dut;
+    delete context;
+    dut = nullptr;
+    context = nullptr;
+    bfms.clear();
+  }
+
+  void flush() {
+    if (tracing && wave->isOpen()) {
+      wave->flush();
+    }
+  }
+
+  void trace_on() { dumping = true; }
+
+  void trace_off() { dumping = false; }
+
+  // Stop tracing without closing, flushing or rotating the trace file, which
+  // is left to the process it is shared with, as by a forked child
+  void trace_detach() {
+    tracing = false;
+    wave = nullptr;  // owned by the process the trace is shared with
+  }
+
+  uint64_t cycles() const { return timestamp; }
+
+  bool running() const { return dut != nullptr; }
+
+  void prep(const std::string port, const std::vector<uint64_t> &value) {
+    const int handle = port_id(port);
+
+    if (handle < 0) {
+      printf("WARNING: requested port \'%s\' not found.\n", port.c_str());
+      return;
+    }
+
+    ::prep_id(dut, handle, value);
+  }
+
+  void prep_id(const int handle, const std::vector<uint64_t> &value) {
+    ::prep_id(dut, handle, value);
+  }
+
+  void prep_many(
+      const std::vector<std::pair<int, std::vector<uint64_t>>> &values) {
+    for (auto &value : values) {
+      ::prep_id(dut, value.first, value.second);
+    }
+  }
+
+  // Run a bus functional model natively with every cycle until detached
+  void attach(std::shared_ptr<Bfm> bfm) { bfms.push_back(std::move(bfm)); }
+
+  void detach() { bfms.clear(); }
+
+#ifdef SAVABLE
+  py::bytes checkpoint() {
+    MemorySave os;
+    os << timestamp << context << *dut;
+    os.close();
+
+    return py::bytes(os.data);
+  }
+
+  void restore(const std::string &checkpoint) {
+    {
+      MemoryRestore os{checkpoint};
+      os >> timestamp >> context >> *dut;
+    }
+    snapshot.update();
+    armed.clear();
+    fired.clear();
+
+    if (tracing) {
+      // the restored clock counter may go back in time, so start a new trace
+      trace_close();
+      trace_open();
+    }
+  }
+#else
+  py::bytes checkpoint() {
+    throw std::runtime_error("design not created as savable");
+  }
+
+  void restore(const std::string &) {
+    throw std::runtime_error("design not created as savable");
+  }
+#endif
+
+  // Arm a condition on a port of 64 bits or less, that is met on the first
+  // posedge the port has the value under the mask, returning its id
+  int arm(const int handle, const uint64_t value, const uint64_t mask) {
+    const Port &port = ports.at(handle);
+    if (port.width > 64) {
+      throw std::invalid_argument("port '" + port.name +
+                                  "' is wider than 64 bits");
+    }
+
+    armed.push_back({armed_id, handle, value & mask, mask});
+    return armed_id++;
+  }
+
+  // Disarm a condition that has not been met
+  void disarm(const int id) {
+    armed.erase(std::remove_if(armed.begin(), armed.end(),
+                               [id](const Armed &condition) {
+                                 return condition.id == id;
+                               }),
+                armed.end());
+  }
+
+  // Ids of the armed conditions met since last asked, which are disarmed
+  std::vector<int> take_fired() {
+    std::vector<int> ids;
+    ids.swap(fired);
+    return ids;
+  }
+
+  Snapshot &tick() {
+    settle();
+    snapshot.update();
+    check();
+    toggle();
+
+    return snapshot;
+  }
+
+  // Advances the clock up to a number of cycles, stopping early after the
+  // first posedge on which an armed condition is met or a bus functional
+  // model changes state visible to Python
+  Snapshot &idle(const uint64_t cycles) {
+    if (cycles == 0) {
+      snapshot.update();
+      return snapshot;
+    }
+
+    for (uint64_t i = 1; i < cycles; ++i) {
+      settle();
+      if (check()) {
+        snapshot.update();
+        toggle();
+        return snapshot;
+      }
+      toggle();
+    }
+
+    return tick();
+  }
+
+  Snapshot &run(const uint64_t cycles) {
+    if (cycles == 0) {
+      snapshot.update();
+      return snapshot;
+    }
+
+    for (uint64_t i = 1; i < cycles; ++i) {
+      settle();
+      toggle();
+    }
+
+    return tick();
+  }
+
+  // Advances the clock up to a number of cycles, stopping after the first
+  // posedge on which the condition is met, an armed condition is met or a bus
+  // functional model changes state visible to Python. The
+  // condition is a program of (op, port handle, value) instructions in
+  // reverse polish notation, returns whether it was met and the cycles run.
+  std::pair<bool, uint64_t> run_until(
+      const std::vector<std::tuple<int, int, uint64_t>> &program,
+      const uint64_t cycles) {
+    std::size_t depth = 0;
+    for (auto &instruction : program) {
+      const int op = std::get<0>(instruction);
+      if (op < 0 || op > OR) {
+        throw std::invalid_argument("unknown condition op");
+      }
+
+      if (op == AND || op == OR) {
+        if (depth < 2) {
+          throw std::invalid_argument("condition op missing an operand");
+        }
+        depth--;
+      } else if (ports.at(std::get<1>(instruction)).width > 64) {
+        throw std::invalid_argument("port '" +
+                                    ports[std::get<1>(instruction)].name +
+                                    "' is wider than 64 bits");
+      } else {
+        depth++;
+      }
+    }
+
+    if (depth != 1) {
+      throw std::invalid_argument("condition program does not have one result");
+    }
+
+    py::gil_scoped_release release;
+
+    for (uint64_t i = 1; i <= cycles; ++i) {
+      settle();
+      const bool met = evaluate(program);
+      const bool woken = check();
+      if (met || woken || i == cycles) {
+        snapshot.update();
+        toggle();
+        return {met, i};
+      }
+      toggle();
+
+      if (i % (1 << 16) == 0) {
+        // the wait may have no limit, so let it be interrupted
+        py::gil_scoped_acquire acquire;
+        if (PyErr_CheckSignals() != 0) {
+          throw py::error_already_set();
+        }
+      }
+    }
+
+    return {false, 0};
+  }
+
+  py::array_t<uint64_t> run_vectors(
+      const py::array_t<uint64_t, py::array::c_style | py::array::forcecast>
+          &inputs,
+      const std::vector<int> &in_handles, const std::vector<int> &out_handles) {
+    if (inputs.ndim() != 2 ||
+        static_cast<std::size_t>(inputs.shape(1)) != in_handles.size()) {
+      throw std::invalid_argument(
+          "input vectors must be a (cycles x input ports) matrix");
+    }
+
+    for (const int handle : in_handles) {
+      const Port &port = ports.at(handle);
+      if (!port.input || port.width > 64) {
+        throw std::invalid_argument("port '" + port.name +
+                                    "' is not an input of 64 bits or less");
+      }
+    }
+
+    for (const int handle : out_handles) {
+      const Port &port = ports.at(handle);
+      if (port.width > 64) {
+        throw std::invalid_argument("port '" + port.name +
+                                    "' is wider than 64 bits");
+      }
+    }
+
+    const py::ssize_t cycles = inputs.shape(0);
+    const py::ssize_t width = static_cast<py::ssize_t>(out_handles.size());
+    py::array_t<uint64_t> outputs({cycles, width});
+
+    auto in = inputs.unchecked<2>();
+    auto out = outputs.mutable_unchecked<2>();
+    std::vector<uint64_t> value(1);
+
+    {
+      // the arrays are only accessed through their raw buffers while the
+      // cycles run, so other Python threads can run alongside
+      py::gil_scoped_release release;
+
+      for (py::ssize_t i = 0; i != cycles; ++i) {
+        for (std::size_t j = 0; j != in_handles.size(); ++j) {
+          value[0] = in(i, j);
+          ::prep_id(dut, in_handles[j], value);
+        }
+
+        settle();
+        for (py::ssize_t j = 0; j != width; ++j) {
+          update_id(dut, out_handles[j], snapshot.words.data());
+          out(i, j) = snapshot.scalar(out_handles[j]);
+        }
+        toggle();
+      }
+    }
+
+    return outputs;
+  }
+
+ private:
+  VerilatedContext *context = nullptr;
+  TB *dut = nullptr;
+  Wave *wave = nullptr;
+  std::string trace_name;
+  vluint64_t timestamp = 0;
+  vluint64_t flush_interval = 0;
+  vluint64_t rotate_interval = 0;
+  vluint64_t rotate_count = 0;
+  vluint64_t trace_start = 0;
+  vluint64_t trace_stop = 0;
+  bool tracing = false;  // trace file is open
+  bool dumping = true;   // trace enabled at runtime
+
+  struct Armed {
+    int id;
+    int handle;
+    uint64_t value;
+    uint64_t mask;
+  };
+  std::vector<Armed> armed;
+  std::vector<int> fired;
+  int armed_id = 0;
+
+  std::vector<std::shared_ptr<Bfm>> bfms;
+  bool changed = false;  // a bus functional model changed since last checked
+
+  // Condition program ops, the comparisons of a port with a value followed by
+  // the logical combinations of the two previous results
+  enum { EQ, NE, LT, LE, GT, GE, AND, OR };
+  std::vector<bool> stack;
+
+  // Evaluate a condition program against the posedge values
+  bool evaluate(const std::vector<std::tuple<int, int, uint64_t>> &program) {
+    stack.clear();
+
+    for (auto &instruction : program) {
+      const int op = std::get<0>(instruction);
+
+      if (op == AND || op == OR) {
+        const bool rhs = stack.back();
+        stack.pop_back();
+        stack.back() = op == AND ? stack.back() && rhs : stack.back() || rhs;
+        continue;
+      }
+
+      const int handle = std::get<1>(instruction);
+      const uint64_t value = std::get<2>(instruction);
+      update_id(dut, handle, snapshot.words.data());
+      const uint64_t port = snapshot.scalar(handle);
+
+      switch (op) {
+        case EQ:
+          stack.push_back(port == value);
+          break;
+        case NE:
+          stack.push_back(port != value);
+          break;
+        case LT:
+          stack.push_back(port < value);
+          break;
+        case LE:
+          stack.push_back(port <= value);
+          break;
+        case GT:
+          stack.push_back(port > value);
+          break;
+        default:
+          stack.push_back(port >= value);
+          break;
+      }
+    }
+
+    return !stack.empty() && stack.back();
+  }
+
+  // Check the armed conditions against the posedge values, moving those met
+  // to the fired list, returns whether any were met or a bus functional model
+  // changed
+  bool check() {
+    const bool woken = changed;
+    changed = false;
+
+    if (armed.empty()) {
+      return woken;
+    }
+
+    const std::size_t before = fired.size();
+    auto met = [this](const Armed &condition) {
+      update_id(dut, condition.handle, snapshot.words.data());
+
+      if ((snapshot.scalar(condition.handle) & condition.mask) !=
+          condition.value) {
+        return false;
+      }
+
+      fired.push_back(condition.id);
+      return true;
+    };
+    armed.erase(std::remove_if(armed.begin(), armed.end(), met), armed.end());
+
+    return fired.size() != before || woken;
+  }
+
+  void trace_open() {
+    wave = new Wave;
+    dut->trace(wave, 99);
+#ifdef TRACE_SCOPE
+    wave->dumpvars(99, TRACE_SCOPE);
+#endif
+
+    if (rotate_interval) {
+      char suffix[32];
+      snprintf(suffix, sizeof(suffix), "_%04llu",
+               static_cast<unsigned long long>(rotate_count++));
+      wave->open((trace_name + suffix + TRACE_EXT).c_str());
+    } else {
+      wave->open((trace_name + TRACE_EXT).c_str());
+    }
+  }
+
+  void trace_close() {
+    wave->close();
+    delete wave;
+    wave = nullptr;
+  }
+
+  void dump(const vluint64_t time) {
+    if (tracing && dumping && timestamp >= trace_start &&
+        timestamp < trace_stop) {
+      wave->dump(time);
+    }
+  }
+
+  void settle() {
+    timestamp++;
+
+    for (auto &bfm : bfms) {
+      bfm->drive(dut);
+    }
+
+    dut->eval();
+    dump(timestamp * 10 - 2);
+
+    for (auto &bfm : bfms) {
+      changed |= bfm->sample(dut, snapshot.words.data());
+    }
+  }
+
+  void toggle() {
+    dut->CLOCK = 1;
+    dut->eval();
+    dump(timestamp * 10);
+
+    dut->CLOCK = 0;
+    dut->eval();
+    dump(timestamp * 10 + 5);
+
+    if (tracing) {
+      if (rotate_interval && timestamp % rotate_interval == 0) {
+        trace_close();
+        trace_open();
+      } else if (flush_interval && timestamp % flush_interval == 0) {
+        wave->flush();
+      }
+    }
+  }
+};
+
+// Default instance wrapped by the module level functions, never destroyed so
+// that it outlives any interpreter shutdown ordering
+Simulator &simulator() {
+  static Simulator *instance = new Simulator;
+  return *instance;
+}
+
+// Default instance once initialised, as used by the module level functions
+// that act on the model
+Simulator &active() {
+  Simulator &instance = simulator();
+  if (!instance.running()) {
+    throw std::runtime_error("simulation not initialised, call init first");
+  }
+  return instance;
 }
 
 PYBIND11_MODULE(PACKAGE, m) {
   m.doc() = "Python interface for a Verilator Design Under Test (dut)";
 
-  m.def("init", &init, "Initialize DUT simulation", py::arg("trace") = true);
-  m.def("finish", &finish, "Finish DUT simulation");
-  m.def("prep", &prep, "Prepare input values to be sampled on next posedge");
-  m.def("tick", &tick,
-        "Advances the clock one cycle and returns the port list state as it "
-        "was on the posedge");
+  m.def(
+      "init",
+      [](const bool trace, const uint64_t flush, const uint64_t start,
+         const uint64_t stop, const uint64_t rotate, const std::string &name) {
+        simulator().init(trace, flush, start, stop, rotate, name);
+      },
+      "Initialize DUT simulation", py::arg("trace") = true,
+      py::arg("flush") = 0, py::arg("start") = 0,
+      py::arg("stop") = std::numeric_limits<uint64_t>::max(),
+      py::arg("rotate") = 0, py::arg("name") = "");
+  m.def(
+      "finish", []() { simulator().finish(); }, "Finish DUT simulation");
+  m.def(
+      "instance", []() -> Simulator & { return simulator(); },
+      py::return_value_policy::reference,
+      "The default simulation the module level functions act on");
+  m.def(
+      "flush", []() { simulator().flush(); },
+      "Flush the buffered trace to its file");
+  m.def(
+      "trace_on", []() { simulator().trace_on(); },
+      "Resume dumping the trace");
+  m.def(
+      "trace_off", []() { simulator().trace_off(); },
+      "Pause dumping the trace");
+  m.def(
+      "prep",
+      [](const std::string &port, const std::vector<uint64_t> &value) {
+        active().prep(port, value);
+      },
+      "Prepare input values to be sampled on next posedge");
+  m.def(
+      "prep_id",
+      [](const int handle, const std::vector<uint64_t> &value) {
+        active().prep_id(handle, value);
+      },
+      "Prepare input values, addressed by port handle, to be sampled on "
+      "next posedge");
+  m.def(
+      "prep_many",
+      [](const std::vector<std::pair<int, std::vector<uint64_t>>> &values) {
+        active().prep_many(values);
+      },
+      "Prepare a list of (port handle, value) pairs to be sampled on next "
+      "posedge");
+  m.def("port_id", &port_id,
+        "Returns the integer handle of the named port, -1 if not found");
+  m.def(
+      "attach",
+      [](std::shared_ptr<Bfm> bfm) { active().attach(std::move(bfm)); },
+      "Run a bus functional model natively with every cycle until detached");
+  m.def(
+      "detach", []() { active().detach(); },
+      "Detach every bus functional model");
+  m.def("ports", &port_list,
+        "Returns the port table as a list of (name, width, direction), "
+        "indexed by port handle");
+  m.def(
+      "tick", []() -> Snapshot & { return active().tick(); },
+      "Advances the clock one cycle and returns the port list state as it "
+      "was on the posedge",
+      py::return_value_policy::reference);
+  m.def(
+      "run",
+      [](const uint64_t cycles) -> Snapshot & {
+        return active().run(cycles);
+      },
+      "Advances the clock a number of cycles and returns the port list "
+      "state as it was on the last posedge",
+      py::arg("cycles"), py::return_value_policy::reference,
+      py::call_guard<py::gil_scoped_release>());
+  m.def(
+      "arm",
+      [](const int handle, const uint64_t value, const uint64_t mask) {
+        return active().arm(handle, value, mask);
+      },
+      "Arm a condition on a port of 64 bits or less, met on the first "
+      "posedge the port has the value under the mask, returning its id",
+      py::arg("handle"), py::arg("value"),
+      py::arg("mask") = std::numeric_limits<uint64_t>::max());
+  m.def(
+      "disarm", [](const int id) { active().disarm(id); },
+      "Disarm a condition that has not been met", py::arg("id"));
+  m.def(
+      "take_fired", []() { return active().take_fired(); },
+      "Returns the ids of the armed conditions met since last asked");
+  m.def(
+      "idle",
+      [](const uint64_t cycles) -> Snapshot & {
+        return active().idle(cycles);
+      },
+      "Advances the clock up to a number of cycles, stopping early after the "
+      "first posedge on which an armed condition is met, and returns the port "
+      "list state as it was on the last posedge",
+      py::arg("cycles"), py::return_value_policy::reference,
+      py::call_guard<py::gil_scoped_release>());
+  m.def(
+      "run_until",
+      [](const std::vector<std::tuple<int, int, uint64_t>> &program,
+         const uint64_t cycles) {
+        return active().run_until(program, cycles);
+      },
+      "Advances the clock up to a number of cycles, stopping after the first "
+      "posedge on which the condition, a reverse polish program of (op, port "
+      "handle, value), or an armed condition is met. Returns whether the "
+      "condition was met and the cycles run",
+      py::arg("program"), py::arg("cycles"));
+  m.def(
+      "snapshot", []() -> Snapshot & { return active().snapshot; },
+      "Returns the port list state as it was on the last posedge",
+      py::return_value_policy::reference);
+  m.def(
+      "checkpoint", []() { return active().checkpoint(); },
+      "Returns the state of the DUT and its clock counter as bytes, the "
+      "design must be created as savable");
+  m.def(
+      "restore",
+      [](const std::string &checkpoint) { active().restore(checkpoint); },
+      "Restores the state of the DUT and its clock counter from the bytes of "
+      "a checkpoint");
+  m.def(
+      "run_vectors",
+      [](const py::array_t<uint64_t, py::array::c_style |
+                                         py::array::forcecast> &inputs,
+         const std::vector<int> &in_handles,
+         const std::vector<int> &out_handles) {
+        return active().run_vectors(inputs, in_handles, out_handles);
+      },
+      "Applies each row of a (cycles x input ports) matrix before a posedge "
+      "and returns a (cycles x output ports) matrix of the values sampled "
+      "on each posedge",
+      py::arg("inputs"), py::arg("in_handles"), py::arg("out_handles"));
+
+  py::class_<Simulator>(m, "Simulator", py::module_local(),
+                        "Simulation of one instance of the DUT")
+      .def(py::init<>())
+      .def("init", &Simulator::init, "Initialize DUT simulation",
+           py::arg("trace") = true, py::arg("flush") = 0,
+           py::arg("start") = 0,
+           py::arg("stop") = std::numeric_limits<uint64_t>::max(),
+           py::arg("rotate") = 0, py::arg("name") = "")
+      .def("finish", &Simulator::finish, "Finish DUT simulation")
+      .def("flush", &Simulator::flush, "Flush the buffered trace to its file")
+      .def("trace_on", &Simulator::trace_on, "Resume dumping the trace")
+      .def("trace_off", &Simulator::trace_off, "Pause dumping the trace")
+      .def("trace_detach", &Simulator::trace_detach,
+           "Stop tracing without closing the trace file")
+      .def_property_readonly("cycles", &Simulator::cycles,
+                             "Number of clock cycles simulated since init")
+      .def("prep", &Simulator::prep,
+           "Prepare input values to be sampled on next posedge")
+      .def("prep_id", &Simulator::prep_id,
+           "Prepare input values, addressed by port handle, to be sampled on "
+           "next posedge")
+      .def("prep_many", &Simulator::prep_many,
+           "Prepare a list of (port handle, value) pairs to be sampled on "
+           "next posedge")
+      .def_static("port_id", &port_id,
+                  "Returns the integer handle of the named port, -1 if not "
+                  "found")
+      .def("attach", &Simulator::attach,
+           "Run a bus functional model natively with every cycle until "
+           "detached")
+      .def("detach", &Simulator::detach,
+           "Detach every bus functional model")
+      .def_static("ports", &port_list,
+                  "Returns the port table as a list of (name, width, "
+                  "direction), indexed by port handle")
+      .def("tick", &Simulator::tick,
+           "Advances the clock one cycle and returns the port list state as "
+           "it was on the posedge",
+           py::return_value_policy::reference_internal)
+      .def("run", &Simulator::run,
+           "Advances the clock a number of cycles and returns the port list "
+           "state as it was on the last posedge",
+           py::arg("cycles"), py::return_value_policy::reference_internal,
+           py::call_guard<py::gil_scoped_release>())
+      .def("arm", &Simulator::arm,
+           "Arm a condition on a port of 64 bits or less, met on the first "
+           "posedge the port has the value under the mask, returning its id",
+           py::arg("handle"), py::arg("value"),
+           py::arg("mask") = std::numeric_limits<uint64_t>::max())
+      .def("disarm", &Simulator::disarm,
+           "Disarm a condition that has not been met", py::arg("id"))
+      .def("take_fired", &Simulator::take_fired,
+           "Returns the ids of the armed conditions met since last asked")
+      .def("idle", &Simulator::idle,
+           "Advances the clock up to a number of cycles, stopping early after "
+           "the first posedge on which an armed condition is met, and returns "
+           "the port list state as it was on the last posedge",
+           py::arg("cycles"), py::return_value_policy::reference_internal,
+           py::call_guard<py::gil_scoped_release>())
+      .def("run_until", &Simulator::run_until,
+           "Advances the clock up to a number of cycles, stopping after the "
+           "first posedge on which the condition, a reverse polish program of "
+           "(op, port handle, value), or an armed condition is met. Returns "
+           "whether the condition was met and the cycles run",
+           py::arg("program"), py::arg("cycles"))
+      .def_readonly("snapshot", &Simulator::snapshot,
+                    "Port list state as it was on the last posedge")
+      .def("checkpoint", &Simulator::checkpoint,
+           "Returns the state of the DUT and its clock counter as bytes, the "
+           "design must be created as savable")
+      .def("restore", &Simulator::restore,
+           "Restores the state of the DUT and its clock counter from the "
+           "bytes of a checkpoint")
+      .def("run_vectors", &Simulator::run_vectors,
+           "Applies each row of a (cycles x input ports) matrix before a "
+           "posedge and returns a (cycles x output ports) matrix of the "
+           "values sampled on each posedge",
+           py::arg("inputs"), py::arg("in_handles"), py::arg("out_handles"));
+
+  py::class_<Snapshot>(m, "Snapshot", py::buffer_protocol(), py::module_local(),
+                       "Port list state, updated in place with every tick")
+      .def("__getitem__",
+           py::overload_cast<const std::string &>(&Snapshot::value, py::const_))
+      .def("__getitem__",
+           [](Snapshot &io, const int handle) { return io.value(handle); })
+      .def("__contains__",
+           [](const Snapshot &, const std::string &name) {
+             return port_id(name) >= 0;
+           })
+      .def("__len__", [](const Snapshot &) { return ports.size(); })
+      .def("__iter__",
+           [](const Snapshot &io) { return py::iter(io.keys()); })
+      .def("keys", &Snapshot::keys, "Returns the port names")
+      .def("copy", &Snapshot::copy,
+           "Returns the port list state as a dict that is not updated")
+      .def_buffer([](Snapshot &io) -> py::buffer_info {
+        return py::buffer_info(io.words.data(), sizeof(uint32_t),
+                               py::format_descriptor<uint32_t>::format(), 1,
+                               {io.words.size()}, {sizeof(uint32_t)});
+      });
+
+  py::class_<Packets, std::shared_ptr<Packets>>(
+      m, "Packets", py::module_local(),
+      "Queue of packets, each a list of beats, shared with a bus functional "
+      "model")
+      .def(py::init<>())
+      .def("append", &Packets::append, "Queue a packet")
+      .def("popleft", &Packets::popleft, "Remove and return the first packet")
+      .def("clear", &Packets::clear, "Remove every packet")
+      .def_readonly("beats", &Packets::beats,
+                    "Number of beats queued less those sent")
+      .def("__getitem__", &Packets::at)
+      .def("__len__", [](const Packets &queue) { return queue.packets.size(); })
+      .def("__bool__",
+           [](const Packets &queue) { return !queue.packets.empty(); })
+      .def(
+          "__iter__",
+          [](const Packets &queue) {
+            return py::make_iterator(queue.packets.begin(),
+                                     queue.packets.end());
+          },
+          py::keep_alive<0, 1>());
+
+  py::class_<Bfm, std::shared_ptr<Bfm>>(
+      m, "Bfm", py::module_local(),
+      "Bus functional model run natively with every cycle once attached");
+
+  py::class_<AxisSource, Bfm, std::shared_ptr<AxisSource>>(
+      m, "AxisSource", py::module_local(),
+      "AXIS source of concatenated streams sending the queued packets")
+      .def(py::init<const std::unordered_map<std::string, int> &, int, int>(),
+           py::arg("handles"), py::arg("width"), py::arg("concat"))
+      .def("queue", &AxisSource::queue, "Packets to send by a stream")
+      .def("pause", &AxisSource::pause, "Turn on/off the valid of a stream");
+
+  py::class_<AxisSink, Bfm, std::shared_ptr<AxisSink>>(
+      m, "AxisSink", py::module_local(),
+      "AXIS sink of concatenated streams queuing the received packets")
+      .def(py::init<const std::unordered_map<std::string, int> &, int, int>(),
+           py::arg("handles"), py::arg("width"), py::arg("concat"))
+      .def("queue", &AxisSink::queue, "Packets received by a stream")
+      .def("ready", &AxisSink::ready, "Turn on/off the ready of a stream")
+      .def("current", &AxisSink::current,
+           "Beats of the packet being received by a stream")
+      .def("set_current", &AxisSink::set_current,
+           "Set the beats of the packet being received by a stream");
+
+  py::class_<AximMemory, Bfm, std::shared_ptr<AximMemory>>(
+      m, "AximMemory", py::module_local(),
+      "AXI slave memory of beats held in pages allocated on demand")
+      .def(py::init<const std::unordered_map<std::string, int> &, int,
+                    std::size_t, std::size_t>(),
+           py::arg("handles"), py::arg("data_width"), py::arg("page_size"),
+           py::arg("depth"))
+      .def_property_readonly("idle", &AximMemory::idle,
+                             "No bursts are queued or in progress")
+      .def(
+          "read",
+          [](AximMemory &memory, const uint64_t index) {
+            std::vector<uint32_t> beat(memory.words);
+            if (!memory.read(index, beat.data())) {
+              throw py::key_error(std::to_string(index));
+            }
+            return beat;
+          },
+          "Words of the beat at an index")
+      .def(
+          "write",
+          [](AximMemory &memory, const uint64_t index,
+             std::vector<uint32_t> words) {
+            words.resize(memory.words);
+            memory.write(index, words.data());
+          },
+          "Set the words of the beat at an index")
+      .def(
+          "erase",
+          [](AximMemory &memory, const uint64_t index) {
+            std::vector<uint32_t> beat(memory.words);
+            if (!memory.read(index, beat.data())) {
+              throw py::key_error(std::to_string(index));
+            }
+            std::fill(beat.begin(), beat.end(), 0);
+            memory.write(index, beat.data());
+          },
+          "Zero the beat at an index")
+      .def(
+          "indices",
+          [](const AximMemory &memory) {
+            const uint64_t beats = memory.ram.size / memory.bytes;
+            std::vector<uint64_t> pages;
+            for (auto &page : memory.ram.pages) {
+              pages.push_back(page.first);
+            }
+            std::sort(pages.begin(), pages.end());
+
+            std::vector<uint64_t> indices;
+            indices.reserve(pages.size() * beats);
+            for (const uint64_t page : pages) {
+              for (uint64_t beat = 0; beat < beats; beat++) {
+                indices.push_back(page * beats + beat);
+              }
+            }
+            return indices;
+          },
+          "Indices of the beats of the allocated pages")
+      .def(
+          "load",
+          [](AximMemory &memory, const uint64_t address, py::buffer data) {
+            py::buffer_info info = data.request();
+            memory.ram.load(address, static_cast<const uint8_t *>(info.ptr),
+                            info.size * info.itemsize);
+          },
+          "Write bytes at a byte address")
+      .def(
+          "dump",
+          [](AximMemory &memory, const uint64_t address,
+             const std::size_t size) {
+            std::string data(size, '\0');
+            memory.ram.dump(address, reinterpret_cast<uint8_t *>(&data[0]),
+                            size);
+            return py::bytes(data);
+          },
+          "Bytes at a byte address, those of pages not allocated are zero")
+      .def(
+          "extents",
+          [](const AximMemory &memory) {
+            py::dict extents;
+            for (auto &page : memory.ram.pages) {
+              extents[py::int_(page.first * memory.ram.size)] = py::bytes(
+                  reinterpret_cast<const char *>(page.second.data()),
+                  page.second.size());
+            }
+            return extents;
+          },
+          "Bytes of each allocated page by byte address")
+      .def(
+          "clear", [](AximMemory &memory) { memory.ram.pages.clear(); },
+          "Free all pages")
+      .def("__len__", [](const AximMemory &memory) {
+        return memory.ram.pages.size() * (memory.ram.size / memory.bytes);
+      });
 }